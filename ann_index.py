@@ -0,0 +1,159 @@
+import os
+import time
+import hashlib
+import argparse
+from logging import getLogger, basicConfig, INFO
+from typing import List
+
+import faiss
+import numpy as np
+
+logger = getLogger(__name__)
+
+# 설정값(LINE_INDEX_TYPE 등)으로 고를 수 있는 인덱스 종류. 목록에 없는 값은 faiss factory 문자열로 그대로 사용합니다.
+INDEX_TYPES = {
+    "flat": "Flat",
+    "hnsw": "HNSW32",
+    "ivf": "IVF{nlist},Flat",
+    "ivf-sq8": "IVF{nlist},SQ8",
+    "ivf-pq": "IVF{nlist},PQ{m}",
+}
+
+INDEX_TYPE_SETTINGS = {"line": "LINE_INDEX_TYPE", "song": "SONG_INDEX_TYPE", "summary": "SUMMARY_INDEX_TYPE"}
+
+# 저장된 인덱스는 벡터 데이터를 복사하지 않고 memory-map 으로 읽습니다. (IndexFlatCodes 계열, faiss-cpu >= 1.10)
+# 인덱스 파일은 벡터를 따로 담고 있으므로 flat 라인 인덱스와 line_store/line_embeddings.npy 는 같은 벡터의 두 사본이고,
+# 둘 다 page cache 에 올라갑니다. (워커끼리는 공유)
+if hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+    READ_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+else:
+    READ_FLAGS = faiss.IO_FLAG_READ_ONLY
+    logger.warning(f"faiss {faiss.__version__} 에 IO_FLAG_MMAP_IFC 가 없어 인덱스를 워커마다 메모리에 복사해 읽습니다. (faiss-cpu >= 1.10 필요)")
+
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+
+def configured_index_type(name: str) -> str:
+    return os.getenv(INDEX_TYPE_SETTINGS[name], "flat")
+
+
+def index_settings() -> List[str]:
+    """검색 결과에 영향을 주는 인덱스 설정값. 쿼리 캐시 generation 에 들어갑니다."""
+    return [f"{setting}={configured_index_type(name)}" for name, setting in INDEX_TYPE_SETTINGS.items()] + \
+        [f"IVF_NPROBE={IVF_NPROBE}", f"HNSW_EF_SEARCH={HNSW_EF_SEARCH}"]
+
+
+def factory_string(index_type: str, num_vectors: int, dim: int) -> str:
+    template = INDEX_TYPES.get(index_type, index_type)
+    nlist = max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+    m = next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0)
+    return template.format(nlist=nlist, m=m)
+
+
+def _min_training_points(index: faiss.Index) -> int:
+    ivf = faiss.try_extract_index_ivf(index)
+    needed = 39 * ivf.nlist if ivf is not None else 0
+    if "PQ" in type(faiss.downcast_index(ivf if ivf is not None else index)).__name__:
+        needed = max(needed, 39 * 256)
+    return needed
+
+
+def configure(index: faiss.Index) -> faiss.Index:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = IVF_NPROBE
+    hnsw_index = faiss.downcast_index(index)
+    if hasattr(hnsw_index, 'hnsw'):
+        hnsw_index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+
+def build_index(embeddings: np.ndarray, index_type: str = "flat") -> faiss.Index:
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dim = embeddings.shape
+    index = faiss.index_factory(dim, factory_string(index_type, num_vectors, dim), faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        if num_vectors < _min_training_points(index):
+            logger.warning(f"학습 데이터 부족({num_vectors}개)으로 '{index_type}' 대신 flat 인덱스를 사용합니다.")
+            return build_index(embeddings, "flat")
+        index.train(embeddings)
+    index.add(embeddings)
+    return configure(index)
+
+
+def fingerprint(embeddings: np.ndarray) -> str:
+    digest = hashlib.sha1(str(embeddings.shape).encode())
+    digest.update(np.ascontiguousarray(embeddings, dtype='float32').data)
+    return digest.hexdigest()[:12]
+
+
+def load_or_build_index(name: str, embeddings: np.ndarray, index_type: str = "flat", index_dir: str = None) -> faiss.Index:
+    """index_dir 에 같은 임베딩으로 만든 인덱스가 있으면 읽고, 없으면 새로 만들어 저장합니다."""
+    if not index_dir:
+        return build_index(embeddings, index_type)
+
+    path = index_path(index_dir, name, embeddings, index_type)
+    if not os.path.exists(path):
+        save_index(build_index(embeddings, index_type), path)
+    return configure(faiss.read_index(path, READ_FLAGS))
+
+
+def index_path(index_dir: str, name: str, embeddings: np.ndarray, index_type: str) -> str:
+    slug = index_type.replace(',', '_').lower()
+    return os.path.join(index_dir, f"{name}-{slug}-{fingerprint(embeddings)}.faiss")
+
+
+def save_index(index: faiss.Index, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # 여러 워커가 같은 인덱스를 동시에 만들 수 있으므로 임시 파일 이름을 프로세스별로 나눕니다.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"인덱스 저장: {path}")
+
+
+def recall_report(embeddings: np.ndarray, index_types, k: int = 10, num_queries: int = 500, seed: int = 0):
+    """flat 인덱스의 결과를 정답으로 보고 인덱스 종류별 recall@k, 검색 지연, 빌드 시간을 측정합니다."""
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)]
+    k = min(k, len(embeddings))
+    _, truth = build_index(embeddings, "flat").search(queries, k)
+
+    rows = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(embeddings, index_type)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for q in queries:
+            index.search(q[None, :], k)
+        per_query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        _, found = index.search(queries, k)
+        recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        rows.append({"type": index_type, "index": type(faiss.downcast_index(index)).__name__, "recall": recall, "query_ms": per_query_ms, "build_s": build_s, "size_mb": size_mb})
+    return rows
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(description="인덱스 종류별 recall@k / 지연 시간 리포트")
+    parser.add_argument("--embeddings", nargs="+", default=["line_store/line_embeddings.npy", "song_embeddings.npy", "summary_embeddings.npy"])
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    for path in args.embeddings:
+        if not os.path.exists(path):
+            logger.warning(f"{path} 가 없어 건너뜁니다.")
+            continue
+        embeddings = np.load(path, mmap_mode='r')
+        print(f"\n{path} ({embeddings.shape[0]} x {embeddings.shape[1]})")
+        print(f"{'type':<12}{'index':<28}{'recall@' + str(args.k):>10}{'ms/query':>10}{'build s':>10}{'MB':>8}")
+        for row in recall_report(embeddings, args.types, args.k, args.queries):
+            print(f"{row['type']:<12}{row['index']:<28}{row['recall']:>10.3f}{row['query_ms']:>10.3f}{row['build_s']:>10.2f}{row['size_mb']:>8.1f}")
@@ -1,23 +1,30 @@
 import os
+import hmac
 import uvicorn
 import json
-import faiss
+import asyncio
 import numpy as np
-import openai
-from sentence_transformers import SentenceTransformer
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends, Response, Form
-from fastapi.responses import FileResponse, RedirectResponse, HTMLResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends, Response, Form, Body, Header
+from fastapi.responses import FileResponse, RedirectResponse, HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from logging import getLogger, basicConfig, INFO
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from functools import lru_cache
 from itsdangerous import URLSafeSerializer
 from pydantic import BaseModel, Field, AliasChoices
 from typing import List, Dict, Any
-from collections import defaultdict
-import ast
-from pydub import AudioSegment
-import io
+import time
+from encoder import BatchEncoder, MODEL_NAME
+from snapshot import SearchSnapshot, STORE_DIR, MANIFEST_FILE, current_paths, read_manifest
+from ann_index import index_settings
+from search import search_pipeline_from_text, search_pipeline_from_audio, batch_search, search_settings, PIPELINES
+from ingest import ingest_songs
+from query_cache import create_query_cache, MemoryBackend
+from stt import create_stt_backend
+from audio_ingest import read_upload, UploadLimitMiddleware
+from startup import StartupState, prepare_artifacts
+from metrics import (REGISTRY, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, Counter, Gauge, SlowRequestProfiler,
+                     span, start_trace, end_trace, current_trace, stage_totals, server_timing)
 
 basicConfig(level=INFO)
 logger = getLogger(__name__)
@@ -32,6 +39,10 @@ class PlaylistSongRequest(BaseModel):
 class PlaylistDetailsRequest(BaseModel):
     songs: List[PlaylistSongRequest]
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    mode: str = Field("text", description="'text' (/text-search 와 같은 파이프라인) 또는 'audio' (/stt)")
+
 class PlaylistCreationRequest(BaseModel):
     songIds: List[str] = Field(..., validation_alias=AliasChoices('songIds', 'song_ids'))
     title: str = Field(..., description="The title for the new playlist.")
@@ -41,50 +52,66 @@ class PlaylistCreationRequest(BaseModel):
 SECRET_KEY = os.getenv("APP_SECRET_KEY", "a_default_secret_key_for_local_testing")
 serializer = URLSafeSerializer(SECRET_KEY)
 SESSION_COOKIE_NAME = "spotify-session"
-
-logger.info("서버 시작... 모델 및 데이터베이스를 로드합니다.")
-embedder = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-try:
-    with open('line_metadata.json', 'r', encoding='utf-8') as f:
-        line_metadata = json.load(f)
-    with open('song_metadata.json', 'r', encoding='utf-8') as f:
-        song_metadata = json.load(f)
-    
-    line_embeddings = np.load('line_embeddings.npy')
-    song_embeddings = np.load('song_embeddings.npy')
-    summary_embeddings = np.load('summary_embeddings.npy')
-
-    line_index = faiss.IndexFlatIP(line_embeddings.shape[1])
-    line_index.add(line_embeddings)
-    
-    song_index = faiss.IndexFlatIP(song_embeddings.shape[1])
-    song_index.add(song_embeddings)
-    
-    summary_index = faiss.IndexFlatIP(summary_embeddings.shape[1])
-    summary_index.add(summary_embeddings)
-
-    lines_by_song_idx = defaultdict(list)
-    for i, meta in enumerate(line_metadata):
-        lines_by_song_idx[meta['original_song_index']].append(i)
-
-    logger.info(f"DB 로드 완료. {len(song_metadata)}곡, {len(line_metadata)}개의 라인, {len(summary_embeddings)}개의 요약문이 준비되었습니다.")
-
-except Exception as e:
-    logger.error(f"DB 로딩 실패: {e}", exc_info=True)
-    line_index, song_index, summary_index = None, None, None
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+STORE_RELOAD_INTERVAL = float(os.getenv("STORE_RELOAD_INTERVAL", "30"))
+BATCH_SEARCH_MAX_QUERIES = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", "10000"))
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_MS", "2000")) / 1000.0
+# 쿠키에서 복원한 토큰 정보와 사용자 프로필을 잠깐 보관해 요청마다 역직렬화 / sp.me() 를 반복하지 않습니다.
+session_cache = MemoryBackend(max_entries=10000, ttl=float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300")))
+
+# 모델과 검색 데이터는 import 시점이 아니라 서버 시작 후 백그라운드 스레드에서 로드합니다. (GET /ready 로 확인)
+startup = StartupState()
+query_encoder = BatchEncoder(
+    None,
+    max_batch_size=int(os.getenv("ENCODER_MAX_BATCH_SIZE", "32")),
+    max_wait_ms=float(os.getenv("ENCODER_BATCH_WINDOW_MS", "8")))
+search_snapshot = None
+
+query_cache = create_query_cache(current_paths().watch_paths() + [os.path.join(STORE_DIR, MANIFEST_FILE)], index_settings() + search_settings(),
+                                 [f"MODEL_NAME={MODEL_NAME}"])
 
 REDIRECT_URI = os.getenv("SPOTIPY_REDIRECT_URI", "http://localhost:7860/callback")
-sp_oauth = SpotifyOAuth(
-    client_id=os.getenv("SPOTIPY_CLIENT_ID"),
-    client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
-    redirect_uri=REDIRECT_URI,
-    scope="streaming user-read-private user-read-email user-read-playback-state user-modify-playback-state user-read-currently-playing playlist-modify-public playlist-modify-private")
 
-api_key = os.getenv("openai")
-client = openai.OpenAI(api_key=api_key) if api_key else None
+@lru_cache(maxsize=None)
+def get_spotify():
+    from clients import SpotifyClient
+    return SpotifyClient(os.getenv("SPOTIPY_CLIENT_ID"), os.getenv("SPOTIPY_CLIENT_SECRET"), REDIRECT_URI)
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """STT 백엔드가 워커 스레드에서 쓰는 동기 클라이언트."""
+    from clients import create_openai_client
+    return create_openai_client()
+
+@lru_cache(maxsize=None)
+def get_async_openai_client():
+    from clients import create_openai_client
+    return create_openai_client(async_client=True)
+
+@lru_cache(maxsize=None)
+def get_stt_backend():
+    return create_stt_backend(get_openai_client())
+
+def load_model():
+    from sentence_transformers import SentenceTransformer
+    query_encoder.model = SentenceTransformer(MODEL_NAME)
+
+def load_search_snapshot():
+    global search_snapshot
+    search_snapshot = SearchSnapshot.load(current_paths())
+
+def warm_up():
+    """첫 요청이 모델 초기화와 memory-map 페이지 읽기 비용을 떠안지 않도록 한 번 검색해 둡니다."""
+    query_vector = query_encoder.encode_now(["warm up"])
+    search_pipeline_from_text(search_snapshot, "warm up", query_vector)
+
+STARTUP_STEPS = [("model", load_model), ("snapshot", load_search_snapshot), ("warmup", warm_up)]
 
 app = FastAPI()
+profiler = SlowRequestProfiler.from_env()
 
+# 먼저 등록한 미들웨어가 안쪽에 놓이므로 413 응답에도 CORS 헤더가 붙습니다.
+app.add_middleware(UploadLimitMiddleware, paths={"/stt"})
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:4200", "http://localhost:5173", "http://127.0.0.1:4200", "http://127.0.0.1:5173"],
@@ -93,223 +120,193 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def parse_tags(tags_str: str) -> List[str]:
-    if not isinstance(tags_str, str) or not tags_str.startswith('['):
-        return []
+@lru_cache(maxsize=None)
+def route_paths():
+    return {route.path for route in app.routes}
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """요청별 trace 를 열고, 지연 시간 / 처리 중 요청 수를 기록하고, 구간별 시간을 Server-Timing 헤더로 돌려줍니다."""
+    route = request.url.path if request.url.path in route_paths() else "other"
+    trace, token = start_trace()
+    sampler = profiler.start() if profiler else None
+    REQUESTS_IN_FLIGHT.inc(route)
+    start = time.perf_counter()
+    status = 500
     try:
-        return ast.literal_eval(tags_str)
-    except (ValueError, SyntaxError):
-        return []
-
-def search_pipeline_from_text(query_text: str) -> (Dict[str, Any], str, List[Dict[str, Any]]):
-    if song_index is None:
-        return None, "", []
-    
-    query_vector = embedder.encode([query_text]).astype('float32')
-    faiss.normalize_L2(query_vector)
-
-    D_summary, I_summary = summary_index.search(query_vector, 1)
-    D_lyric, I_lyric = line_index.search(query_vector, 1)
-    
-    identified_song_idx = -1
-    matched_lyric = ""
-    
-    summary_score = D_summary[0][0] if D_summary.size > 0 else 0
-    lyric_score = D_lyric[0][0] if D_lyric.size > 0 else 0
-
-    if summary_score > 0.4 or lyric_score > 0.4:
-        if summary_score > lyric_score:
-            identified_song_idx = line_metadata[I_summary[0][0]]['original_song_index']
-            matched_lyric = song_metadata[identified_song_idx].get('summary', 'N/A')
-        else:
-            identified_song_idx = line_metadata[I_lyric[0][0]]['original_song_index']
-            matched_lyric = line_metadata[I_lyric[0][0]]['line_text']
-    else:
-        return None, "", []
-
-    raw_identified_song = song_metadata[identified_song_idx]
-    identified_song = {
-        "songId": raw_identified_song.get('spotify_id'),
-        "songTitle": raw_identified_song.get('title'),
-        "artist": raw_identified_song.get('artist'),
-        "albumCoverUrl": raw_identified_song.get('album_cover_url'),
-        "tagName": parse_tags(raw_identified_song.get('tags_normalized', '[]')),
-        "songDescription": raw_identified_song.get('summary', 'N/A'),
-        "userQuery": query_text
-    }
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        seconds = time.perf_counter() - start
+        REQUESTS_IN_FLIGHT.dec(route)
+        REQUEST_SECONDS.observe(route, request.method, str(status), value=seconds)
+        end_trace(token)
+        if profiler:
+            await run_in_threadpool(profiler.finish, sampler, route, seconds)
+        if seconds >= SLOW_REQUEST_SECONDS:
+            logger.warning(f"느린 요청 {request.method} {route} {status} {seconds * 1000:.0f}ms: "
+                           + " ".join(f"{stage}={ms * 1000:.1f}ms" for stage, ms in stage_totals(trace).items()))
+    if trace:
+        response.headers["Server-Timing"] = server_timing(trace)
+    return response
 
-    song_vector = song_embeddings[identified_song_idx:identified_song_idx+1]
-    
-    candidate_scores = defaultdict(float)
-    recommendation_reasons = defaultdict(list)
-
-    D_song, I_song = song_index.search(song_vector, 10)
-    for i, idx in enumerate(I_song[0]):
-        candidate_scores[idx] += D_song[0][i] * 0.5
-        recommendation_reasons[idx].append("분위기와 장르가 비슷해요.")
-
-    summary_vector = summary_embeddings[identified_song_idx:identified_song_idx+1]
-    D_summary, I_summary = summary_index.search(summary_vector, 10)
-    for i, idx in enumerate(I_summary[0]):
-        candidate_scores[idx] += D_summary[0][i] * 0.3
-        recommendation_reasons[idx].append("곡의 전반적인 감성이 비슷해요.")
-
-    original_tags = set(identified_song['tagName'])
-    for idx in list(candidate_scores.keys()):
-        candidate_tags = set(parse_tags(song_metadata[idx].get('tags_normalized', '[]')))
-        if original_tags.intersection(candidate_tags):
-            candidate_scores[idx] += 0.2
-            recommendation_reasons[idx].append(f"비슷한 태그({', '.join(original_tags.intersection(candidate_tags))})를 공유해요.")
-    
-    sorted_candidates = sorted(candidate_scores.items(), key=lambda item: item[1], reverse=True)
-
-    similar_songs = []
-    seen_song_ids = {identified_song_idx}
-    seen_artist_ids = {identified_song['artist']}
-
-    for idx, score in sorted_candidates:
-        if idx in seen_song_ids or song_metadata[idx].get('artist') in seen_artist_ids:
-            continue
-        if len(similar_songs) >= 3:
-            break
-        
-        song_info = song_metadata[idx]
-        reasons_text = ", ".join(list(set(recommendation_reasons.get(idx, []))))
-
-        similar_songs.append({
-            "songId": song_info.get('spotify_id'),
-            "songTitle": song_info['title'],
-            "artist": song_info['artist'],
-            "albumCoverUrl": song_info.get('album_cover_url'),
-            "tagName": parse_tags(song_info.get('tags_normalized', '[]')),
-            "songDescription": song_info.get('summary', 'N/A'),
-            "matchLine": "", # No direct match line for text search recommendations
-            "recommendationReason": reasons_text
-        })
-        seen_song_ids.add(idx)
-        seen_artist_ids.add(song_info.get('artist'))
-
-    return identified_song, matched_lyric, similar_songs
-
-
-def search_pipeline_from_audio(query_text: str) -> (Dict[str, Any], str, List[Dict[str, Any]]):
-    if line_index is None:
-        return None, "", []
-
-    query_vector = embedder.encode([query_text]).astype('float32')
-    faiss.normalize_L2(query_vector)
-
-    D, I = line_index.search(query_vector, 1)
-    if not I.size: return None, "", []
-    
-    matched_line_idx = I[0][0]
-    best_match_line_info = line_metadata[matched_line_idx]
-    identified_song_idx = best_match_line_info['original_song_index']
-    matched_lyric = best_match_line_info['line_text']
-
-    raw_identified_song = song_metadata[identified_song_idx]
-    identified_song = {
-        "songId": raw_identified_song.get('spotify_id'),
-        "songTitle": raw_identified_song.get('title'),
-        "artist": raw_identified_song.get('artist'),
-        "albumCoverUrl": raw_identified_song.get('album_cover_url'),
-        "tagName": parse_tags(raw_identified_song.get('tags_normalized', '[]')),
-        "songDescription": raw_identified_song.get('summary', 'N/A'),
-        "userQuery": query_text
+def collect_service_metrics():
+    """/metrics 를 읽을 때마다 준비 상태, 인덱스 크기, 캐시 / 인코더 상태를 새로 읽습니다."""
+    ready = Gauge("ready", "1 when the model and search data are loaded.")
+    ready.set(value=1 if startup.ready else 0)
+    startup_phases = Gauge("startup_phase_seconds", "Duration of each startup phase.", ["phase"])
+    for phase, ms in startup.phases.items():
+        startup_phases.set(phase, value=ms / 1000.0)
+    encoder_queue = Gauge("encoder_queue_depth", "Queries waiting for the batch encoder.")
+    encoder_queue.set(value=query_encoder.queue_depth())
+    metrics = [ready, startup_phases, encoder_queue]
+
+    snapshot = search_snapshot
+    if snapshot is not None:
+        index_vectors = Gauge("index_vectors", "Vectors in each FAISS index of the active snapshot.", ["index", "version"])
+        for name in ("line", "song", "summary"):
+            index_vectors.set(name, snapshot.version, value=getattr(snapshot, f"{name}_index").ntotal)
+        catalog_songs = Gauge("catalog_songs", "Songs in the active snapshot.", ["version"])
+        catalog_songs.set(snapshot.version, value=len(snapshot.catalog))
+        metrics += [index_vectors, catalog_songs]
+
+    if query_cache:
+        stats = query_cache.stats()
+        entries = Gauge("query_cache_entries", "Entries in the query cache.", ["backend"])
+        entries.set(stats["backend"], value=stats["entries"])
+        metrics.append(entries)
+        for key in ("hits", "misses"):
+            counter = Counter(f"query_cache_{key}_total", f"Query cache {key}.", ["backend", "layer"])
+            for layer, count in stats[key].items():
+                counter.inc(stats["backend"], layer, amount=count)
+            metrics.append(counter)
+        evictions = Counter("query_cache_evictions_total", "Query cache evictions.", ["backend"])
+        evictions.inc(stats["backend"], amount=stats["evictions"])
+        metrics.append(evictions)
+    return metrics
+
+REGISTRY.add_collector(collect_service_metrics)
+
+def require_ready():
+    if not startup.ready:
+        raise HTTPException(status_code=503, detail="서버가 아직 준비 중입니다.", headers={"Retry-After": "5"})
+
+# 쿼리 캐시 조회 / 저장은 pickle, SQLite 잠금 대기, generation 확인용 파일 stat 을 하므로 이벤트 루프 밖에서 실행합니다.
+async def encode_query(query_text: str) -> np.ndarray:
+    query_vector = await run_in_threadpool(query_cache.get_embedding, query_text) if query_cache else None
+    if query_vector is None:
+        with span("encode"):
+            query_vector = await query_encoder.encode(query_text)
+        if query_cache: await run_in_threadpool(query_cache.set_embedding, query_text, query_vector)
+    return query_vector
+
+async def cached_search(namespace: str, pipeline, query_text: str) -> Dict[str, Any]:
+    require_ready()
+    # 요청 시작 시점의 스냅샷을 끝까지 사용합니다. (도중에 새 버전으로 교체되어도 안전)
+    snapshot = search_snapshot
+    if snapshot is None:
+        return {"song": None, "lyrics": "", "recommendations": []}
+    # 캐시는 manifest 변경을 스냅샷 교체(STORE_RELOAD_INTERVAL)보다 먼저 알아챌 수 있으므로, 결과는 그 결과를 만든
+    # 스냅샷 버전으로 따로 저장합니다. 그래야 이전 스냅샷의 결과가 새 generation 에 섞여 TTL 동안 남지 않습니다.
+    namespace = f"{namespace}@{snapshot.version}"
+    payload = await run_in_threadpool(query_cache.get, namespace, query_text) if query_cache else None
+    if payload is not None:
+        if payload["song"]: payload["song"]["userQuery"] = query_text
+        return payload
+
+    query_vector = await encode_query(query_text)
+    identified_song, matched_lyric, similar_songs = await run_in_threadpool(pipeline, snapshot, query_text, query_vector)
+    payload = {
+        "song": identified_song,
+        "lyrics": matched_lyric,
+        "recommendations": similar_songs
     }
-    
-    num_words = len(query_text.split())
-    weight_song, weight_summary, weight_lyric = (0.5, 0.1, 0.4) if num_words > 5 else (0.6, 0.2, 0.2)
-
-    identified_lyric_vector = line_embeddings[matched_line_idx:matched_line_idx+1]
-    song_vector = song_embeddings[identified_song_idx:identified_song_idx+1]
-    summary_vector = summary_embeddings[identified_song_idx:identified_song_idx+1]
-
-    candidate_scores = defaultdict(float)
-    recommendation_reasons = defaultdict(list)
-
-    D_song, I_song = song_index.search(song_vector, 10)
-    for i, idx in enumerate(I_song[0]):
-        candidate_scores[idx] += D_song[0][i] * weight_song
-        recommendation_reasons[idx].append("분위기와 장르가 비슷해요.")
-
-    D_summary, I_summary = summary_index.search(summary_vector, 10)
-    for i, idx in enumerate(I_summary[0]):
-        candidate_scores[idx] += D_summary[0][i] * weight_summary
-        recommendation_reasons[idx].append("곡의 전반적인 감성이 비슷해요.")
-
-    D_lyric, I_lyric = line_index.search(identified_lyric_vector, 50)
-    for i, line_idx in enumerate(I_lyric[0]):
-        song_idx = line_metadata[line_idx]['original_song_index']
-        if song_idx == identified_song_idx: continue
-        candidate_scores[song_idx] += D_lyric[0][i] * weight_lyric
-        recommendation_reasons[song_idx].append("가사가 비슷한 느낌을 줘요.")
-
-    original_tags = set(identified_song['tagName'])
-    for idx in list(candidate_scores.keys()):
-        candidate_tags = set(parse_tags(song_metadata[idx].get('tags_normalized', '[]')))
-        if original_tags.intersection(candidate_tags):
-            candidate_scores[idx] += 0.1
-            recommendation_reasons[idx].append(f"비슷한 태그({', '.join(original_tags.intersection(candidate_tags))})를 공유해요.")
-
-    for i, idx in enumerate(I_song[0]): candidate_scores[idx] += (10 - i) * 0.005
-    for i, idx in enumerate(I_summary[0]): candidate_scores[idx] += (10 - i) * 0.003
-    for i, line_idx in enumerate(I_lyric[0]):
-        song_idx = line_metadata[line_idx]['original_song_index']
-        candidate_scores[song_idx] += (50 - i) * 0.001
-
-    sorted_candidates = sorted(candidate_scores.items(), key=lambda item: item[1], reverse=True)
-    
-    similar_songs = []
-    seen_song_ids = {identified_song_idx}
-    seen_artist_ids = {identified_song['artist']}
-
-    for idx, score in sorted_candidates:
-        if idx in seen_song_ids or song_metadata[idx].get('artist') in seen_artist_ids:
+    if query_cache: await run_in_threadpool(query_cache.set, namespace, query_text, payload)
+    return payload
+
+def reload_snapshot() -> bool:
+    """manifest 의 현재 버전이 바뀌었으면 새 스냅샷을 읽어 교체합니다."""
+    global search_snapshot
+    manifest = read_manifest()
+    if manifest is None or (search_snapshot is not None and search_snapshot.version == manifest['current']):
+        return False
+    new_snapshot = SearchSnapshot.load(current_paths())
+    search_snapshot = new_snapshot
+    logger.info(f"검색 스냅샷 교체: {new_snapshot.version}")
+    return True
+
+async def watch_store_manifest():
+    while True:
+        await asyncio.sleep(STORE_RELOAD_INTERVAL)
+        if not startup.ready:
             continue
-        
-        if len(similar_songs) >= 3:
-            break
-        
-        song_info = song_metadata[idx]
-        recommended_lyric_snippet = "추천 근거 가사를 찾을 수 없습니다."
-        
-        candidate_line_indices = lines_by_song_idx.get(idx, [])
-        if candidate_line_indices:
-            candidate_vectors = line_embeddings[candidate_line_indices]
-            similarities = np.dot(candidate_vectors, identified_lyric_vector.T).flatten()
-            best_match_in_song_idx = similarities.argmax()
-            original_line_idx = candidate_line_indices[best_match_in_song_idx]
-            recommended_lyric_snippet = line_metadata[original_line_idx]['line_text']
-        
-        reasons_text = ", ".join(list(set(recommendation_reasons.get(idx, []))))
-
-        similar_songs.append({
-            "songId": song_info.get('spotify_id'),
-            "songTitle": song_info['title'],
-            "artist": song_info['artist'],
-            "albumCoverUrl": song_info.get('album_cover_url'),
-            "tagName": parse_tags(song_info.get('tags_normalized', '[]')),
-            "songDescription": song_info.get('summary', 'N/A'),
-            "matchLine": recommended_lyric_snippet,
-            "recommendationReason": reasons_text
-        })
-        seen_song_ids.add(idx)
-        seen_artist_ids.add(song_info.get('artist'))
-
-    return identified_song, matched_lyric, similar_songs
+        try:
+            await run_in_threadpool(reload_snapshot)
+        except Exception as e:
+            logger.error(f"스냅샷 교체 실패: {e}", exc_info=True)
+
+@app.on_event("shutdown")
+async def close_clients():
+    if get_spotify.cache_info().currsize:
+        await get_spotify().aclose()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    startup.start(STARTUP_STEPS)
+    if STORE_RELOAD_INTERVAL > 0:
+        asyncio.create_task(watch_store_manifest())
+
+def load_session(encrypted_token_info: str) -> Dict[str, Any]:
+    token_info, _ = session_cache.get(f"token:{encrypted_token_info}")
+    if token_info is None:
+        token_info = serializer.loads(encrypted_token_info)
+        session_cache.set(f"token:{encrypted_token_info}", token_info)
+    return token_info
+
+async def refreshed_session(token_info: Dict[str, Any], response: Response) -> Dict[str, Any]:
+    """토큰이 곧 만료되면 갱신하고 새 쿠키를 내려보냅니다."""
+    if not get_spotify().is_token_expired(token_info):
+        return token_info
+    token_info = await get_spotify().refresh(token_info)
+    encrypted_token_info = serializer.dumps(token_info)
+    session_cache.set(f"token:{encrypted_token_info}", token_info)
+    response.set_cookie(key=SESSION_COOKIE_NAME, value=encrypted_token_info, httponly=True, samesite="lax", secure=True)
+    return token_info
+
+async def user_profile(access_token: str) -> Dict[str, Any]:
+    profile, _ = session_cache.get(f"profile:{access_token}")
+    if profile is None:
+        profile = await get_spotify().me(access_token)
+        session_cache.set(f"profile:{access_token}", profile)
+    return profile
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
 
 @app.get("/")
 def read_root(): return {"message": "API is running."}
 
+@app.get("/ready")
+def ready():
+    report = startup.report()
+    report["version"] = search_snapshot.version if search_snapshot else None
+    return Response(content=json.dumps(report, ensure_ascii=False), status_code=200 if startup.ready else 503, media_type="application/json")
+
+@app.get("/metrics")
+def metrics(): return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache-stats")
+def cache_stats(): return query_cache.stats() if query_cache else {"backend": None}
+
 @app.get("/login")
 def login():
-    auth_url = sp_oauth.get_authorize_url()
+    auth_url = get_spotify().authorize_url()
     return RedirectResponse(auth_url)
 
 @app.get("/callback", response_class=HTMLResponse)
-def callback(request: Request, code: str):
-    token_info = sp_oauth.get_access_token(code, check_cache=False)
+async def callback(request: Request, code: str):
+    token_info = await get_spotify().exchange_code(code)
     encrypted_token_info = serializer.dumps(token_info)
     response = Response(content=f"""
     <script>
@@ -322,29 +319,24 @@ def callback(request: Request, code: str):
     return response
 
 @app.get("/access-token")
-def get_access_token(request: Request, response: Response):
+async def get_access_token(request: Request, response: Response):
     encrypted_token_info = request.cookies.get(SESSION_COOKIE_NAME)
     if not encrypted_token_info: raise HTTPException(status_code=403, detail="Not logged in")
     try:
-        token_info = serializer.loads(encrypted_token_info)
-        if sp_oauth.is_token_expired(token_info):
-            token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
-            encrypted_token_info = serializer.dumps(token_info)
-            response.set_cookie(key=SESSION_COOKIE_NAME, value=encrypted_token_info, httponly=True, samesite="lax", secure=True)
+        token_info = await refreshed_session(load_session(encrypted_token_info), response)
         return {"accessToken": token_info['access_token']}
     except Exception as e:
         logger.error(f"Failed to get access token: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to retrieve access token.")
 
 @app.get("/me")
-def get_me(request: Request):
+async def get_me(request: Request):
     encrypted_token_info = request.cookies.get(SESSION_COOKIE_NAME)
     if not encrypted_token_info: return {"loggedIn": False}
     try:
-        token_info = serializer.loads(encrypted_token_info)
-        if sp_oauth.is_token_expired(token_info): raise Exception("Token expired")
-        sp = spotipy.Spotify(auth=token_info['access_token'])
-        user = sp.me()
+        token_info = load_session(encrypted_token_info)
+        if get_spotify().is_token_expired(token_info): raise Exception("Token expired")
+        user = await user_profile(token_info['access_token'])
         return {"loggedIn": True, "user": user}
     except Exception:
         return {"loggedIn": False}
@@ -352,26 +344,27 @@ def get_me(request: Request):
 @app.post("/stt")
 async def speech_to_text_and_search(audio_file: UploadFile = File(...)):
     try:
-        audio_bytes = await audio_file.read()
-        audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-        if (len(audio) / 1000.0) < 5.0:
+        with span("upload"):
+            audio = await read_upload(audio_file)
+
+        with span("decode"):
+            duration = audio.duration if audio.duration is not None else await run_in_threadpool(audio.ensure_duration)
+        if duration < 5.0:
             raise HTTPException(status_code=400, detail="오디오 파일은 최소 5초 이상이어야 합니다.")
-        transcript = client.audio.transcriptions.create(model="whisper-1", file=(audio_file.filename, audio_bytes, audio_file.content_type))
-        transcribed_text = transcript.text
+
+        with span("transcription"):
+            transcribed_text = await get_stt_backend().transcribe_async(audio)
         if not transcribed_text.strip():
             raise HTTPException(status_code=400, detail="음성을 인식하지 못했습니다.")
         
-        identified_song, matched_lyric, similar_songs = search_pipeline_from_audio(transcribed_text)
-        
-        return {
-            "song": identified_song,
-            "lyrics": matched_lyric, 
-            "recommendations": similar_songs
-        }
+        with span("search"):
+            return await cached_search("audio", search_pipeline_from_audio, transcribed_text)
     except Exception as e:
         logger.error(f"API 처리 중 에러 발생: {e}", exc_info=True)
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        logger.info(f"/stt [{get_stt_backend().name}] " + " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stage_totals(current_trace()).items()))
 
 @app.post("/text-search")
 async def text_to_search(query_text: str = Form(...)):
@@ -379,18 +372,43 @@ async def text_to_search(query_text: str = Form(...)):
         if not query_text.strip():
             raise HTTPException(status_code=400, detail="검색어를 입력해주세요.")
         
-        identified_song, matched_lyric, similar_songs = search_pipeline_from_text(query_text)
-
-        return {
-            "song": identified_song,
-            "lyrics": matched_lyric,
-            "recommendations": similar_songs
-        }
+        return await cached_search("text", search_pipeline_from_text, query_text)
     except Exception as e:
         logger.error(f"API 처리 중 에러 발생: {e}", exc_info=True)
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/batch-search", dependencies=[Depends(require_admin)])
+async def batch_text_search(request_data: BatchSearchRequest):
+    """쿼리 목록을 묶어서 인코딩/검색하고 결과를 한 줄에 하나씩 NDJSON 으로 보냅니다. (쿼리 캐시는 사용하지 않습니다)"""
+    require_ready()
+    if request_data.mode not in PIPELINES:
+        raise HTTPException(status_code=400, detail=f"mode 는 {', '.join(sorted(PIPELINES))} 중 하나여야 합니다.")
+    if len(request_data.queries) > BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"한 번에 최대 {BATCH_SEARCH_MAX_QUERIES}개의 쿼리를 검색할 수 있습니다.")
+
+    # 배치 전체가 같은 스냅샷을 사용합니다. 동기 제너레이터는 Starlette 가 스레드풀에서 순회합니다.
+    rows = batch_search(search_snapshot, query_encoder.encode_bulk, request_data.queries, request_data.mode)
+    return StreamingResponse((json.dumps(row, ensure_ascii=False) + "\n" for row in rows), media_type="application/x-ndjson")
+
+@app.post("/admin/ingest", dependencies=[Depends(require_admin)])
+async def admin_ingest(songs: List[Dict[str, Any]] = Body(...)):
+    require_ready()
+    try:
+        result = await run_in_threadpool(ingest_songs, songs, query_encoder.encode_bulk, STORE_DIR, search_snapshot)
+        if result["version"]:
+            await run_in_threadpool(reload_snapshot)
+        return result
+    except Exception as e:
+        logger.error(f"Ingestion failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def admin_reload():
+    require_ready()
+    reloaded = await run_in_threadpool(reload_snapshot)
+    return {"reloaded": reloaded, "version": search_snapshot.version if search_snapshot else None}
+
 @app.post("/generate-playlist-details")
 async def generate_playlist_details(request_data: PlaylistDetailsRequest):
     try:
@@ -410,11 +428,15 @@ async def generate_playlist_details(request_data: PlaylistDetailsRequest):
         {songs_info}
         """
         
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
+        client = get_async_openai_client()
+        if client is None:
+            raise RuntimeError("OpenAI API 키가 설정되지 않았습니다.")
+        with span("openai_chat"):
+            response = await client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                response_format={"type": "json_object"}
+            )
         content = response.choices[0].message.content
         return json.loads(content)
     except Exception as e:
@@ -426,27 +448,31 @@ async def create_playlist(request: Request, playlist_data: PlaylistCreationReque
     encrypted_token_info = request.cookies.get(SESSION_COOKIE_NAME)
     if not encrypted_token_info: raise HTTPException(status_code=403, detail="Not logged in")
     try:
-        token_info = serializer.loads(encrypted_token_info)
-        if sp_oauth.is_token_expired(token_info):
-            token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
-            encrypted_token_info = serializer.dumps(token_info)
-            response.set_cookie(key=SESSION_COOKIE_NAME, value=encrypted_token_info, httponly=True, samesite="lax", secure=True)
-        sp = spotipy.Spotify(auth=token_info['access_token'])
+        token_info = await refreshed_session(load_session(encrypted_token_info), response)
+        access_token = token_info['access_token']
         song_ids = playlist_data.songIds
         if not song_ids: raise HTTPException(status_code=400, detail="No valid Spotify Track IDs found.")
-        user_id = sp.me()['id']
-        playlist = sp.user_playlist_create(
+        user_id = (await user_profile(access_token))['id']
+        playlist = await get_spotify().create_playlist(
+            access_token,
             user_id, 
             playlist_data.title, 
-            public=True, 
-            description=playlist_data.description
+            playlist_data.description,
+            public=True
         )
-        sp.playlist_add_items(playlist['id'], song_ids)
+        await get_spotify().add_items(access_token, playlist['id'], song_ids)
         return {"playlistId": playlist['id']}
     except Exception as e:
         logger.error(f"Playlist creation failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to create playlist.")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=7860)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        # 파생 데이터는 여기서 한 번만 만들고, 워커들은 같은 파일을 memory-map 으로 붙여 페이지 캐시를 공유합니다.
+        prepare_artifacts(current_paths())
+        os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+        uvicorn.run("app:app", host="0.0.0.0", port=7860, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=7860)
 
@@ -0,0 +1,209 @@
+import io
+import os
+import wave
+import struct
+import threading
+from logging import getLogger
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+logger = getLogger(__name__)
+
+TARGET_SAMPLE_RATE = 16000
+MAX_UPLOAD_BYTES = int(os.getenv("STT_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# multipart 경계 / 헤더 몫으로 본문 크기 제한에 더해 주는 여유분.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class IngestedAudio:
+    """업로드된 오디오. 원본 바이트와, 필요할 때 한 번만 만드는 16kHz mono PCM 을 들고 있습니다."""
+
+    def __init__(self, data: bytes, filename: str, content_type: str):
+        self.data = data
+        self.filename = filename
+        self.content_type = content_type
+        self.duration = probe_duration(data)
+        self._pcm = None
+        self._lock = threading.Lock()
+
+    def pcm16k(self) -> np.ndarray:
+        """ffmpeg 로 한 번 디코딩해 16kHz mono float32 배열로 돌려주고, 이후 호출에서는 재사용합니다."""
+        with self._lock:
+            if self._pcm is None:
+                from pydub import AudioSegment
+                segment = AudioSegment.from_file(io.BytesIO(self.data))
+                segment = segment.set_frame_rate(TARGET_SAMPLE_RATE).set_channels(1).set_sample_width(2)
+                self._pcm = np.frombuffer(segment.raw_data, dtype=np.int16).astype(np.float32) / 32768.0
+                if self.duration is None:
+                    self.duration = len(self._pcm) / TARGET_SAMPLE_RATE
+            return self._pcm
+
+    def ensure_duration(self) -> float:
+        """헤더로 길이를 알 수 없는 포맷이면 디코딩해서 길이를 구합니다. (디코딩 결과는 전사 단계에서 재사용)"""
+        if self.duration is None:
+            self.pcm16k()
+        return self.duration
+
+
+class UploadLimitMiddleware:
+    """paths 로 오는 요청 본문을 max_bytes 로 제한하는 ASGI 미들웨어.
+
+    FastAPI 는 핸들러가 실행되기 전에 multipart 파일 전체를 임시 파일로 받아 두므로, 제한은 본문을 읽는 단계에서 걸어야
+    합니다. Content-Length 가 크면 본문을 받기 전에 413 으로 끊고, 길이를 모르는 (chunked) 요청은 받은 만큼 세다가
+    넘치면 읽기를 멈춥니다.
+    """
+
+    def __init__(self, app, paths, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            response = JSONResponse({"detail": self._detail()}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise HTTPException(status_code=413, detail=self._detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _detail(self) -> str:
+        return f"오디오 파일은 {self.max_bytes // (1024 * 1024)}MB 이하여야 합니다."
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES, chunk_size: int = UPLOAD_CHUNK_BYTES) -> IngestedAudio:
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"오디오 파일은 {max_bytes // (1024 * 1024)}MB 이하여야 합니다.")
+    return IngestedAudio(bytes(buffer), upload.filename, upload.content_type)
+
+
+def probe_duration(data: bytes) -> Optional[float]:
+    """전체 디코딩 없이 헤더만 읽어 길이(초)를 구합니다. 알 수 없으면 None."""
+    try:
+        if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+            return _wav_duration(data)
+        if data[:4] == b'\x1a\x45\xdf\xa3':
+            return _matroska_duration(data)
+        return _mutagen_duration(data)
+    except Exception as e:
+        logger.debug(f"오디오 길이 확인 실패: {e}")
+        return None
+
+
+def _wav_duration(data: bytes) -> Optional[float]:
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError):
+        pass
+
+    # WAVE_FORMAT_EXTENSIBLE / float 처럼 wave 모듈이 못 읽는 포맷은 청크를 직접 읽습니다.
+    pos, byte_rate = 12, None
+    while pos + 8 <= len(data):
+        chunk_id, chunk_size = data[pos:pos + 4], struct.unpack('<I', data[pos + 4:pos + 8])[0]
+        if chunk_id == b'fmt ':
+            byte_rate = struct.unpack('<I', data[pos + 16:pos + 20])[0]
+        elif chunk_id == b'data' and byte_rate:
+            return min(chunk_size, len(data) - pos - 8) / byte_rate
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def _read_ebml_id(data: bytes, pos: int):
+    first = data[pos]
+    length = 1
+    while length <= 4 and not first & (0x80 >> (length - 1)):
+        length += 1
+    return int.from_bytes(data[pos:pos + length], 'big'), pos + length
+
+
+def _read_ebml_size(data: bytes, pos: int):
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    value = first & (0xFF >> length)
+    for b in data[pos + 1:pos + length]:
+        value = (value << 8) | b
+    unknown = value == (1 << (7 * length)) - 1
+    return (None if unknown else value), pos + length
+
+
+def _matroska_duration(data: bytes) -> Optional[float]:
+    """WebM/Matroska 길이를 디코딩 없이 구합니다.
+
+    Segment > Info 에 Duration 이 있으면 그 값을, 브라우저 MediaRecorder 결과처럼 없으면 Cluster 의 Timecode 와
+    마지막 블록의 상대 timecode (+ BlockDuration) 로 마지막 프레임의 시각을 씁니다. (Cluster 크기가 unknown 이어도 동작)
+    """
+    SEGMENT, INFO, TIMECODE_SCALE, DURATION = 0x18538067, 0x1549A966, 0x2AD7B1, 0x4489
+    CLUSTER, TIMECODE, SIMPLE_BLOCK, BLOCK_GROUP, BLOCK, BLOCK_DURATION = 0x1F43B675, 0xE7, 0xA3, 0xA0, 0xA1, 0x9B
+    containers = (SEGMENT, INFO, CLUSTER, BLOCK_GROUP)
+    pos, end = 0, len(data)
+    timecode_scale, duration = 1_000_000, None
+    cluster_timecode, last_block = 0, None
+    while pos < end:
+        element_id, pos = _read_ebml_id(data, pos)
+        size, pos = _read_ebml_size(data, pos)
+        if element_id in containers:
+            continue
+        if size is None or pos + size > end:
+            # 녹음이 잘려 마지막 블록이 덜 들어온 경우에도 그 앞까지의 길이를 씁니다.
+            if element_id in (SIMPLE_BLOCK, BLOCK) and pos + 4 <= end:
+                last_block = _block_end(data, pos, cluster_timecode, last_block)
+            break
+        if element_id == TIMECODE_SCALE:
+            timecode_scale = int.from_bytes(data[pos:pos + size], 'big')
+        elif element_id == DURATION:
+            duration = struct.unpack('>f' if size == 4 else '>d', data[pos:pos + size])[0]
+            if duration:
+                break
+        elif element_id == TIMECODE:
+            cluster_timecode = int.from_bytes(data[pos:pos + size], 'big')
+        elif element_id in (SIMPLE_BLOCK, BLOCK):
+            last_block = _block_end(data, pos, cluster_timecode, last_block)
+        elif element_id == BLOCK_DURATION and last_block is not None:
+            last_block += int.from_bytes(data[pos:pos + size], 'big')
+        pos += size
+    if not duration:
+        duration = last_block
+    return duration * timecode_scale / 1e9 if duration else None
+
+
+def _block_end(data: bytes, pos: int, cluster_timecode: int, last_block: Optional[int]) -> int:
+    """(Simple)Block 머리의 트랙 번호 다음 int16 이 Cluster 기준 상대 timecode 입니다."""
+    _, pos = _read_ebml_size(data, pos)
+    relative = struct.unpack('>h', data[pos:pos + 2])[0]
+    return max(cluster_timecode + relative, last_block or 0)
+
+
+def _mutagen_duration(data: bytes) -> Optional[float]:
+    try:
+        import mutagen
+    except ImportError:
+        return None
+    info = mutagen.File(io.BytesIO(data))
+    return info.info.length if info is not None and info.info else None
@@ -0,0 +1,50 @@
+"""쿼리를 하나씩 검색할 때와 search_batch_* 로 묶어서 검색할 때의 처리량 비교.
+
+인코딩 비용을 빼고 검색 단계만 비교하기 위해, 저장된 라인 임베딩에 잡음을 섞은 벡터를 쿼리로 씁니다.
+
+    python benchmarks/bench_batch_search.py --queries 2000 --batch-size 256
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from snapshot import SearchSnapshot, STORE_DIR, current_paths
+from search import PIPELINES, search_pipeline_from_text, search_pipeline_from_audio
+
+SINGLE = {"text": search_pipeline_from_text, "audio": search_pipeline_from_audio}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="단건 검색 반복 vs 배치 검색 처리량")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    snapshot = SearchSnapshot.load(current_paths(args.store))
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(snapshot.line_store), size=args.queries)
+    vectors = np.asarray(snapshot.line_embeddings[rows], dtype='float32')
+    vectors += rng.standard_normal(vectors.shape).astype('float32') * args.noise
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [snapshot.line_store.text(i) for i in rows]
+
+    for mode in ("text", "audio"):
+        start = time.perf_counter()
+        single = [SINGLE[mode](snapshot, texts[i], vectors[i:i+1]) for i in range(args.queries)]
+        single_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = []
+        for begin in range(0, args.queries, args.batch_size):
+            batched.extend(PIPELINES[mode](snapshot, texts[begin:begin + args.batch_size], vectors[begin:begin + args.batch_size]))
+        batch_s = time.perf_counter() - start
+
+        same = sum(a == b for a, b in zip(single, batched))
+        print(f"{mode:<6} single: {args.queries / single_s:8.0f} q/s   batch({args.batch_size}): {args.queries / batch_s:8.0f} q/s"
+              f"   ({single_s / batch_s:.1f}x, same results {same}/{args.queries})")
@@ -0,0 +1,109 @@
+"""오디오 검색 파이프라인의 후보 점수 계산 마이크로벤치마크.
+
+이전 dict 루프 구현과 scoring.fuse_candidates 를 같은 무작위 검색 결과로 돌려
+순위가 같은지 확인하고 요청당 CPU 시간을 비교합니다.
+
+    python benchmarks/bench_scoring.py --requests 2000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from catalog import parse_tags
+from scoring import TagMatrix, HitSource, fuse_candidates, REASON_SONG, REASON_SUMMARY, REASON_LYRIC
+
+
+def legacy_scoring(song_metadata, line_song_idx, identified_song_idx, D_song, I_song, D_summary, I_summary, D_lyric, I_lyric,
+                   weight_song, weight_summary, weight_lyric):
+    candidate_scores = defaultdict(float)
+    recommendation_reasons = defaultdict(list)
+
+    for i, idx in enumerate(I_song[0]):
+        candidate_scores[idx] += D_song[0][i] * weight_song
+        recommendation_reasons[idx].append("분위기와 장르가 비슷해요.")
+    for i, idx in enumerate(I_summary[0]):
+        candidate_scores[idx] += D_summary[0][i] * weight_summary
+        recommendation_reasons[idx].append("곡의 전반적인 감성이 비슷해요.")
+    for i, line_idx in enumerate(I_lyric[0]):
+        song_idx = line_song_idx[line_idx]
+        if song_idx == identified_song_idx: continue
+        candidate_scores[song_idx] += D_lyric[0][i] * weight_lyric
+        recommendation_reasons[song_idx].append("가사가 비슷한 느낌을 줘요.")
+
+    original_tags = set(parse_tags(song_metadata[identified_song_idx].get('tags_normalized', '[]')))
+    for idx in list(candidate_scores.keys()):
+        candidate_tags = set(parse_tags(song_metadata[idx].get('tags_normalized', '[]')))
+        if original_tags.intersection(candidate_tags):
+            candidate_scores[idx] += 0.1
+            recommendation_reasons[idx].append(f"비슷한 태그({', '.join(original_tags.intersection(candidate_tags))})를 공유해요.")
+
+    for i, idx in enumerate(I_song[0]): candidate_scores[idx] += (10 - i) * 0.005
+    for i, idx in enumerate(I_summary[0]): candidate_scores[idx] += (10 - i) * 0.003
+    for i, line_idx in enumerate(I_lyric[0]):
+        candidate_scores[line_song_idx[line_idx]] += (50 - i) * 0.001
+
+    ranked = sorted(candidate_scores.items(), key=lambda item: item[1], reverse=True)
+    return [int(idx) for idx, _ in ranked if idx != identified_song_idx]
+
+
+def vectorized_scoring(tag_matrix, line_song_idx, identified_song_idx, D_song, I_song, D_summary, I_summary, D_lyric, I_lyric,
+                       weight_song, weight_summary, weight_lyric):
+    candidates, _, _ = fuse_candidates(identified_song_idx, [
+        HitSource(I_song, D_song, weight_song, REASON_SONG, rank_bonus=0.005),
+        HitSource(I_summary, D_summary, weight_summary, REASON_SUMMARY, rank_bonus=0.003),
+        HitSource(line_song_idx[I_lyric[0]], D_lyric, weight_lyric, REASON_LYRIC, rank_bonus=0.001),
+    ], tag_matrix, tag_weight=0.1)
+    return candidates.tolist()
+
+
+def random_hits(rng, num_songs, num_lines, identified_song_idx):
+    I_song = np.concatenate([[identified_song_idx], rng.choice(num_songs, 9, replace=False)])[None, :]
+    I_summary = np.concatenate([[identified_song_idx], rng.choice(num_songs, 9, replace=False)])[None, :]
+    I_lyric = rng.choice(num_lines, 50, replace=False)[None, :]
+    D_song = np.sort(rng.random((1, 10), dtype=np.float32))[:, ::-1]
+    D_summary = np.sort(rng.random((1, 10), dtype=np.float32))[:, ::-1]
+    D_lyric = np.sort(rng.random((1, 50), dtype=np.float32))[:, ::-1]
+    return D_song, I_song, D_summary, I_summary, D_lyric, I_lyric
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--songs", default="song_metadata.json")
+    parser.add_argument("--lines", type=int, default=16000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.songs, 'r', encoding='utf-8') as f:
+        song_metadata = json.load(f)
+    tag_matrix = TagMatrix([parse_tags(song.get('tags_normalized', '[]')) for song in song_metadata])
+    rng = np.random.default_rng(args.seed)
+    line_song_idx = np.sort(rng.integers(0, len(song_metadata), args.lines)).astype(np.int32)
+
+    requests = []
+    for _ in range(args.requests):
+        identified_song_idx = int(rng.integers(len(song_metadata)))
+        weights = (0.5, 0.1, 0.4) if rng.random() < 0.5 else (0.6, 0.2, 0.2)
+        requests.append((identified_song_idx, *random_hits(rng, len(song_metadata), args.lines, identified_song_idx), *weights))
+
+    line_song_list = line_song_idx.tolist()
+    start = time.perf_counter()
+    legacy = [legacy_scoring(song_metadata, line_song_list, *request) for request in requests]
+    legacy_us = (time.perf_counter() - start) * 1e6 / len(requests)
+
+    start = time.perf_counter()
+    vectorized = [vectorized_scoring(tag_matrix, line_song_idx, *request) for request in requests]
+    vectorized_us = (time.perf_counter() - start) * 1e6 / len(requests)
+
+    same_top3 = sum(a[:3] == b[:3] for a, b in zip(legacy, vectorized))
+    same_full = sum(a == b for a, b in zip(legacy, vectorized))
+    print(f"requests: {len(requests)}")
+    print(f"legacy dict loops : {legacy_us:8.1f} us/request")
+    print(f"fuse_candidates   : {vectorized_us:8.1f} us/request ({legacy_us / vectorized_us:.1f}x)")
+    print(f"same top-3 ranking: {same_top3}/{len(requests)}, same full ranking: {same_full}/{len(requests)}")
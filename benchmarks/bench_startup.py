@@ -0,0 +1,66 @@
+"""서버 콜드 스타트 시간을 단계별로 측정합니다.
+
+각 측정은 새 파이썬 프로세스에서 실행합니다.
+- 무거운 라이브러리별 import 시간
+- `import app` (서버가 포트를 열기까지 걸리는 시간)
+- 백그라운드 준비 단계 (model / snapshot / warmup)
+
+    python startup.py                       # 파생 데이터를 미리 만들어 두고
+    python benchmarks/bench_startup.py --runs 3
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MODULES = ["numpy", "faiss", "fastapi", "sentence_transformers", "openai", "httpx", "pydub"]
+
+IMPORT_MODULE = """
+import time, json
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"ms": (time.perf_counter() - start) * 1000}}))
+"""
+
+APP_STARTUP = """
+import time, json, logging
+logging.disable(logging.INFO)
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+app.startup.run(app.STARTUP_STEPS)
+report = app.startup.report()
+report["import_ms"] = import_ms
+print(json.dumps(report))
+"""
+
+
+def run_python(code: str) -> dict:
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="서버 시작 시간을 단계별로 측정합니다.")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print("import 시간 (새 프로세스, 1회)")
+    for module in MODULES:
+        row = run_python(IMPORT_MODULE.format(module=module))
+        print(f"  {module:<24}" + (f"{row['ms']:>10.1f} ms" if "ms" in row else f"  {row['error']}"))
+
+    print(f"\n서버 시작 ({args.runs}회, 첫 회는 페이지 캐시가 비어 있을 수 있음)")
+    for run in range(args.runs):
+        report = run_python(APP_STARTUP)
+        if "error" in report and "import_ms" not in report:
+            print(f"  run {run + 1}: 실패 - {report['error']}")
+            continue
+        phases = {"import app": report["import_ms"], **report["phases"]}
+        total = sum(phases.values())
+        print(f"  run {run + 1}: " + "  ".join(f"{name}={ms:.0f}ms" for name, ms in phases.items()) + f"  total={total:.0f}ms"
+              + ("" if report["ready"] else f"  (준비 실패: {report['error']})"))
@@ -0,0 +1,79 @@
+"""여러 워커 프로세스가 같은 검색 스냅샷을 읽을 때의 메모리 사용량을 측정합니다. (Linux 전용)
+
+각 워커는 SearchSnapshot 을 읽고 검색을 몇 번 실행한 뒤, 모든 워커가 살아 있는 상태에서
+/proc/self/smaps_rollup 의 RSS / PSS / private 메모리를 보고합니다. PSS 합계가 실제로 쓰는 물리 메모리입니다.
+--copy 는 memory-map 대신 모든 배열과 인덱스를 프로세스 메모리로 복사해 (이전 방식) 비교합니다.
+
+    python startup.py
+    python benchmarks/bench_workers.py --workers 1 2 4
+"""
+import os
+import sys
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def memory_mb() -> dict:
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {"rss": fields["Rss"], "pss": fields["Pss"], "private": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def worker(store_dir: str, copy: bool, queries: int, barrier, results):
+    import faiss
+    from snapshot import SearchSnapshot, current_paths
+    from search import search_pipeline_from_text
+
+    snapshot = SearchSnapshot.load(current_paths(store_dir))
+    if copy:
+        snapshot.line_store.embeddings = snapshot.line_embeddings = np.array(snapshot.line_embeddings)
+        snapshot.song_embeddings = np.array(snapshot.song_embeddings)
+        snapshot.summary_embeddings = np.array(snapshot.summary_embeddings)
+        for name in ("line_index", "song_index", "summary_index"):
+            setattr(snapshot, name, faiss.deserialize_index(faiss.serialize_index(getattr(snapshot, name))))
+
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(queries):
+        query_vector = rng.standard_normal((1, snapshot.line_embeddings.shape[1])).astype('float32')
+        query_vector /= np.linalg.norm(query_vector)
+        search_pipeline_from_text(snapshot, "", query_vector)
+    # 메모리는 모든 워커가 스냅샷을 들고 있는 동안 측정해야 공유 페이지가 PSS 에 나뉘어 잡힙니다.
+    barrier.wait()
+    results.put(memory_mb())
+    barrier.wait()
+
+
+def measure(num_workers: int, store_dir: str, copy: bool, queries: int):
+    ctx = mp.get_context("spawn")
+    barrier, results = ctx.Barrier(num_workers), ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(store_dir, copy, queries, barrier, results)) for _ in range(num_workers)]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="워커 수에 따른 검색 데이터 메모리 사용량")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--store", default=os.getenv("STORE_DIR", "store"))
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'workers':>8}{'sum RSS MB':>12}{'sum PSS MB':>12}{'private MB/worker':>19}")
+    for copy in (False, True):
+        for num_workers in args.workers:
+            rows = measure(num_workers, args.store, copy, args.queries)
+            print(f"{'copy' if copy else 'mmap':<8}{num_workers:>8}{sum(r['rss'] for r in rows):>12.1f}"
+                  f"{sum(r['pss'] for r in rows):>12.1f}{np.mean([r['private'] for r in rows]):>19.1f}")
@@ -0,0 +1,291 @@
+"""텍스트 / 오디오 검색 파이프라인의 품질과 단계별 지연 시간을 재현 가능하게 측정하는 오프라인 평가 하네스.
+
+곡 가사와 요약에서 정답이 붙은 쿼리를 만들어 두 파이프라인에 흘려 보냅니다.
+- line      : 가사 한 줄 그대로
+- partial   : 가사 한 줄의 일부 구간
+- noisy     : 글자 탈락 / 치환 / 반복, 문장부호와 공백 제거 (STT 오인식 흉내)
+- translit  : 가사 줄의 한글 발음 표기 (원본 lyrics 의 발음 줄. 한국어로 받아 적힌 일본어 가사 흉내)
+- tl_noisy  : 한글 발음 표기에 noisy 와 같은 잡음. 어휘 색인에 발음 줄 원문이 그대로 들어 있으므로 translit 보다 이쪽이 실제 전사에 가깝습니다.
+- multiline : 이어지는 가사 2 ~ 3 줄을 붙이고 잡음을 넣은 것 (여러 줄을 부른 녹음의 전사 흉내)
+- summary   : 곡 요약문
+
+측정 항목
+- top-1 : 식별된 곡이 정답 곡인 비율 (none 은 결과가 없는 비율)
+- overlap : 같은 가사 줄의 원문(line) 쿼리와 비교한 추천 곡 집합의 Jaccard 평균 (잡음에 대한 추천 안정성)
+- 단계별 p50 / p95 / p99 (encode, 인덱스별 검색, 나머지 조립 단계)
+--save 로 결과를 저장해 두고 --baseline 으로 비교하면 가중치 / 임계값 / 인덱스 종류 변경 전후의
+식별 일치율과 추천 overlap 을 볼 수 있습니다.
+
+    python benchmarks/eval_search.py --embedder stub --songs 200          # 모델 없이 (CI)
+    python benchmarks/eval_search.py --save before.json
+    python benchmarks/eval_search.py --baseline before.json --index-type hnsw
+"""
+import os
+import sys
+import json
+import time
+import string
+import argparse
+import unicodedata
+from collections import defaultdict
+from logging import basicConfig, WARNING
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ann_index import build_index, configure, configured_index_type
+from catalog import Catalog, Song, transliteration_pairs
+from encoder import BatchEncoder, HashEmbedder, MODEL_NAME
+from ingest import split_lines
+from lexical_index import build_lexical_index
+from line_store import LineStore
+from recommendation_graph import RecommendationGraph
+from search import search_pipeline_from_text, search_pipeline_from_audio
+from snapshot import SearchSnapshot, STORE_DIR, current_paths
+
+
+PIPELINES = {"text": search_pipeline_from_text, "audio": search_pipeline_from_audio}
+KINDS = ("line", "partial", "noisy", "translit", "tl_noisy", "multiline", "summary")
+PUNCTUATION = set(string.punctuation) | set("、。！？「」『』・…～〜（）")
+STAGES = ("encode", "line_index", "lexical_index", "summary_index", "song_index", "assemble", "total")
+
+
+class TimedIndex:
+    """FAISS / 어휘 인덱스의 search 호출 시간을 단계별로 모읍니다."""
+
+    def __init__(self, index, name: str, timings: dict):
+        self._index = index
+        self._name = name
+        self._timings = timings
+
+    def search(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._index.search(*args, **kwargs)
+        finally:
+            self._timings[self._name] += time.perf_counter() - start
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
+
+
+def stt_noise(text: str, rng: np.random.Generator, rate: float = 0.12) -> str:
+    chars = [ch for ch in unicodedata.normalize('NFKC', text) if ch not in PUNCTUATION and not ch.isspace()]
+    out = []
+    for ch in chars:
+        r = rng.random()
+        if r < rate / 3:
+            continue
+        if r < rate * 2 / 3:
+            out.append(chars[rng.integers(len(chars))])
+            continue
+        out.append(ch)
+        if r < rate:
+            out.append(ch)
+    return "".join(out) or text
+
+
+def partial(text: str, rng: np.random.Generator) -> str:
+    length = max(2, int(round(len(text) * rng.uniform(0.4, 0.7))))
+    start = int(rng.integers(0, max(1, len(text) - length + 1)))
+    return text[start:start + length]
+
+
+def make_queries(snapshot: SearchSnapshot, num_sources: int, seed: int):
+    """(kind, source, label song idx, text) 목록. source 가 같은 쿼리들은 같은 가사 줄에서 만들었습니다."""
+    rng = np.random.default_rng(seed)
+    line_store, catalog = snapshot.line_store, snapshot.catalog
+
+    # 여러 곡에 같은 줄이 있으면 정답이 모호하므로 한 곡에만 나오는 충분히 긴 줄만 씁니다.
+    songs_by_text = defaultdict(set)
+    texts = [line_store.text(i) for i in range(len(line_store))]
+    for i, text in enumerate(texts):
+        songs_by_text[text].add(int(line_store.song_idx[i]))
+    candidates = [i for i, text in enumerate(texts) if len(text) >= 6 and len(songs_by_text[text]) == 1]
+
+    readings = {}
+
+    def reading(song_idx: int, text: str):
+        if song_idx not in readings:
+            readings[song_idx] = dict(transliteration_pairs(catalog.lyrics(song_idx)))
+        return readings[song_idx].get(text)
+
+    # 순열의 앞부분을 쓰고 줄마다 따로 난수를 만들어, --sources 를 바꿔도 앞쪽 쿼리들은 같게 유지됩니다.
+    queries = []
+    for source, i in enumerate(rng.permutation(candidates)[:num_sources].tolist()):
+        text, song_idx = texts[i], int(line_store.song_idx[i])
+        rng = np.random.default_rng([seed, i])
+        queries.append(("line", source, song_idx, text))
+        queries.append(("partial", source, song_idx, partial(text, rng)))
+        queries.append(("noisy", source, song_idx, stt_noise(text, rng)))
+        if reading(song_idx, text):
+            queries.append(("translit", source, song_idx, reading(song_idx, text)))
+            queries.append(("tl_noisy", source, song_idx, stt_noise(reading(song_idx, text), rng)))
+        end = min(i + int(rng.integers(2, 4)), line_store.song_range(song_idx)[1])
+        if end - i >= 2:
+            queries.append(("multiline", source, song_idx, stt_noise(" ".join(texts[i:end]), rng)))
+
+    summaries = [i for i in range(len(catalog)) if catalog[i].summary]
+    for song_idx in np.random.default_rng(seed).permutation(summaries)[:num_sources].tolist():
+        queries.append(("summary", None, song_idx, catalog[song_idx].summary))
+    return queries
+
+
+def stub_snapshot(song_metadata_path: str, encoder: BatchEncoder, index_type: str, with_graph: bool, max_songs: int = None,
+                  with_lexical: bool = True) -> SearchSnapshot:
+    """저장된 임베딩 대신 encoder 로 곡 / 요약 / 가사 줄을 다시 임베딩해 메모리 안에 스냅샷을 만듭니다."""
+    with open(song_metadata_path, 'r', encoding='utf-8') as f:
+        records = json.load(f)[:max_songs]
+    catalog = Catalog([Song.from_record(record) for record in records], source_path=song_metadata_path)
+
+    texts, song_idx = [], []
+    for i, record in enumerate(records):
+        lines = split_lines(record.get('lyrics_cleaned', ''))
+        texts.extend(lines)
+        song_idx.extend([i] * len(lines))
+    line_store = LineStore.from_lines(texts, song_idx, encoder.encode_now(texts))
+    song_embeddings = encoder.encode_now([record.get('lyrics_cleaned', '') for record in records])
+    summary_embeddings = encoder.encode_now([record.get('summary', '') for record in records])
+    graph = RecommendationGraph.build(song_embeddings, summary_embeddings, catalog.tag_matrix) if with_graph else None
+    return SearchSnapshot("stub", catalog, line_store, song_embeddings, summary_embeddings,
+                          build_index(line_store.embeddings, index_type or configured_index_type("line")),
+                          build_index(song_embeddings, index_type or configured_index_type("song")),
+                          build_index(summary_embeddings, index_type or configured_index_type("summary")), graph,
+                          build_lexical_index(line_store, catalog) if with_lexical else None)
+
+
+def song_key(song) -> list:
+    return [song["songTitle"], song["artist"]] if song else None
+
+
+def evaluate(snapshot: SearchSnapshot, encoder: BatchEncoder, queries):
+    timings = defaultdict(float)
+    for name in ("line_index", "song_index", "summary_index", "lexical_index"):
+        if getattr(snapshot, name) is not None:
+            setattr(snapshot, name, TimedIndex(getattr(snapshot, name), name, timings))
+
+    results, latencies = [], {pipeline: defaultdict(list) for pipeline in PIPELINES}
+    for pipeline_name, pipeline in PIPELINES.items():
+        for qid, (kind, source, label, text) in enumerate(queries):
+            start = time.perf_counter()
+            query_vector = encoder.encode_now([text])
+            encode_s = time.perf_counter() - start
+
+            timings.clear()
+            start = time.perf_counter()
+            identified_song, _, similar_songs = pipeline(snapshot, text, query_vector)
+            search_s = time.perf_counter() - start
+
+            stage_s = dict(timings, encode=encode_s, total=encode_s + search_s)
+            stage_s["assemble"] = search_s - sum(timings.values())
+            for stage, seconds in stage_s.items():
+                latencies[pipeline_name][stage].append(seconds * 1000)
+            results.append({
+                "pipeline": pipeline_name, "qid": qid, "kind": kind, "source": source, "text": text,
+                "label": song_key(snapshot.catalog.response(label)),
+                "identified": song_key(identified_song),
+                "recommendations": [song_key(song) for song in similar_songs],
+            })
+    return results, latencies
+
+
+def jaccard(a, b) -> float:
+    a, b = {tuple(x) for x in a}, {tuple(x) for x in b}
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def quality_report(results, baseline=None):
+    reference = {(r["pipeline"], r["source"]): r["recommendations"] for r in results if r["kind"] == "line"}
+    # 쿼리 수가 달라도 비교할 수 있도록 qid 가 아니라 쿼리 내용으로 맞춥니다.
+    query_key = lambda r: (r["pipeline"], r["kind"], r["text"], tuple(r["label"]))
+    baseline = {query_key(r): r for r in baseline or []}
+    groups = defaultdict(list)
+    for r in results:
+        groups[(r["pipeline"], r["kind"])].append(r)
+        groups[(r["pipeline"], "all")].append(r)
+
+    rows = []
+    for (pipeline, kind), group in groups.items():
+        row = {
+            "pipeline": pipeline, "kind": kind, "n": len(group),
+            "top1": np.mean([r["identified"] == r["label"] for r in group]),
+            "none": np.mean([r["identified"] is None for r in group]),
+        }
+        with_reference = [r for r in group if r["kind"] not in ("line", "summary")]
+        row["overlap"] = np.mean([jaccard(r["recommendations"], reference[(pipeline, r["source"])]) for r in with_reference]) if with_reference else None
+        matched = [(r, baseline[query_key(r)]) for r in group if query_key(r) in baseline]
+        if matched:
+            row["baseline_n"] = len(matched)
+            row["baseline_top1"] = np.mean([b["identified"] == b["label"] for _, b in matched])
+            row["same_as_baseline"] = np.mean([r["identified"] == b["identified"] for r, b in matched])
+            row["baseline_overlap"] = np.mean([jaccard(r["recommendations"], b["recommendations"]) for r, b in matched])
+        rows.append(row)
+    return sorted(rows, key=lambda row: (row["pipeline"], (KINDS + ("all",)).index(row["kind"])))
+
+
+def latency_report(latencies):
+    return [{"pipeline": pipeline, "stage": stage, **{f"p{q}": float(np.percentile(values[stage], q)) for q in (50, 95, 99)}}
+            for pipeline, values in latencies.items() for stage in STAGES if values.get(stage)]
+
+
+def fmt(value, pattern="{:.3f}"):
+    return "-" if value is None else pattern.format(value)
+
+
+if __name__ == "__main__":
+    basicConfig(level=WARNING)
+    parser = argparse.ArgumentParser(description="검색 파이프라인 품질 / 지연 시간 평가")
+    parser.add_argument("--embedder", choices=["model", "stub"], default="model",
+                        help="model: 저장된 스냅샷 + 실제 임베딩 모델, stub: 해시 임베더로 스냅샷을 다시 만들어 모델 없이 실행")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--songs", type=int, default=None, help="(stub) 앞에서부터 이 곡 수만 사용")
+    parser.add_argument("--index-type", default=None, help="인덱스 종류를 바꿔서 평가 (기본값: *_INDEX_TYPE 설정)")
+    parser.add_argument("--no-graph", action="store_true", help="추천 그래프 없이 실시간 이웃 검색으로 평가")
+    parser.add_argument("--no-lexical", action="store_true", help="어휘 색인 없이 벡터 검색만으로 곡 식별")
+    parser.add_argument("--sources", type=int, default=200, help="쿼리를 만들 가사 줄 / 요약문 수")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="쿼리별 결과와 리포트를 JSON 으로 저장")
+    parser.add_argument("--baseline", help="--save 로 저장한 이전 결과와 비교")
+    args = parser.parse_args()
+
+    paths = current_paths(args.store)
+    start = time.perf_counter()
+    if args.embedder == "stub":
+        encoder = BatchEncoder(HashEmbedder())
+        snapshot = stub_snapshot(paths.song_metadata, encoder, args.index_type, not args.no_graph, args.songs, not args.no_lexical)
+    else:
+        from sentence_transformers import SentenceTransformer
+        encoder = BatchEncoder(SentenceTransformer(MODEL_NAME))
+        snapshot = SearchSnapshot.load(paths)
+        if args.index_type:
+            snapshot.line_index = build_index(snapshot.line_embeddings, args.index_type)
+            snapshot.song_index = build_index(snapshot.song_embeddings, args.index_type)
+            snapshot.summary_index = build_index(snapshot.summary_embeddings, args.index_type)
+        if args.no_graph:
+            snapshot.recommendation_graph = None
+        if args.no_lexical:
+            snapshot.lexical_index = None
+    for index in (snapshot.line_index, snapshot.song_index, snapshot.summary_index):
+        configure(index)
+    print(f"snapshot [{snapshot.version}] {len(snapshot.catalog)}곡, {len(snapshot.line_store)}줄 ({time.perf_counter() - start:.1f}s)")
+
+    queries = make_queries(snapshot, args.sources, args.seed)
+    results, latencies = evaluate(snapshot, encoder, queries)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+    quality, latency = quality_report(results, baseline), latency_report(latencies)
+
+    print(f"\n{'pipeline':<9}{'kind':<10}{'n':>6}{'top-1':>8}{'none':>8}{'overlap':>9}" + (f"{'base n':>8}{'base top-1':>12}{'same id':>9}{'base ovl':>10}" if baseline else ""))
+    for row in quality:
+        print(f"{row['pipeline']:<9}{row['kind']:<10}{row['n']:>6}{fmt(row['top1']):>8}{fmt(row['none']):>8}{fmt(row['overlap']):>9}"
+              + (f"{row.get('baseline_n', 0):>8}{fmt(row.get('baseline_top1')):>12}{fmt(row.get('same_as_baseline')):>9}{fmt(row.get('baseline_overlap')):>10}" if baseline else ""))
+
+    print(f"\n{'pipeline':<9}{'stage':<15}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for row in latency:
+        print(f"{row['pipeline']:<9}{row['stage']:<15}{row['p50']:>9.3f}{row['p95']:>9.3f}{row['p99']:>9.3f}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "quality": quality, "latency": latency, "results": results}, f, ensure_ascii=False, indent=1, default=float)
@@ -0,0 +1,148 @@
+import os
+import sys
+import re
+import ast
+import json
+import argparse
+import threading
+from logging import getLogger, basicConfig, INFO
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from scoring import TagMatrix
+
+logger = getLogger(__name__)
+
+
+_HANGUL = re.compile('[가-힣]')
+_JAPANESE = re.compile('[ぁ-ヿ一-鿿]')
+
+
+def transliteration_pairs(lyrics: str) -> List[Tuple[str, str]]:
+    """원본 가사(lyrics)의 (일본어 줄, 한글 발음 줄) 쌍.
+
+    가사 사이트 형식은 일본어 줄 다음에 한글 발음, 한글 해석 줄이 이어집니다. 한글 줄이 하나뿐이면 발음인지 해석인지
+    알 수 없으므로, 일본어 줄 바로 뒤에 한글 줄이 두 줄 이상 이어질 때만 첫 줄을 발음으로 씁니다.
+    """
+    lines = [line.strip().strip('\u200b') for line in (lyrics or '').split('\n')]
+    pairs = []
+    for i in range(len(lines) - 2):
+        original, reading, translation = lines[i:i + 3]
+        if (_JAPANESE.search(original) and reading and _HANGUL.search(reading) and not _JAPANESE.search(reading)
+                and translation and _HANGUL.search(translation) and not _JAPANESE.search(translation)):
+            pairs.append((original, reading))
+    return pairs
+
+
+def parse_tags(tags_str: str) -> List[str]:
+    if not isinstance(tags_str, str) or not tags_str.startswith('['):
+        return []
+    try:
+        return ast.literal_eval(tags_str)
+    except (ValueError, SyntaxError):
+        return []
+
+
+class Song:
+    __slots__ = ("spotify_id", "title", "artist", "album_cover_url", "tags", "summary", "fragment")
+
+    def __init__(self, spotify_id, title, artist, album_cover_url, tags, summary):
+        self.spotify_id = spotify_id
+        self.title = sys.intern(title) if isinstance(title, str) else title
+        self.artist = sys.intern(artist) if isinstance(artist, str) else artist
+        self.album_cover_url = album_cover_url
+        self.tags = tuple(tags)
+        self.summary = summary
+        # API 응답에 공통으로 들어가는 필드. 요청마다 이 dict 를 복사해 쿼리별 필드만 덧붙입니다.
+        self.fragment = {
+            "songId": spotify_id,
+            "songTitle": title,
+            "artist": artist,
+            "albumCoverUrl": album_cover_url,
+            "tagName": list(self.tags),
+            "songDescription": summary,
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Song":
+        return cls(record.get('spotify_id'), record.get('title'), record.get('artist'), record.get('album_cover_url'),
+                   parse_tags(record.get('tags_normalized', '[]')), record.get('summary', 'N/A'))
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"spotify_id": self.spotify_id, "title": self.title, "artist": self.artist,
+                "album_cover_url": self.album_cover_url, "tags": list(self.tags), "summary": self.summary}
+
+
+class Catalog:
+    """시작 시 한 번 만들어 두는 곡 정보 저장소.
+
+    태그는 미리 파싱해 TagMatrix 로, 아티스트는 정수 id 배열로 들고 있습니다.
+    API 에서 쓰지 않는 전체 가사는 lyrics() 를 처음 호출할 때 원본 JSON 에서 읽습니다.
+    """
+
+    def __init__(self, songs: List[Song], source_path: str = None):
+        self.songs = songs
+        self.source_path = source_path
+        artist_ids = {}
+        self.artist_ids = np.array([artist_ids.setdefault(song.artist, len(artist_ids)) for song in songs], dtype=np.int32)
+        self.tag_matrix = TagMatrix([song.tags for song in songs])
+        self._lyrics = None
+        self._lyrics_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.songs)
+
+    def __getitem__(self, idx: int) -> Song:
+        return self.songs[idx]
+
+    def response(self, idx: int, **extra) -> Dict[str, Any]:
+        fragment = dict(self.songs[idx].fragment)
+        fragment.update(extra)
+        return fragment
+
+    def lyrics(self, idx: int, cleaned: bool = False) -> str:
+        if self._lyrics is None:
+            with self._lyrics_lock:
+                if self._lyrics is None:
+                    with open(self.source_path, 'r', encoding='utf-8') as f:
+                        self._lyrics = [(record.get('lyrics', ''), record.get('lyrics_cleaned', '')) for record in json.load(f)]
+        return self._lyrics[idx][1 if cleaned else 0]
+
+    @classmethod
+    def from_metadata(cls, path: str) -> "Catalog":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls([Song.from_record(record) for record in json.load(f)], source_path=path)
+
+    @classmethod
+    def load(cls, path: str) -> "Catalog":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        songs = [Song(record['spotify_id'], record['title'], record['artist'], record['album_cover_url'], record['tags'], record['summary'])
+                 for record in data['songs']]
+        return cls(songs, source_path=os.path.join(os.path.dirname(path), data['source']))
+
+    def save(self, path: str):
+        source = os.path.relpath(self.source_path, os.path.dirname(os.path.abspath(path)))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"source": source, "songs": [song.to_record() for song in self.songs]}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def load_catalog(catalog_path: str, metadata_path: str) -> Catalog:
+    if os.path.exists(catalog_path):
+        return Catalog.load(catalog_path)
+    logger.info(f"'{catalog_path}' 가 없어 {metadata_path} 에서 카탈로그를 구성합니다. (python catalog.py 로 미리 생성 가능)")
+    return Catalog.from_metadata(metadata_path)
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(description="song_metadata.json 에서 가사를 뺀 카탈로그 파일을 만듭니다.")
+    parser.add_argument("--songs", default="song_metadata.json")
+    parser.add_argument("--out", default="catalog.json")
+    args = parser.parse_args()
+    catalog = Catalog.from_metadata(args.songs)
+    catalog.save(args.out)
+    logger.info(f"카탈로그 생성 완료: {args.out} ({len(catalog)}곡)")
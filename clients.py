@@ -0,0 +1,145 @@
+"""Spotify / OpenAI 로 나가는 비동기 HTTP 클라이언트.
+
+연결 풀을 공유하는 httpx.AsyncClient 하나로 Spotify Web API 와 계정 API 를 호출하므로 느린 외부 호출이
+이벤트 루프(그리고 같은 워커의 검색 요청)를 막지 않습니다. 기본 URL 은 환경 변수로 바꿀 수 있어 로컬 mock 서버로 테스트할 수 있습니다.
+"""
+import os
+import time
+import asyncio
+import base64
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+import httpx
+
+from metrics import span
+
+logger = getLogger(__name__)
+
+SPOTIFY_API_BASE_URL = os.getenv("SPOTIFY_API_BASE_URL", "https://api.spotify.com/v1")
+SPOTIFY_ACCOUNTS_BASE_URL = os.getenv("SPOTIFY_ACCOUNTS_BASE_URL", "https://accounts.spotify.com")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+OUTBOUND_TIMEOUT_SECONDS = float(os.getenv("OUTBOUND_TIMEOUT_SECONDS", "10"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "2"))
+OUTBOUND_MAX_CONNECTIONS = int(os.getenv("OUTBOUND_MAX_CONNECTIONS", "20"))
+
+SPOTIFY_SCOPE = "streaming user-read-private user-read-email user-read-playback-state user-modify-playback-state user-read-currently-playing playlist-modify-public playlist-modify-private"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER_SECONDS = 5.0
+PLAYLIST_ITEMS_PER_REQUEST = 100
+
+
+class SpotifyError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Spotify API {status_code}: {message}")
+        self.status_code = status_code
+
+
+class SpotifyClient:
+    """Spotify 계정 API (토큰 발급 / 갱신) 와 Web API 호출.
+
+    실패하면 지수 백오프로 max_retries 번까지 다시 시도합니다. 플레이리스트 생성처럼 두 번 실행되면 안 되는 요청은
+    서버가 요청을 처리하지 않은 것이 확실한 경우 (연결 실패, 429) 에만 다시 보냅니다.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, redirect_uri: str, api_base_url: str = SPOTIFY_API_BASE_URL,
+                 accounts_base_url: str = SPOTIFY_ACCOUNTS_BASE_URL, timeout: float = OUTBOUND_TIMEOUT_SECONDS,
+                 max_retries: int = OUTBOUND_MAX_RETRIES, max_connections: int = OUTBOUND_MAX_CONNECTIONS, transport=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.api_base_url = api_base_url.rstrip('/')
+        self.accounts_base_url = accounts_base_url.rstrip('/')
+        self.max_retries = max_retries
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport)
+
+    def authorize_url(self, scope: str = SPOTIFY_SCOPE) -> str:
+        query = urlencode({"client_id": self.client_id, "response_type": "code", "redirect_uri": self.redirect_uri, "scope": scope})
+        return f"{self.accounts_base_url}/authorize?{query}"
+
+    @staticmethod
+    def is_token_expired(token_info: Dict[str, Any]) -> bool:
+        return token_info.get('expires_at', 0) - time.time() < 60
+
+    async def exchange_code(self, code: str) -> Dict[str, Any]:
+        return await self._token_request({"grant_type": "authorization_code", "code": code, "redirect_uri": self.redirect_uri})
+
+    async def refresh(self, token_info: Dict[str, Any]) -> Dict[str, Any]:
+        refreshed = await self._token_request({"grant_type": "refresh_token", "refresh_token": token_info['refresh_token']})
+        # 갱신 응답에는 refresh_token 이 빠져 있을 수 있습니다.
+        refreshed.setdefault('refresh_token', token_info['refresh_token'])
+        return refreshed
+
+    async def me(self, access_token: str) -> Dict[str, Any]:
+        return await self._request("me", "GET", f"{self.api_base_url}/me", access_token)
+
+    async def create_playlist(self, access_token: str, user_id: str, name: str, description: str, public: bool = True) -> Dict[str, Any]:
+        return await self._request("playlist_create", "POST", f"{self.api_base_url}/users/{user_id}/playlists", access_token,
+                                   json={"name": name, "public": public, "description": description}, idempotent=False)
+
+    async def add_items(self, access_token: str, playlist_id: str, track_ids: List[str]):
+        uris = [track_id if track_id.startswith("spotify:") else f"spotify:track:{track_id}" for track_id in track_ids]
+        for start in range(0, len(uris), PLAYLIST_ITEMS_PER_REQUEST):
+            await self._request("playlist_add", "POST", f"{self.api_base_url}/playlists/{playlist_id}/tracks", access_token,
+                                json={"uris": uris[start:start + PLAYLIST_ITEMS_PER_REQUEST]}, idempotent=False)
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def _token_request(self, data: Dict[str, str]) -> Dict[str, Any]:
+        credentials = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+        token_info = await self._request("token", "POST", f"{self.accounts_base_url}/api/token", None, data=data,
+                                         headers={"Authorization": f"Basic {credentials}"}, idempotent=False)
+        token_info['expires_at'] = int(time.time()) + int(token_info.get('expires_in', 3600))
+        return token_info
+
+    async def _request(self, name: str, method: str, url: str, access_token: Optional[str], idempotent: bool = True, headers=None, **kwargs):
+        headers = dict(headers or {})
+        if access_token:
+            headers["Authorization"] = f"Bearer {access_token}"
+
+        with span(f"spotify_{name}"):
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                try:
+                    response = await self._http.request(method, url, headers=headers, **kwargs)
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    if last_attempt:
+                        raise
+                    delay = 0.2 * 2 ** attempt
+                    logger.warning(f"Spotify {name} 연결 실패, {delay:.1f}s 후 재시도: {e}")
+                except httpx.TransportError as e:
+                    if last_attempt or not idempotent:
+                        raise
+                    delay = 0.2 * 2 ** attempt
+                    logger.warning(f"Spotify {name} 요청 실패, {delay:.1f}s 후 재시도: {e}")
+                else:
+                    retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUS)
+                    if not retryable or last_attempt:
+                        if response.status_code >= 400:
+                            raise SpotifyError(response.status_code, response.text[:200])
+                        return response.json() if response.content else {}
+                    delay = min(_retry_after(response, 0.2 * 2 ** attempt), MAX_RETRY_AFTER_SECONDS)
+                    logger.warning(f"Spotify {name} {response.status_code}, {delay:.1f}s 후 재시도")
+                await asyncio.sleep(delay)
+
+
+def _retry_after(response: httpx.Response, default: float) -> float:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return default
+
+
+def create_openai_client(async_client: bool = False):
+    """OPENAI 키가 없으면 None. 타임아웃 / 재시도 / 연결 풀은 openai SDK (httpx) 설정을 사용합니다."""
+    api_key = os.getenv("openai")
+    if not api_key:
+        return None
+    import openai
+    client_class = openai.AsyncOpenAI if async_client else openai.OpenAI
+    return client_class(api_key=api_key, base_url=OPENAI_BASE_URL, timeout=OUTBOUND_TIMEOUT_SECONDS * 3, max_retries=OUTBOUND_MAX_RETRIES)
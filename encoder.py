@@ -0,0 +1,112 @@
+import os
+import zlib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import List, Sequence
+
+import numpy as np
+
+logger = getLogger(__name__)
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", 'paraphrase-multilingual-MiniLM-L12-v2')
+
+
+class BatchEncoder:
+    """동시에 들어온 쿼리들을 짧은 시간 창 동안 모아 한 번의 encode 호출로 처리합니다.
+
+    이벤트 루프에서는 대기만 하고, 실제 SentenceTransformer.encode 는 워커 스레드에서 실행됩니다.
+    """
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 8.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encoder")
+        self._queue = None
+        self._worker = None
+
+    def encode_now(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.model.encode(texts), dtype='float32')
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def encode_bulk(self, texts: List[str]) -> np.ndarray:
+        """/batch-search, 증분 적재 같은 대량 인코딩. 이벤트 루프 밖의 스레드에서 호출합니다.
+
+        대화형 요청과 같은 인코더 스레드에서 max_batch_size 개씩 차례로 실행하므로 모델이 동시에 돌지 않고,
+        대화형 배치는 최대 한 청크만 기다린 뒤 청크 사이에 끼어듭니다.
+        """
+        if len(texts) <= self.max_batch_size:
+            return self._executor.submit(self.encode_now, texts).result()
+        return np.concatenate([self._executor.submit(self.encode_now, texts[start:start + self.max_batch_size]).result()
+                               for start in range(0, len(texts), self.max_batch_size)])
+
+    async def encode(self, text: str) -> np.ndarray:
+        """하나의 쿼리를 인코딩해 정규화된 (1, dim) 벡터를 돌려줍니다."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.encode_now, texts)
+            except Exception as e:
+                logger.error(f"배치 인코딩 실패 ({len(texts)}건): {e}", exc_info=True)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for i, (_, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(vectors[i:i+1])
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        self._executor.shutdown(wait=False)
+
+
+class HashEmbedder:
+    """모델 다운로드 없이 쓰는 결정적 임베더. 문자 n-gram 을 해시해 부호와 함께 dim 차원에 더합니다.
+
+    SentenceTransformer 와 같은 encode 인터페이스를 가지므로 BatchEncoder 에 그대로 넣을 수 있습니다. (평가 하네스 / CI 용)
+    """
+
+    def __init__(self, dim: int = 256, ngram_sizes: Sequence[int] = (1, 2, 3)):
+        self.dim = dim
+        self.ngram_sizes = tuple(ngram_sizes)
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype='float32')
+        for row, text in enumerate(texts):
+            for n in self.ngram_sizes:
+                for i in range(len(text) - n + 1):
+                    h = zlib.crc32(text[i:i + n].encode('utf-8'))
+                    vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vectors
@@ -0,0 +1,207 @@
+"""새 곡 / 변경된 곡만 임베딩해서 검색 데이터의 새 버전을 만드는 증분 적재.
+
+    python ingest.py new_songs.json
+
+입력은 song_metadata.json 과 같은 형식의 곡 목록입니다. 결과는 STORE_DIR/vNNNN/ 에 쓰고
+manifest.json 의 current 를 새 버전으로 바꿉니다. 실행 중인 서버는 manifest 를 주기적으로 확인해
+새 스냅샷으로 교체합니다. (또는 POST /admin/reload)
+"""
+import os
+import json
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging import getLogger, basicConfig, INFO
+from typing import List, Dict, Any, Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import faiss
+import numpy as np
+
+from ann_index import load_or_build_index, configured_index_type, index_path, save_index
+from catalog import Catalog, Song
+from line_store import LineStore
+from recommendation_graph import RecommendationGraph
+from lexical_index import build_lexical_index
+from snapshot import STORE_DIR, ArtifactPaths, SearchSnapshot, current_paths, read_manifest, write_manifest
+
+logger = getLogger(__name__)
+
+_ingest_lock = threading.Lock()
+LOCK_FILE = ".ingest.lock"
+
+
+def song_keys(record: Dict[str, Any]) -> List[str]:
+    """곡을 찾는 키들. spotify_id 가 새로 채워지거나 바뀐 곡도 같은 곡으로 보도록 아티스트 + 제목으로도 찾습니다."""
+    keys = [f"id:{record['spotify_id']}"] if record.get('spotify_id') else []
+    return keys + [f"name:{record.get('artist')}␟{record.get('title')}"]
+
+
+# 임베딩에 들어가지 않지만 카탈로그 / 태그 그래프 / 어휘 색인에 쓰이는 필드. 이것만 바뀐 곡은 재임베딩 없이 갱신합니다.
+METADATA_FIELDS = ('spotify_id', 'title', 'artist', 'album_cover_url', 'tags_normalized', 'lyrics')
+
+
+def content_hash(record: Dict[str, Any]) -> str:
+    return hashlib.sha1(f"{record.get('lyrics_cleaned', '')}\0{record.get('summary', '')}".encode('utf-8')).hexdigest()
+
+
+def metadata_hash(record: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps([record.get(field) for field in METADATA_FIELDS], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def split_lines(lyrics_cleaned: str) -> List[str]:
+    lines, seen = [], set()
+    for line in (lyrics_cleaned or "").split('\n'):
+        line = line.strip()
+        if line and line not in seen:
+            seen.add(line)
+            lines.append(line)
+    return lines
+
+
+@contextmanager
+def store_lock(store_dir: str):
+    """같은 STORE_DIR 에 여러 워커 프로세스가 동시에 새 버전을 쓰지 않도록 잠급니다."""
+    os.makedirs(store_dir, exist_ok=True)
+    with _ingest_lock, open(os.path.join(store_dir, LOCK_FILE), 'w') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _updated_index(name: str, old_index, old_embeddings: np.ndarray, new_embeddings: np.ndarray, index_dir: str, appended_only: bool):
+    """기존 행이 그대로면 기존 인덱스를 복제해 새 행만 추가하고, 아니면 (재임베딩 없이) 인덱스만 다시 만듭니다."""
+    index_type = configured_index_type(name)
+    if not appended_only or old_index is None:
+        return load_or_build_index(name, new_embeddings, index_type, index_dir)
+    # memory-map 으로 읽은 인덱스는 직접 수정할 수 없으므로 직렬화해서 소유권 있는 사본을 만듭니다.
+    index = faiss.deserialize_index(faiss.serialize_index(old_index))
+    index.add(np.ascontiguousarray(new_embeddings[len(old_embeddings):], dtype='float32'))
+    save_index(index, index_path(index_dir, name, new_embeddings, index_type))
+    return index
+
+
+def ingest_songs(records: List[Dict[str, Any]], encode: Callable[[List[str]], np.ndarray], store_dir: str = STORE_DIR,
+                 base: SearchSnapshot = None) -> Dict[str, Any]:
+    """records 중 새 곡과 내용이 바뀐 곡만 임베딩해 새 버전을 만들고 manifest 를 갱신합니다.
+    제목 / 태그 / 앨범 커버 같은 메타데이터만 바뀐 곡은 임베딩을 그대로 두고 카탈로그, 추천 그래프, 어휘 색인만 다시 만듭니다.
+
+    base 로 현재 서비스 중인 스냅샷을 넘기면 (현재 버전과 같을 때) 다시 읽지 않고 재사용합니다.
+    """
+    with store_lock(store_dir):
+        base_paths = current_paths(store_dir)
+        if base is None or base.version != base_paths.version:
+            base = SearchSnapshot.load(base_paths)
+        with open(base.catalog.source_path, 'r', encoding='utf-8') as f:
+            song_records = json.load(f)
+
+        position = {}
+        for i, record in enumerate(song_records):
+            for key in song_keys(record):
+                position.setdefault(key, i)
+        added, changed, updated = [], [], []
+        for record in records:
+            keys = song_keys(record)
+            song_idx = next((position[key] for key in keys if key in position), None)
+            if song_idx is None:
+                song_idx = len(song_records)
+                song_records.append(record)
+                added.append(song_idx)
+            elif content_hash(song_records[song_idx]) != content_hash(record):
+                song_records[song_idx] = record
+                changed.append(song_idx)
+            elif metadata_hash(song_records[song_idx]) != metadata_hash(record):
+                song_records[song_idx] = record
+                updated.append(song_idx)
+            for key in keys:
+                position.setdefault(key, song_idx)
+
+        if not added and not changed and not updated:
+            logger.info("변경된 곡이 없어 새 버전을 만들지 않습니다.")
+            return {"version": None, "added": 0, "changed": 0, "updated": 0}
+
+        touched = sorted(added + changed)
+        logger.info(f"증분 적재: 새 곡 {len(added)}, 변경 {len(changed)} -> {len(touched)}곡 임베딩, 메타데이터만 변경 {len(updated)}곡")
+
+        song_embeddings = np.concatenate([base.song_embeddings, np.zeros((len(added), base.song_embeddings.shape[1]), dtype='float32')])
+        summary_embeddings = np.concatenate([base.summary_embeddings, np.zeros((len(added), base.summary_embeddings.shape[1]), dtype='float32')])
+        if touched:
+            song_embeddings[touched] = encode([song_records[i].get('lyrics_cleaned', '') for i in touched])
+            summary_embeddings[touched] = encode([song_records[i].get('summary', '') for i in touched])
+
+        new_lines = {i: split_lines(song_records[i].get('lyrics_cleaned', '')) for i in touched}
+        flat_lines = [line for i in touched for line in new_lines[i]]
+        flat_embeddings = encode(flat_lines) if flat_lines else np.zeros((0, base.line_embeddings.shape[1]), dtype='float32')
+
+        texts, line_song_idx, line_rows = [], [], []
+        offset = 0
+        for song_idx in range(len(song_records)):
+            if song_idx in new_lines:
+                count = len(new_lines[song_idx])
+                texts.extend(new_lines[song_idx])
+                line_rows.append(flat_embeddings[offset:offset + count])
+                offset += count
+            else:
+                start, end = base.line_store.song_range(song_idx)
+                count = end - start
+                texts.extend(base.line_store.text(i) for i in range(start, end))
+                line_rows.append(base.line_embeddings[start:end])
+            line_song_idx.extend([song_idx] * count)
+        line_store = LineStore.from_lines(texts, line_song_idx, np.concatenate(line_rows))
+
+        manifest = read_manifest(store_dir) or {"current": None, "versions": []}
+        version = f"v{len(manifest['versions']) + 1:04d}"
+        paths = ArtifactPaths.for_version(store_dir, version)
+        os.makedirs(os.path.dirname(paths.catalog), exist_ok=True)
+
+        with open(paths.song_metadata, 'w', encoding='utf-8') as f:
+            json.dump(song_records, f, ensure_ascii=False)
+        catalog = Catalog([Song.from_record(record) for record in song_records], source_path=paths.song_metadata)
+        catalog.save(paths.catalog)
+        line_store.save(paths.line_store_dir)
+        np.save(paths.song_embeddings, song_embeddings)
+        np.save(paths.summary_embeddings, summary_embeddings)
+
+        appended_only = not changed
+        _updated_index("line", base.line_index, base.line_embeddings, line_store.embeddings, paths.index_dir, appended_only)
+        _updated_index("song", base.song_index, base.song_embeddings, song_embeddings, paths.index_dir, appended_only)
+        _updated_index("summary", base.summary_index, base.summary_embeddings, summary_embeddings, paths.index_dir, appended_only)
+        RecommendationGraph.build(song_embeddings, summary_embeddings, catalog.tag_matrix).save(paths.recommendation_graph)
+        build_lexical_index(line_store, catalog).save(paths.lexical_index_dir)
+
+        manifest['versions'].append({
+            "version": version,
+            "parent": base_paths.version,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "songs": len(song_records),
+            "lines": len(line_store),
+            "added": len(added),
+            "changed": len(changed),
+            "updated": len(updated),
+        })
+        manifest['current'] = version
+        write_manifest(manifest, store_dir)
+        logger.info(f"새 버전 {version} 생성 완료 ({len(song_records)}곡, {len(line_store)}개의 라인)")
+        return {"version": version, "added": len(added), "changed": len(changed), "updated": len(updated)}
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(description="새 곡 / 변경된 곡만 임베딩해 검색 데이터의 새 버전을 만듭니다.")
+    parser.add_argument("songs", help="song_metadata.json 형식의 곡 목록 JSON 파일")
+    parser.add_argument("--store", default=STORE_DIR)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    from encoder import BatchEncoder, MODEL_NAME
+
+    with open(args.songs, 'r', encoding='utf-8') as f:
+        new_records = json.load(f)
+    encoder = BatchEncoder(SentenceTransformer(MODEL_NAME))
+    print(json.dumps(ingest_songs(new_records, encoder.encode_now, args.store), ensure_ascii=False))
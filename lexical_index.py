@@ -0,0 +1,278 @@
+"""가사 라인, 한글 발음 표기, 곡 제목에 대한 문자 n-gram BM25 역색인.
+
+STT 전사 결과가 가나 표기가 다르거나 한글 음차로 나오면 임베딩 모델은 원문 가사와 잘 맞추지 못하지만, 글자 단위로는
+겹치는 부분이 많습니다. 원본 lyrics 의 한글 발음 줄(catalog.transliteration_pairs)도 짝인 원문 라인을 가리키는 문서로
+넣어 한국어로 받아 적힌 전사도 찾습니다. 전사가 여러 줄에 걸치는 경우를 위해 곡마다 연속된 1 ~ WINDOW_LINES 줄을
+이어 붙인 구간도 문서로 넣습니다.
+
+텍스트는 NFKC 정규화, 소문자화, 가타카나 -> 히라가나 변환 후 공백과 문장부호를 지우고 2, 3-gram 으로 자릅니다.
+n-gram 은 crc32 로 NUM_BUCKETS 개의 버킷에 해시하므로 어휘 사전이 필요 없고, 게시 목록(CSR)은 memory-map 으로
+여러 워커가 공유합니다.
+
+    python lexical_index.py "こころ" "코코로"     # 색인 (python startup.py 가 생성) 으로 검색해 보기
+"""
+import os
+import re
+import json
+import zlib
+import hashlib
+import argparse
+import unicodedata
+from logging import getLogger, basicConfig, INFO
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from catalog import transliteration_pairs
+from line_store import LineStore
+
+logger = getLogger(__name__)
+
+NGRAM_SIZES = (2, 3)
+NUM_BUCKETS = 1 << 20
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 한 문서로 이어 붙이는 최대 연속 줄 수. 여러 줄에 걸친 전사도 한 문서의 coverage 로 판단합니다.
+WINDOW_LINES = int(os.getenv("LEXICAL_WINDOW_LINES", "3"))
+# 쿼리 n-gram (idf 가중) 중 이 비율 이상이 한 문서에 있어야 식별 후보로 씁니다.
+MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.5"))
+
+META_FILE = "meta.json"
+ARRAYS = ("term_offsets", "postings_doc", "postings_weight", "idf", "doc_song", "doc_line", "doc_idf")
+
+_KANA_FOLD = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text: str) -> str:
+    return _NON_WORD.sub('', unicodedata.normalize('NFKC', text).lower().translate(_KANA_FOLD))
+
+
+def term_counts(text: str) -> dict:
+    """정규화한 텍스트의 n-gram 버킷별 등장 횟수. 가장 짧은 n 보다 짧으면 텍스트 전체를 한 토큰으로 씁니다."""
+    text = normalize(text)
+    grams = [text[i:i + n] for n in NGRAM_SIZES for i in range(len(text) - n + 1)] or ([text] if text else [])
+    counts = {}
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode('utf-8')) & (NUM_BUCKETS - 1)
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+def song_readings(catalog) -> List[List[Tuple[str, str]]]:
+    """곡마다 원본 lyrics 의 (원문 줄, 한글 발음 줄) 목록. 서버에서 쓰지 않는 전체 가사를 catalog.lyrics() 로 캐시해
+    두지 않도록 원본 JSON 을 직접 읽습니다."""
+    if not catalog.source_path or not os.path.exists(catalog.source_path):
+        return []
+    with open(catalog.source_path, 'r', encoding='utf-8') as f:
+        records = json.load(f)[:len(catalog)]
+    return [transliteration_pairs(record.get('lyrics', '')) for record in records]
+
+
+def readings_digest(catalog) -> str:
+    """한글 발음 줄의 입력인 원본 JSON 파일의 해시. 저장된 색인이 최신인지 확인할 때 가사를 파싱하지 않도록
+    파일 바이트만 읽고, 발음 줄은 색인을 다시 만들 때만 song_readings 로 구합니다."""
+    if not catalog.source_path or not os.path.exists(catalog.source_path):
+        return ""
+    digest = hashlib.sha1()
+    with open(catalog.source_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{len(catalog)}:{digest.hexdigest()}"
+
+
+def _readings_content_digest(readings: Sequence[Sequence[Tuple[str, str]]]) -> str:
+    digest = hashlib.sha1()
+    for pairs in readings:
+        digest.update("\n".join(f"{original}\t{reading}" for original, reading in pairs).encode('utf-8') + b"\0")
+    return digest.hexdigest()
+
+
+def source_fingerprint(line_store: LineStore, titles: Sequence[str], readings_digest: str) -> str:
+    digest = hashlib.sha1(f"{NGRAM_SIZES}-{NUM_BUCKETS}-{BM25_K1}-{BM25_B}-{WINDOW_LINES}".encode())
+    for array in (line_store.text_blob, line_store.offsets, line_store.song_idx):
+        digest.update(np.ascontiguousarray(array).data)
+    digest.update("\n".join(titles).encode('utf-8'))
+    digest.update(readings_digest.encode())
+    return digest.hexdigest()[:12]
+
+
+def documents(line_store: LineStore, titles: Sequence[str], readings: Sequence[Sequence[Tuple[str, str]]] = ()):
+    """(문서 텍스트, 곡, 근거 라인) 목록. 곡마다 라인 저장소의 라인들과 발음 줄들을 각각 1 ~ WINDOW_LINES 줄 구간으로,
+    제목은 한 문서로 만듭니다. 근거 라인은 구간 첫 줄(발음 줄이면 짝인 원문 줄)의 저장소 인덱스이고, 제목이나 저장소에
+    없는 원문 줄이면 -1 입니다."""
+    texts, doc_song, doc_line = [], [], []
+
+    def add_windows(song_idx: int, lines: List[str], line_idxs: List[int]):
+        for window in range(1, WINDOW_LINES + 1):
+            for start in range(len(lines) - window + 1):
+                texts.append(" ".join(lines[start:start + window]))
+                doc_song.append(song_idx)
+                doc_line.append(line_idxs[start])
+
+    for song_idx in range(len(titles)):
+        start, end = line_store.song_range(song_idx)
+        lines = [line_store.text(i) for i in range(start, end)]
+        add_windows(song_idx, lines, list(range(start, end)))
+        if song_idx < len(readings) and readings[song_idx]:
+            positions = {line: start + i for i, line in enumerate(lines)}
+            add_windows(song_idx, [reading for _, reading in readings[song_idx]],
+                        [positions.get(original, -1) for original, _ in readings[song_idx]])
+        texts.append(titles[song_idx] or "")
+        doc_song.append(song_idx)
+        doc_line.append(-1)
+    return texts, np.array(doc_song, dtype=np.int32), np.array(doc_line, dtype=np.int32)
+
+
+class LexicalIndex:
+    """문서마다 곡 번호(doc_song), 근거 라인(doc_line, 제목이면 -1), n-gram idf 합(doc_idf)을 가진 BM25 색인.
+    문서 구성은 documents() 참고.
+
+    게시 목록에는 BM25 점수 기여분(idf * tf 포화 항)을 미리 계산해 두므로, 검색은 쿼리 n-gram 들의 게시 목록을
+    이어 붙여 문서별로 더하는 bincount 한 번입니다.
+    """
+
+    def __init__(self, term_offsets: np.ndarray, postings_doc: np.ndarray, postings_weight: np.ndarray, idf: np.ndarray,
+                 doc_song: np.ndarray, doc_line: np.ndarray, doc_idf: np.ndarray, source_fingerprint: str):
+        self.term_offsets = term_offsets
+        self.postings_doc = postings_doc
+        self.postings_weight = postings_weight
+        self.idf = idf
+        self.doc_song = doc_song
+        self.doc_line = doc_line
+        self.doc_idf = doc_idf
+        self.source_fingerprint = source_fingerprint
+
+    def __len__(self):
+        return len(self.doc_song)
+
+    @classmethod
+    def build(cls, line_store: LineStore, titles: Sequence[str], readings: Sequence[Sequence[Tuple[str, str]]] = (),
+              readings_digest: Optional[str] = None) -> "LexicalIndex":
+        """readings_digest 는 발음 줄을 만든 입력의 해시 (readings_digest()). 없으면 발음 줄 내용으로 만듭니다."""
+        titles = [title or "" for title in titles]
+        texts, doc_song, doc_line = documents(line_store, titles, readings)
+        terms, docs, tfs = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            counts = term_counts(text)
+            terms.extend(counts.keys())
+            tfs.extend(counts.values())
+            docs.extend([doc] * len(counts))
+            doc_lengths[doc] = sum(counts.values())
+        terms, docs, tfs = np.array(terms, dtype=np.int64), np.array(docs, dtype=np.int32), np.array(tfs, dtype=np.float32)
+
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        df = np.bincount(terms, minlength=NUM_BUCKETS)
+        term_offsets = np.zeros(NUM_BUCKETS + 1, dtype=np.int64)
+        np.cumsum(df, out=term_offsets[1:])
+
+        num_docs = len(texts)
+        idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / max(doc_lengths.mean(), 1.0))
+        weights = idf[terms] * tfs * (BM25_K1 + 1) / (tfs + length_norm[docs])
+
+        doc_idf = np.bincount(docs, weights=idf[terms], minlength=num_docs).astype(np.float32)
+        return cls(term_offsets, docs, weights.astype(np.float32), idf, doc_song, doc_line, doc_idf,
+                   source_fingerprint(line_store, titles, _readings_content_digest(readings) if readings_digest is None else readings_digest))
+
+    def search(self, texts: Sequence[str], k: int) -> List[List[Tuple[int, float, float, float]]]:
+        """쿼리마다 BM25 점수 상위 k 개 문서의 (문서 번호, 점수, coverage, 문서 coverage).
+        coverage 는 쿼리 n-gram idf 합 중 문서에 있는 비율, 문서 coverage 는 문서 n-gram idf 합 중 쿼리에 있는 비율입니다.
+        쿼리가 문서의 일부일 뿐인지 (예: 가사 줄 안의 한 단어), 문서 전체를 받아 적은 것인지를 구분하는 데 씁니다."""
+        results = []
+        for text in texts:
+            terms = np.fromiter(term_counts(text).keys(), dtype=np.int64)
+            if not len(terms):
+                results.append([])
+                continue
+            starts, ends = self.term_offsets[terms], self.term_offsets[terms + 1]
+            lengths = ends - starts
+            total = int(lengths.sum())
+            if not total:
+                results.append([])
+                continue
+            # 게시 목록 구간들을 한 번에 모읍니다: 구간 i 의 j 번째 위치 = starts[i] + j
+            positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+            docs = self.postings_doc[positions]
+            term_idf = self.idf[terms]
+            scores = np.bincount(docs, weights=self.postings_weight[positions], minlength=len(self))
+            matched = np.bincount(docs, weights=np.repeat(term_idf, lengths), minlength=len(self))
+
+            top = min(k, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.lexsort((best, -scores[best]))]
+            results.append([(int(doc), float(scores[doc]), float(matched[doc] / term_idf.sum()), float(matched[doc] / max(self.doc_idf[doc], 1e-6)))
+                            for doc in best.tolist() if scores[doc] > 0])
+        return results
+
+    @classmethod
+    def load(cls, directory: str) -> "LexicalIndex":
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in ARRAYS]
+        return cls(*arrays, source_fingerprint=stored_fingerprint(directory))
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        # 다른 워커가 memory-map 으로 읽고 있을 수 있으므로 덮어쓰지 않고 임시 파일을 바꿔 넣습니다.
+        # meta 를 마지막에 써서, 중간에 실패한 디렉터리는 load_lexical_index 가 다시 만들게 합니다.
+        for name in ARRAYS:
+            tmp_path = os.path.join(directory, f"{name}.{os.getpid()}.tmp.npy")
+            np.save(tmp_path, np.asarray(getattr(self, name)))
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        tmp_path = os.path.join(directory, f"{META_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"documents": len(self), "source_fingerprint": self.source_fingerprint}, f)
+        os.replace(tmp_path, os.path.join(directory, META_FILE))
+
+
+def stored_fingerprint(directory: str) -> Optional[str]:
+    """저장된 색인의 source_fingerprint. 색인이 없으면 None."""
+    meta_path = os.path.join(directory, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)["source_fingerprint"]
+
+
+def catalog_fingerprint(line_store: LineStore, catalog) -> str:
+    return source_fingerprint(line_store, [song.title or "" for song in catalog.songs], readings_digest(catalog))
+
+
+def build_lexical_index(line_store: LineStore, catalog) -> LexicalIndex:
+    """카탈로그의 제목과 원본 lyrics 의 한글 발음 줄로 색인을 만듭니다."""
+    return LexicalIndex.build(line_store, [song.title for song in catalog.songs], song_readings(catalog), readings_digest(catalog))
+
+
+def load_lexical_index(directory: str, line_store: LineStore, catalog) -> LexicalIndex:
+    """저장된 색인이 현재 라인 / 제목 / 원본 가사로 만든 것이면 memory-map 으로 읽고, 아니면 메모리에 새로 만듭니다."""
+    fingerprint = stored_fingerprint(directory)
+    if fingerprint == catalog_fingerprint(line_store, catalog):
+        return LexicalIndex.load(directory)
+    if fingerprint is None:
+        logger.info(f"'{directory}' 가 없어 어휘 색인을 메모리에 만듭니다. (python startup.py 로 미리 생성 가능)")
+    else:
+        logger.warning(f"'{directory}' 가 현재 라인 저장소와 맞지 않아 다시 만듭니다. (python startup.py 로 갱신)")
+    return build_lexical_index(line_store, catalog)
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(description="가사 라인 / 곡 제목 n-gram BM25 색인으로 쿼리를 검색해 봅니다. (색인이 없으면 생성)")
+    parser.add_argument("query", nargs="+")
+    parser.add_argument("--store", default=None, help="STORE_DIR (기본값: 환경 변수 또는 store)")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from catalog import Catalog
+    from snapshot import STORE_DIR, current_paths
+    from startup import prepare_artifacts
+    paths = current_paths(args.store or STORE_DIR)
+    prepare_artifacts(paths)
+    line_store, index = LineStore.load(paths.line_store_dir), LexicalIndex.load(paths.lexical_index_dir)
+    titles = [song.title for song in Catalog.load(paths.catalog).songs]
+    for query, hits in zip(args.query, index.search(args.query, args.k)):
+        for doc, score, coverage, doc_coverage in hits:
+            line_idx = int(index.doc_line[doc])
+            text = line_store.text(line_idx) if line_idx >= 0 else f"[{titles[index.doc_song[doc]]}]"
+            print(f"{query}\t{score:.2f}\t{coverage:.2f}\t{doc_coverage:.2f}\t{text}")
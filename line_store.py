@@ -0,0 +1,115 @@
+import os
+import json
+import argparse
+from logging import getLogger, basicConfig, INFO
+from typing import List, Dict, Any
+
+import numpy as np
+
+logger = getLogger(__name__)
+
+TEXT_FILE = "lines.bin"
+OFFSETS_FILE = "line_offsets.npy"
+SONG_IDX_FILE = "line_song_idx.npy"
+EMBEDDINGS_FILE = "line_embeddings.npy"
+
+
+class LineStore:
+    """곡별로 중복을 제거한 가사 라인 저장소.
+
+    라인 텍스트는 UTF-8 바이트를 이어붙인 파일과 오프셋 배열로, 곡 매핑은 int32 배열로,
+    임베딩은 memory-mapped 배열로 보관합니다. 라인은 곡 순서로 정렬되어 있어 곡 s 의 라인은
+    [song_offsets[s], song_offsets[s + 1]) 연속 구간이고, 그 임베딩은 복사 없는 슬라이스로 읽습니다.
+    """
+
+    def __init__(self, text_blob, offsets: np.ndarray, song_idx: np.ndarray, embeddings: np.ndarray):
+        self.text_blob = text_blob
+        self.offsets = offsets
+        self.song_idx = song_idx
+        self.embeddings = embeddings
+        num_songs = int(song_idx[-1]) + 1 if len(song_idx) else 0
+        self.song_offsets = np.searchsorted(song_idx, np.arange(num_songs + 1), side='left').astype(np.int64)
+
+    def __len__(self):
+        return len(self.song_idx)
+
+    def text(self, i: int) -> str:
+        return bytes(self.text_blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    @classmethod
+    def from_lines(cls, texts: List[str], song_idx, embeddings: np.ndarray) -> "LineStore":
+        song_idx = np.asarray(song_idx, dtype=np.int32)
+        if len(song_idx) and (np.diff(song_idx) < 0).any():
+            order = np.argsort(song_idx, kind='stable')
+            texts, song_idx, embeddings = [texts[i] for i in order], song_idx[order], np.asarray(embeddings)[order]
+        encoded = [text.encode('utf-8') for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets,
+                   song_idx, np.ascontiguousarray(embeddings, dtype='float32'))
+
+    @classmethod
+    def from_metadata(cls, line_metadata: List[Dict[str, Any]], line_embeddings: np.ndarray) -> "LineStore":
+        seen = set()
+        keep = []
+        for i, meta in enumerate(line_metadata):
+            key = (meta['original_song_index'], meta['line_text'])
+            if key in seen:
+                continue
+            seen.add(key)
+            keep.append(i)
+
+        logger.info(f"라인 중복 제거: {len(line_metadata)} -> {len(keep)}")
+        return cls.from_lines([line_metadata[i]['line_text'] for i in keep],
+                              [line_metadata[i]['original_song_index'] for i in keep],
+                              line_embeddings[keep])
+
+    def song_ranges(self, song_idxs: np.ndarray):
+        """곡마다 라인들의 [start, end) 범위. 라인이 없는 곡은 start == end 입니다."""
+        last = len(self.song_offsets) - 1
+        song_idxs = np.asarray(song_idxs, dtype=np.int64)
+        return self.song_offsets[np.minimum(song_idxs, last)], self.song_offsets[np.minimum(song_idxs + 1, last)]
+
+    def song_range(self, song_idx: int):
+        starts, ends = self.song_ranges(np.array([song_idx]))
+        return int(starts[0]), int(ends[0])
+
+    def song_embeddings(self, song_idx: int) -> np.ndarray:
+        start, end = self.song_range(song_idx)
+        return self.embeddings[start:end]
+
+    @classmethod
+    def load(cls, directory: str) -> "LineStore":
+        text_path = os.path.join(directory, TEXT_FILE)
+        text_blob = np.memmap(text_path, dtype=np.uint8, mode='r') if os.path.getsize(text_path) else np.zeros(0, dtype=np.uint8)
+        return cls(
+            text_blob,
+            np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode='r'),
+            np.load(os.path.join(directory, SONG_IDX_FILE), mmap_mode='r'),
+            np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode='r'))
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, TEXT_FILE), 'wb') as f:
+            f.write(bytes(self.text_blob))
+        np.save(os.path.join(directory, OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64))
+        np.save(os.path.join(directory, SONG_IDX_FILE), np.asarray(self.song_idx, dtype=np.int32))
+        np.save(os.path.join(directory, EMBEDDINGS_FILE), np.asarray(self.embeddings, dtype='float32'))
+
+
+def build(metadata_path: str, embeddings_path: str, out_dir: str):
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        line_metadata = json.load(f)
+    store = LineStore.from_metadata(line_metadata, np.load(embeddings_path))
+    store.save(out_dir)
+    logger.info(f"라인 저장소 생성 완료: {out_dir} ({len(store)}개 라인)")
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(description="line_metadata.json 과 line_embeddings.npy 로 중복 제거된 라인 저장소를 만듭니다.")
+    parser.add_argument("--metadata", default="line_metadata.json")
+    parser.add_argument("--embeddings", default="line_embeddings.npy")
+    parser.add_argument("--out", default="line_store")
+    args = parser.parse_args()
+    build(args.metadata, args.embeddings, args.out)
@@ -0,0 +1,257 @@
+"""가벼운 요청 추적과 Prometheus 텍스트 형식 지표.
+
+- span(stage): 구간 시간을 stage 히스토그램에 기록하고, 현재 요청의 trace 에도 남깁니다. (Server-Timing / 느린 요청 로그)
+  trace 는 contextvars 로 전달되므로 run_in_threadpool 안에서 연 span 도 같은 요청에 잡힙니다.
+- REGISTRY.render(): GET /metrics 응답 본문.
+- StackSampler: 느린 요청 진단용 샘플링 프로파일러. 외부 의존성 없이 모든 스레드의 스택을 주기적으로 모아
+  flamegraph.pl / speedscope 에서 읽을 수 있는 collapsed stack 형식으로 저장합니다.
+"""
+import os
+import sys
+import time
+import bisect
+import random
+import threading
+import contextvars
+from collections import Counter as StackCounter, defaultdict
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = getLogger(__name__)
+
+PREFIX = "songfinder_"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values = defaultdict(float)
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(v)}" for labels, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, *labels, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        lines = self.header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """등록된 지표와, /metrics 를 읽을 때마다 값을 새로 읽어 오는 collector (캐시 / 인덱스 상태 등)."""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], List[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[Metric]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                for metric in collector():
+                    lines.extend(metric.render())
+            except Exception as e:
+                logger.warning(f"지표 수집 실패: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram("stage_seconds", "Time spent in each request stage.", ["stage"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram("request_seconds", "HTTP request latency.", ["route", "method", "status"]))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge("requests_in_flight", "HTTP requests currently being processed.", ["route"]))
+STAGE_ERRORS = REGISTRY.register(Counter("stage_errors_total", "Stages that raised an exception.", ["stage"]))
+
+
+def start_trace() -> Tuple[List[Tuple[str, float]], contextvars.Token]:
+    trace = []
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: contextvars.Token):
+    _current_trace.reset(token)
+
+
+def current_trace() -> List[Tuple[str, float]]:
+    return _current_trace.get() or []
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(stage, value=seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((stage, seconds))
+
+
+def stage_totals(trace: List[Tuple[str, float]]) -> Dict[str, float]:
+    """같은 stage 가 여러 번 열렸으면 합쳐서, 처음 열린 순서대로 돌려줍니다."""
+    totals = {}
+    for stage, seconds in trace:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return totals
+
+
+def server_timing(trace: List[Tuple[str, float]]) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stage_totals(trace).items())
+
+
+IDLE_FUNCTIONS = {"wait", "select", "poll", "_wait_for_tstate_lock", "accept", "_worker"}
+
+
+class StackSampler:
+    """interval 마다 모든 스레드의 파이썬 스택을 모읍니다. (자신과 대기 중인 스레드는 제외)"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or frame.f_code.co_name in IDLE_FUNCTIONS:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class SlowRequestProfiler:
+    """sample_rate 비율의 요청을 StackSampler 로 샘플링하고, threshold 보다 오래 걸린 요청만 profile_dir 에 저장합니다."""
+
+    def __init__(self, threshold_ms: float, sample_rate: float, profile_dir: str):
+        self.threshold = threshold_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+
+    @classmethod
+    def from_env(cls) -> Optional["SlowRequestProfiler"]:
+        threshold_ms = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+        sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0.1"))
+        if threshold_ms <= 0 or sample_rate <= 0:
+            return None
+        return cls(threshold_ms, sample_rate, os.getenv("PROFILE_DIR", "profiles"))
+
+    def start(self) -> Optional[StackSampler]:
+        if random.random() >= self.sample_rate:
+            return None
+        return StackSampler().start()
+
+    def finish(self, sampler: Optional[StackSampler], route: str, seconds: float):
+        if sampler is None:
+            return
+        sampler.stop()
+        if seconds < self.threshold or not sampler.stacks:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{route.strip('/').replace('/', '_') or 'root'}-{seconds * 1000:.0f}ms.collapsed")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(sampler.collapsed())
+        logger.warning(f"느린 요청 프로파일 저장: {path}")
@@ -0,0 +1,202 @@
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from logging import getLogger
+from typing import Any, Iterable
+
+logger = getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def artifact_generation(paths: Iterable[str], settings: Iterable[str] = ()) -> str:
+    """인덱스/메타데이터 파일들의 경로, 크기, 수정 시각과 검색 설정값으로 만든 버전 문자열. 하나라도 바뀌면 캐시가 무효화됩니다."""
+    digest = hashlib.sha1("\n".join(settings).encode())
+    for path in paths:
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        for file_path in files:
+            if os.path.isfile(file_path):
+                stat = os.stat(file_path)
+                digest.update(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+class MemoryBackend:
+    """프로세스 내 LRU + TTL 캐시."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, 0
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None, 1
+            self._entries.move_to_end(key)
+            return value, 0
+
+    def set(self, key: str, value: bytes) -> int:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self, keep: Iterable[str]):
+        """keep 의 generation 으로 시작하지 않는 항목을 지웁니다."""
+        prefixes = tuple(f"{generation}:" for generation in keep)
+        with self._lock:
+            for key in [key for key in self._entries if not key.startswith(prefixes)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """여러 uvicorn 워커가 함께 쓰는 로컬 SQLite 파일 캐시."""
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, value BLOB, expires REAL, last_access REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS query_cache_last_access ON query_cache (last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute("SELECT value, expires FROM query_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, 0
+            if row[1] < now:
+                conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+                return None, 1
+            conn.execute("UPDATE query_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0], 0
+
+    def set(self, key: str, value: bytes) -> int:
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?)", (key, value, now + self.ttl, now))
+            overflow = conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute("DELETE FROM query_cache WHERE key IN (SELECT key FROM query_cache ORDER BY last_access LIMIT ?)", (overflow,))
+            return max(overflow, 0)
+
+    def clear(self, keep: Iterable[str]):
+        """keep 의 generation 으로 시작하지 않는 항목을 지웁니다."""
+        keep = list(keep)
+        with self._connection() as conn:
+            conn.execute("DELETE FROM query_cache WHERE " + " AND ".join(["key NOT LIKE ?"] * len(keep)),
+                         [f"{generation}:%" for generation in keep])
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+
+
+class QueryCache:
+    """정규화된 쿼리 문자열 -> 임베딩, 검색 결과 두 단계 캐시.
+
+    검색 결과 키 앞에는 watch_paths 파일들과 settings (인덱스 종류 등) 의 generation 을 붙여 두고, 바뀌면 이전 generation
+    항목을 지웁니다. 임베딩은 인덱스가 아니라 모델에만 달려 있으므로 embedding_settings (모델 이름) 로 만든 별도의
+    generation 을 써서, 새 버전을 적재해도 자주 쓰는 쿼리를 다시 인코딩하지 않습니다.
+    적중 / 실패 횟수는 임베딩 단계와 검색 결과(payload) 단계를 따로 셉니다.
+    """
+
+    LAYERS = ("embedding", "payload")
+
+    def __init__(self, backend, watch_paths: Iterable[str] = (), settings: Iterable[str] = (), check_interval: float = 5.0,
+                 embedding_settings: Iterable[str] = ()):
+        self.backend = backend
+        self.watch_paths = list(watch_paths)
+        self.settings = list(settings)
+        self.check_interval = check_interval
+        self.generation = artifact_generation(self.watch_paths, self.settings)
+        self.embedding_generation = "embedding-" + artifact_generation((), embedding_settings)
+        self._checked_at = time.time()
+        self._generation_lock = threading.Lock()
+        self.hits = dict.fromkeys(self.LAYERS, 0)
+        self.misses = dict.fromkeys(self.LAYERS, 0)
+        self.evictions = 0
+
+    def _key(self, namespace: str, text: str) -> str:
+        now = time.time()
+        # 스레드풀의 여러 요청이 동시에 확인해도 파일 stat / 캐시 비우기는 한 번만 합니다.
+        if now - self._checked_at > self.check_interval and self._generation_lock.acquire(blocking=False):
+            try:
+                self._checked_at = now
+                generation = artifact_generation(self.watch_paths, self.settings)
+                if generation != self.generation:
+                    logger.info(f"인덱스 파일 변경 감지, 쿼리 캐시를 비웁니다. ({self.generation} -> {generation})")
+                    self.generation = generation
+                    self.backend.clear((generation, self.embedding_generation))
+            finally:
+                self._generation_lock.release()
+        generation = self.embedding_generation if namespace == "embedding" else self.generation
+        return f"{generation}:{namespace}:{normalize_query(text)}"
+
+    def get(self, namespace: str, text: str) -> Any:
+        value, expired = self.backend.get(self._key(namespace, text))
+        self.evictions += expired
+        layer = "embedding" if namespace == "embedding" else "payload"
+        if value is None:
+            self.misses[layer] += 1
+            return None
+        self.hits[layer] += 1
+        return pickle.loads(value)
+
+    def set(self, namespace: str, text: str, value: Any):
+        self.evictions += self.backend.set(self._key(namespace, text), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get_embedding(self, text: str):
+        return self.get("embedding", text)
+
+    def set_embedding(self, text: str, vector):
+        self.set("embedding", text, vector)
+
+    def stats(self):
+        return {"backend": type(self.backend).__name__, "generation": self.generation,
+                "embedding_generation": self.embedding_generation, "entries": len(self.backend),
+                "hits": dict(self.hits), "misses": dict(self.misses), "evictions": self.evictions}
+
+
+def create_query_cache(watch_paths: Iterable[str], settings: Iterable[str] = (), embedding_settings: Iterable[str] = ()):
+    backend_name = os.getenv("QUERY_CACHE_BACKEND", "memory")
+    max_entries = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "10000"))
+    ttl = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+    if backend_name == "off":
+        return None
+    if backend_name == "sqlite":
+        backend = SQLiteBackend(os.getenv("QUERY_CACHE_PATH", "query_cache.sqlite3"), max_entries, ttl)
+    else:
+        backend = MemoryBackend(max_entries, ttl)
+    return QueryCache(backend, watch_paths, settings, embedding_settings=embedding_settings)
@@ -0,0 +1,121 @@
+import os
+import hashlib
+import argparse
+from logging import getLogger, basicConfig, INFO
+from typing import List, Tuple
+
+import numpy as np
+
+from ann_index import build_index, fingerprint
+from catalog import Catalog
+from scoring import TagMatrix, HitSource, fuse_candidates, REASON_SONG, REASON_SUMMARY
+
+logger = getLogger(__name__)
+
+NEIGHBORS_PER_INDEX = 10
+
+
+def rank_candidates(I_song, D_song, I_summary, D_summary, tag_matrix: TagMatrix, song_idx: int,
+                    weights=(0.5, 0.3, 0.2)) -> List[Tuple[int, float, int]]:
+    """곡/요약 이웃 목록과 태그 겹침으로 후보 곡을 점수순으로 정렬해 (곡 인덱스, 점수, 추천 사유 플래그) 목록을 돌려줍니다."""
+    weight_song, weight_summary, weight_tag = weights
+    candidates, scores, flags = fuse_candidates(song_idx, [
+        HitSource(I_song, D_song, weight_song, REASON_SONG),
+        HitSource(I_summary, D_summary, weight_summary, REASON_SUMMARY),
+    ], tag_matrix, weight_tag)
+    return list(zip(candidates.tolist(), scores.tolist(), flags.tolist()))
+
+
+class RecommendationGraph:
+    """곡마다 미리 계산해 둔 추천 이웃 목록.
+
+    song_* / summary_* 는 각 인덱스의 top-10 검색 결과 그대로이고,
+    neighbors / scores / reasons 는 그 결과를 텍스트 검색 가중치로 합친 최종 순위입니다. (빈 칸은 -1)
+    """
+
+    FIELDS = ("song_neighbors", "song_scores", "summary_neighbors", "summary_scores", "neighbors", "scores", "reasons")
+
+    def __init__(self, song_neighbors, song_scores, summary_neighbors, summary_scores, neighbors, scores, reasons, source_fingerprint: str):
+        self.song_neighbors = song_neighbors
+        self.song_scores = song_scores
+        self.summary_neighbors = summary_neighbors
+        self.summary_scores = summary_scores
+        self.neighbors = neighbors
+        self.scores = scores
+        self.reasons = reasons
+        self.source_fingerprint = source_fingerprint
+
+    def __len__(self):
+        return len(self.neighbors)
+
+    def neighbor_lists(self, song_idx: int):
+        """index.search 결과와 같은 모양의 (D_song, I_song, D_summary, I_summary) 를 돌려줍니다."""
+        return (self.song_scores[song_idx:song_idx+1], self.song_neighbors[song_idx:song_idx+1],
+                self.summary_scores[song_idx:song_idx+1], self.summary_neighbors[song_idx:song_idx+1])
+
+    def ranked(self, song_idx: int) -> List[Tuple[int, float, int]]:
+        valid = self.neighbors[song_idx] >= 0
+        return list(zip(self.neighbors[song_idx][valid].tolist(),
+                        self.scores[song_idx][valid].tolist(),
+                        self.reasons[song_idx][valid].tolist()))
+
+    @classmethod
+    def build(cls, song_embeddings: np.ndarray, summary_embeddings: np.ndarray, tag_matrix: TagMatrix,
+              k: int = NEIGHBORS_PER_INDEX) -> "RecommendationGraph":
+        num_songs = len(song_embeddings)
+        D_song, I_song = build_index(song_embeddings).search(np.ascontiguousarray(song_embeddings, dtype='float32'), k)
+        D_summary, I_summary = build_index(summary_embeddings).search(np.ascontiguousarray(summary_embeddings, dtype='float32'), k)
+
+        neighbors = np.full((num_songs, 2 * k), -1, dtype=np.int32)
+        scores = np.zeros((num_songs, 2 * k), dtype=np.float32)
+        reasons = np.zeros((num_songs, 2 * k), dtype=np.uint8)
+        for song_idx in range(num_songs):
+            ranked = rank_candidates(I_song[song_idx], D_song[song_idx], I_summary[song_idx], D_summary[song_idx], tag_matrix, song_idx)
+            for j, (idx, score, flags) in enumerate(ranked):
+                neighbors[song_idx, j], scores[song_idx, j], reasons[song_idx, j] = idx, score, flags
+
+        return cls(I_song.astype(np.int32), D_song.astype(np.float32), I_summary.astype(np.int32), D_summary.astype(np.float32),
+                   neighbors, scores, reasons, source_fingerprint(song_embeddings, summary_embeddings, tag_matrix))
+
+    @classmethod
+    def load(cls, path: str) -> "RecommendationGraph":
+        with np.load(path) as data:
+            return cls(*(data[name] for name in cls.FIELDS), source_fingerprint=str(data["source_fingerprint"]))
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, source_fingerprint=np.array(self.source_fingerprint), **{name: getattr(self, name) for name in self.FIELDS})
+        os.replace(tmp_path, path)
+
+
+def source_fingerprint(song_embeddings: np.ndarray, summary_embeddings: np.ndarray, tag_matrix: TagMatrix) -> str:
+    # 저장된 scores / reasons 에는 태그 겹침 가산점이 들어 있으므로 태그가 바뀌어도 다시 만들어야 합니다.
+    tags = hashlib.sha1(str(tag_matrix.bits.shape).encode())
+    tags.update(np.ascontiguousarray(tag_matrix.bits).data)
+    return f"{fingerprint(song_embeddings)}-{fingerprint(summary_embeddings)}-{tags.hexdigest()[:12]}"
+
+
+def load_graph(path: str, song_embeddings: np.ndarray, summary_embeddings: np.ndarray, tag_matrix: TagMatrix):
+    """그래프 파일이 있고 현재 임베딩 / 태그로 만든 것이면 불러오고, 아니면 None 을 돌려줍니다. (실시간 검색으로 대체)"""
+    if not os.path.exists(path):
+        return None
+    graph = RecommendationGraph.load(path)
+    if graph.source_fingerprint != source_fingerprint(song_embeddings, summary_embeddings, tag_matrix):
+        logger.warning(f"'{path}' 가 현재 임베딩 / 태그와 맞지 않아 사용하지 않습니다. (python recommendation_graph.py 로 다시 생성)")
+        return None
+    return graph
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(description="전체 곡에 대한 추천 이웃 그래프를 미리 계산합니다.")
+    parser.add_argument("--songs", default="song_metadata.json")
+    parser.add_argument("--song-embeddings", default="song_embeddings.npy")
+    parser.add_argument("--summary-embeddings", default="summary_embeddings.npy")
+    parser.add_argument("--out", default="recommendation_graph.npz")
+    args = parser.parse_args()
+
+    tag_matrix = Catalog.from_metadata(args.songs).tag_matrix
+    graph = RecommendationGraph.build(np.load(args.song_embeddings), np.load(args.summary_embeddings), tag_matrix)
+    graph.save(args.out)
+    logger.info(f"추천 그래프 생성 완료: {args.out} ({len(graph)}곡)")
@@ -0,0 +1,122 @@
+"""후보 곡의 가사 라인으로 추천 순위를 다시 매기고 근거 가사(matchLine)를 고릅니다.
+
+라인 저장소는 곡 순서로 정렬되어 있어 한 곡의 라인은 임베딩 행렬의 연속 구간입니다. 후보 곡마다 그 구간을
+복사 없이 잘라 쿼리들과 행렬곱으로 유사도를 구하고, 연속된 window 줄의 평균 유사도 최댓값을 매칭 점수로 씁니다.
+한 줄만 우연히 비슷한 곡보다 여러 줄이 이어서 비슷한 곡이 앞에 옵니다.
+"""
+import os
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from line_store import LineStore
+
+MATCH_WINDOW = int(os.getenv("LINE_MATCH_WINDOW", "2"))
+MATCH_WEIGHT = float(os.getenv("LINE_MATCH_WEIGHT", "0.3"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+
+
+def window_scores(similarities: np.ndarray, segment_starts: np.ndarray, window: int) -> np.ndarray:
+    """(쿼리 x 라인) 유사도에서 각 위치부터 window 줄의 평균. 곡(구간) 경계를 넘는 위치는 -inf 이고,
+    window 보다 짧은 곡은 첫 위치에 곡 전체 평균을 둡니다.
+
+    배치 전체의 누적합을 쓰면 float32 반올림 오차가 앞 구간들에 따라 달라지므로, 창마다 같은 원소를 같은 순서로
+    더해 배치 구성과 상관없이 같은 점수가 나오게 합니다. (window 는 몇 줄이라 비용은 O(window x 라인 수))
+    """
+    num_lines = similarities.shape[1]
+    lengths = np.diff(segment_starts)
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    segment_end = segment_starts[1:][segment]
+    positions = np.arange(num_lines)
+    window_end = np.minimum(positions + window, segment_end)
+
+    totals = np.zeros(similarities.shape, dtype=similarities.dtype)
+    for offset in range(min(window, num_lines)):
+        inside = (positions + offset < window_end)[:num_lines - offset]
+        totals[:, :num_lines - offset] += np.where(inside, similarities[:, offset:], 0)
+    scores = totals / (window_end - positions).astype(similarities.dtype)
+    valid = (positions + window <= segment_end) | (positions == segment_starts[:-1][segment])
+    scores[:, ~valid] = -np.inf
+    return scores
+
+
+class LineMatches:
+    """쿼리마다 주어진 후보 곡들의 window 매칭 점수와 근거 라인.
+
+    (곡, 쿼리) 쌍을 곡 순서로 모아, 곡마다 그 곡을 후보로 가진 쿼리들과 한 번의 행렬곱을 합니다.
+    곡의 라인 임베딩은 복사 없는 슬라이스이고, 배치 안에서 같은 곡은 한 번만 읽습니다.
+    """
+
+    def __init__(self, line_store: LineStore, query_vectors: np.ndarray, candidates: Sequence[Sequence[int]], window: int = MATCH_WINDOW):
+        self.line_store = line_store
+        self.query_vectors = np.asarray(query_vectors, dtype='float32')
+        self.window = window
+
+        rows = np.concatenate([np.full(len(songs), row, dtype=np.int64) for row, songs in enumerate(candidates)] or [np.zeros(0, dtype=np.int64)])
+        songs = np.concatenate([np.asarray(songs, dtype=np.int64) for songs in candidates] or [np.zeros(0, dtype=np.int64)])
+        # 곡 -> 쿼리 순으로 정렬된 키. 같은 곡의 쌍이 연속으로 모이고, searchsorted 로 쌍을 찾습니다.
+        self.num_rows = max(len(candidates), 1)
+        keys = np.unique(songs * self.num_rows + rows)
+        starts, ends = line_store.song_ranges(keys // self.num_rows)
+        keep = ends > starts
+        self.keys, self.line_starts, ends = keys[keep], starts[keep], ends[keep]
+        self.pair_starts = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        np.cumsum(ends - self.line_starts, out=self.pair_starts[1:])
+
+        self.similarities = np.empty(self.pair_starts[-1], dtype=np.float32)
+        if not len(self.keys):
+            self.window_scores = self.pair_scores = np.zeros(0, dtype=np.float32)
+            return
+        pair_songs, pair_rows = self.keys // self.num_rows, self.keys % self.num_rows
+        group_starts = np.flatnonzero(np.r_[True, pair_songs[1:] != pair_songs[:-1]]).tolist() + [len(self.keys)]
+        # memmap 이어도 np.asarray 는 같은 버퍼를 보는 ndarray 라 슬라이스마다 memmap 객체를 만들지 않습니다.
+        embeddings = np.asarray(line_store.embeddings, dtype='float32')
+        line_starts, line_ends, pair_starts = self.line_starts.tolist(), ends.tolist(), self.pair_starts.tolist()
+        for g0, g1 in zip(group_starts[:-1], group_starts[1:]):
+            block = self.query_vectors[pair_rows[g0:g1]] @ embeddings[line_starts[g0]:line_ends[g0]].T
+            self.similarities[pair_starts[g0]:pair_starts[g1]] = block.ravel()
+
+        self.window_scores = window_scores(self.similarities[None, :], self.pair_starts, window)[0]
+        self.pair_scores = np.maximum.reduceat(self.window_scores, self.pair_starts[:-1])
+
+    def _pairs(self, row: int, song_idxs: np.ndarray):
+        keys = song_idxs * self.num_rows + row
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return positions, self.keys[positions] == keys
+
+    def scores(self, row: int, song_idxs: Sequence[int]) -> np.ndarray:
+        """row 번째 쿼리에 대한 곡별 매칭 점수. 라인이 없거나 후보에 없던 곡은 0."""
+        song_idxs = np.asarray(song_idxs, dtype=np.int64)
+        if not len(self.keys):
+            return np.zeros(len(song_idxs), dtype=np.float32)
+        positions, found = self._pairs(row, song_idxs)
+        return np.where(found, self.pair_scores[positions], 0.0)
+
+    def best_line(self, row: int, song_idx: int) -> int:
+        """가장 잘 맞는 window 안에서 유사도가 가장 높은 라인의 저장소 인덱스. 라인이 없는 곡이면 -1."""
+        positions, found = self._pairs(row, np.array([song_idx], dtype=np.int64)) if len(self.keys) else ([0], [False])
+        if found[0]:
+            p = int(positions[0])
+            start, end = int(self.pair_starts[p]), int(self.pair_starts[p + 1])
+            similarities, scores, first_line = self.similarities[start:end], self.window_scores[start:end], int(self.line_starts[p])
+        else:
+            # 재정렬 대상 밖의 곡 (앞 후보들이 아티스트 중복으로 빠진 경우) 은 그 곡 라인만 따로 계산합니다.
+            first_line, end_line = self.line_store.song_range(song_idx)
+            if end_line == first_line:
+                return -1
+            similarities = np.asarray(self.line_store.embeddings[first_line:end_line], dtype='float32') @ self.query_vectors[row]
+            scores = window_scores(similarities[None, :], np.array([0, len(similarities)]), self.window)[0]
+        position = int(scores.argmax())
+        window_end = min(position + self.window, len(similarities))
+        return first_line + position + int(similarities[position:window_end].argmax())
+
+
+def rerank(candidates: List[Tuple[int, float, int]], matches: LineMatches, row: int, weight: float = MATCH_WEIGHT,
+           limit: int = RERANK_CANDIDATES) -> List[Tuple[int, float, int]]:
+    """(곡, 점수, 사유) 후보의 앞 limit 개를 점수 + weight * 매칭 점수로 다시 정렬합니다. 동점이면 기존 순서를 유지합니다."""
+    head, tail = candidates[:limit], candidates[limit:]
+    if not head:
+        return candidates
+    combined = np.array([score for _, score, _ in head]) + weight * matches.scores(row, [idx for idx, _, _ in head])
+    order = np.argsort(-combined, kind='stable')
+    return [(head[i][0], float(combined[i]), head[i][2]) for i in order.tolist()] + tail
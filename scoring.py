@@ -0,0 +1,107 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+REASON_SONG = 1
+REASON_SUMMARY = 2
+REASON_TAG = 4
+REASON_LYRIC = 8
+
+
+def reason_texts(flags: int, shared_tags: List[str]) -> List[str]:
+    texts = []
+    if flags & REASON_SONG:
+        texts.append("분위기와 장르가 비슷해요.")
+    if flags & REASON_SUMMARY:
+        texts.append("곡의 전반적인 감성이 비슷해요.")
+    if flags & REASON_LYRIC:
+        texts.append("가사가 비슷한 느낌을 줘요.")
+    if flags & REASON_TAG:
+        texts.append(f"비슷한 태그({', '.join(shared_tags)})를 공유해요.")
+    return texts
+
+
+class TagMatrix:
+    """곡 x 태그 비트마스크. 태그 겹침 여부를 비트 AND 한 번으로 계산합니다."""
+
+    def __init__(self, song_tags: Sequence[Sequence[str]]):
+        self.song_tags = [tuple(tags) for tags in song_tags]
+        self.vocabulary = sorted({tag for tags in self.song_tags for tag in tags})
+        tag_ids = {tag: i for i, tag in enumerate(self.vocabulary)}
+
+        self.bits = np.zeros((len(self.song_tags), max(1, (len(self.vocabulary) + 63) // 64)), dtype=np.uint64)
+        for song_idx, tags in enumerate(self.song_tags):
+            for tag in tags:
+                tag_id = tag_ids[tag]
+                self.bits[song_idx, tag_id >> 6] |= np.uint64(1 << (tag_id & 63))
+
+    def __len__(self):
+        return len(self.song_tags)
+
+    def overlaps(self, song_idx: int, candidates: np.ndarray) -> np.ndarray:
+        return (self.bits[candidates] & self.bits[song_idx]).any(axis=1)
+
+    def shared(self, song_idx: int, other_idx: int) -> List[str]:
+        other_tags = self.song_tags[other_idx]
+        return [tag for tag in self.song_tags[song_idx] if tag in other_tags]
+
+
+class HitSource:
+    """후보 곡 목록 하나 (인덱스 검색 결과). 유사도 * weight 와 순위 보너스 (k - rank) * rank_bonus 를 더합니다."""
+
+    __slots__ = ("song_ids", "scores", "weight", "reason", "rank_bonus")
+
+    def __init__(self, song_ids, scores, weight: float, reason: int, rank_bonus: float = 0.0):
+        self.song_ids = np.asarray(song_ids, dtype=np.int64).ravel()
+        self.scores = np.asarray(scores, dtype=np.float64).ravel()
+        self.weight = weight
+        self.reason = reason
+        self.rank_bonus = rank_bonus
+
+
+def fuse_candidates(song_idx: int, sources: Sequence[HitSource], tag_matrix: TagMatrix,
+                    tag_weight: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """여러 검색 결과를 합쳐 (후보 곡, 점수, 추천 사유 플래그) 배열을 점수 내림차순으로 돌려줍니다.
+
+    기준 곡 자신과 빈 결과(-1)는 후보에서 빠지며, 동점이면 먼저 등장한 후보가 앞에 옵니다.
+    """
+    ids, contributions, reasons = [], [], []
+    for source in sources:
+        k = len(source.song_ids)
+        ids.append(source.song_ids)
+        contributions.append(source.scores * source.weight + (k - np.arange(k)) * source.rank_bonus)
+        reasons.append(np.full(k, source.reason, dtype=np.uint8))
+    ids = np.concatenate(ids)
+    contributions = np.concatenate(contributions)
+    reasons = np.concatenate(reasons)
+
+    valid = (ids >= 0) & (ids != song_idx)
+    ids, contributions, reasons = ids[valid], contributions[valid], reasons[valid]
+    if not len(ids):
+        return ids, contributions, reasons
+
+    candidates, first_seen, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    scores = np.bincount(inverse, weights=contributions, minlength=len(candidates))
+    flags = np.zeros(len(candidates), dtype=np.uint8)
+    np.bitwise_or.at(flags, inverse, reasons)
+
+    shares_tag = tag_matrix.overlaps(song_idx, candidates)
+    scores += shares_tag * tag_weight
+    flags[shares_tag] |= REASON_TAG
+
+    order = np.lexsort((first_seen, -scores))
+    return candidates[order], scores[order], flags[order]
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[int]], k: int = 60) -> List[int]:
+    """여러 순위 목록을 항목별 1 / (k + 순위) 합으로 합쳐 내림차순으로 돌려줍니다.
+
+    점수가 아니라 순위만 쓰므로 BM25 와 코사인 유사도처럼 척도가 다른 결과도 그대로 합칠 수 있습니다.
+    동점이면 앞 목록에서 먼저 나온 항목이 앞에 옵니다.
+    """
+    scores, first_seen = {}, {}
+    for list_idx, items in enumerate(ranked_lists):
+        for rank, item in enumerate(items):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+            first_seen.setdefault(item, (list_idx, rank))
+    return sorted(scores, key=lambda item: (-scores[item], first_seen[item]))
@@ -0,0 +1,330 @@
+import os
+import json
+import argparse
+from logging import basicConfig, INFO
+from typing import List, Dict, Any, Callable, Iterator, Sequence
+
+import numpy as np
+
+from metrics import span
+from recommendation_graph import rank_candidates
+from lexical_index import MIN_COVERAGE, WINDOW_LINES, normalize
+from rerank import LineMatches, rerank, MATCH_WEIGHT, MATCH_WINDOW, RERANK_CANDIDATES
+from scoring import HitSource, fuse_candidates, reciprocal_rank_fusion, reason_texts, REASON_SONG, REASON_SUMMARY, REASON_LYRIC
+from snapshot import SearchSnapshot, STORE_DIR, current_paths
+
+BATCH_CHUNK_SIZE = 256
+# 곡 식별에 쓰는 가사 라인 벡터 검색 / 어휘 검색 결과 수. 두 목록을 곡 단위로 RRF 로 합칩니다.
+IDENTIFY_DEPTH = 10
+# 이보다 짧은 (정규화 후 글자 수) 쿼리는 너무 많은 라인에 들어 있어 어휘 검색을 쓰지 않습니다.
+LEXICAL_MIN_QUERY_CHARS = 4
+# 어휘 검색 결과만으로 (벡터 유사도 0.4 미만이어도) 곡을 식별하려면 필요한 최고 BM25 점수. 현재 카탈로그에서 원문 / 잡음 /
+# 한글 발음 가사 줄 쿼리의 99% 는 60 이상이고, "love", "chill" 같은 한 단어 쿼리는 30 ~ 40 입니다. (카탈로그 크기에 따라 idf 가 바뀜)
+LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", "45"))
+# 요약이 더 가까운 쿼리에서 어휘 결과가 요약을 이기려면, 쿼리가 가사 문서(줄 / 구간) n-gram 의 이 비율 이상을 담아야 합니다.
+# 한글 발음 줄 쿼리는 0.8 ~ 1.0 이고, "summer", "dance music" 처럼 가사 줄 안의 한 단어만 맞는 분위기 쿼리는 대부분 0.6 미만입니다.
+LEXICAL_MIN_DOC_COVERAGE = float(os.getenv("LEXICAL_MIN_DOC_COVERAGE", "0.7"))
+
+
+def search_settings() -> List[str]:
+    """식별 / 재정렬 결과에 영향을 주는 설정값. index_settings() 와 함께 쿼리 캐시 generation 에 들어갑니다."""
+    return [f"IDENTIFY_DEPTH={IDENTIFY_DEPTH}", f"LEXICAL_MIN_QUERY_CHARS={LEXICAL_MIN_QUERY_CHARS}",
+            f"LEXICAL_MIN_SCORE={LEXICAL_MIN_SCORE}", f"LEXICAL_MIN_DOC_COVERAGE={LEXICAL_MIN_DOC_COVERAGE}",
+            f"LEXICAL_MIN_COVERAGE={MIN_COVERAGE}", f"LEXICAL_WINDOW_LINES={WINDOW_LINES}",
+            f"LINE_MATCH_WINDOW={MATCH_WINDOW}", f"LINE_MATCH_WEIGHT={MATCH_WEIGHT}", f"RERANK_CANDIDATES={RERANK_CANDIDATES}"]
+
+
+def song_neighbor_lists(snapshot: SearchSnapshot, song_idx: int):
+    return song_neighbor_batch(snapshot, np.array([song_idx]))
+
+
+def song_neighbor_batch(snapshot: SearchSnapshot, song_idxs: np.ndarray):
+    """여러 곡의 (D_song, I_song, D_summary, I_summary) 이웃 목록. 그래프가 없으면 인덱스마다 한 번의 다중 행 검색으로 구합니다."""
+    graph = snapshot.recommendation_graph
+    if graph is not None:
+        return graph.song_scores[song_idxs], graph.song_neighbors[song_idxs], graph.summary_scores[song_idxs], graph.summary_neighbors[song_idxs]
+    D_song, I_song = snapshot.song_index.search(np.ascontiguousarray(snapshot.song_embeddings[song_idxs], dtype='float32'), 10)
+    D_summary, I_summary = snapshot.summary_index.search(np.ascontiguousarray(snapshot.summary_embeddings[song_idxs], dtype='float32'), 10)
+    return D_song, I_song, D_summary, I_summary
+
+
+def search_pipeline_from_text(snapshot: SearchSnapshot, query_text: str, query_vector: np.ndarray) -> (Dict[str, Any], str, List[Dict[str, Any]]):
+    return search_batch_from_text(snapshot, [query_text], query_vector)[0]
+
+
+def search_batch_from_text(snapshot: SearchSnapshot, query_texts: Sequence[str], query_vectors: np.ndarray) -> List[tuple]:
+    """여러 쿼리를 인덱스마다 한 번의 다중 행 검색으로 처리합니다. 결과는 쿼리 순서대로 search_pipeline_from_text 와 같습니다."""
+    if not len(query_texts):
+        return []
+    with span("summary_search"):
+        D_summary, I_summary = snapshot.summary_index.search(query_vectors, 1)
+    with span("line_search"):
+        D_lyric, I_lyric = snapshot.line_index.search(query_vectors, IDENTIFY_DEPTH)
+    lexical_hits = _lexical_hits(snapshot, query_texts)
+
+    identified = [_identify_from_text(snapshot, D_summary[i], I_summary[i], D_lyric[i], I_lyric[i], lexical_hits[i], query_vectors[i])
+                  for i in range(len(query_texts))]
+    song_idxs = np.array([song_idx for song_idx, _ in identified if song_idx >= 0], dtype=np.int64)
+    neighbors = None
+    if snapshot.recommendation_graph is None and len(song_idxs):
+        with span("song_neighbors"):
+            neighbors = dict(zip(song_idxs.tolist(), zip(*song_neighbor_batch(snapshot, song_idxs))))
+
+    with span("rank"):
+        candidate_lists = [_text_candidates(snapshot, song_idx, neighbors) for song_idx, _ in identified]
+    with span("line_match"):
+        matches = LineMatches(snapshot.line_store, query_vectors, _rerank_songs(candidate_lists))
+    with span("rank"):
+        return [_text_result(snapshot, query_text, song_idx, matched_lyric, rerank(candidates, matches, row), matches, row)
+                for row, (query_text, (song_idx, matched_lyric), candidates) in enumerate(zip(query_texts, identified, candidate_lists))]
+
+
+def _rerank_songs(candidate_lists: List[List[tuple]]) -> List[List[int]]:
+    return [[idx for idx, _, _ in candidates[:RERANK_CANDIDATES]] for candidates in candidate_lists]
+
+
+def _lexical_hits(snapshot: SearchSnapshot, query_texts: Sequence[str]) -> List[List[tuple]]:
+    """쿼리마다 어휘 검색 결과의 (곡, 라인, BM25 점수, 문서 coverage) 목록. 쿼리 n-gram 을 MIN_COVERAGE 이상 담은 문서만,
+    곡마다 한 번씩 씁니다. 점수는 그 곡 문서들의 최고 점수, 문서 coverage 는 최댓값이고, 라인은 라인을 가리키는 가장 높은
+    점수의 문서의 것입니다. (제목만 맞은 곡이면 -1)"""
+    index = snapshot.lexical_index
+    if index is None:
+        return [[] for _ in query_texts]
+    searchable = [i for i, text in enumerate(query_texts) if len(normalize(text)) >= LEXICAL_MIN_QUERY_CHARS]
+    hits = [[] for _ in query_texts]
+    with span("lexical_search"):
+        # 한 줄은 원문 / 발음 줄마다 WINDOW_LINES * (WINDOW_LINES + 1) / 2 개의 구간 문서에 들어 있으므로 곡 수보다 넉넉히 가져옵니다.
+        results = index.search([query_texts[i] for i in searchable], IDENTIFY_DEPTH * WINDOW_LINES * (WINDOW_LINES + 1))
+    for i, docs in zip(searchable, results):
+        songs = {}
+        for doc, score, coverage, doc_coverage in docs:
+            if coverage < MIN_COVERAGE:
+                continue
+            song_idx = int(index.doc_song[doc])
+            line_idx, best, best_coverage = songs.get(song_idx, (-1, score, doc_coverage))
+            songs[song_idx] = (line_idx if line_idx >= 0 else int(index.doc_line[doc]), best, max(best_coverage, doc_coverage))
+        hits[i] = [(song_idx, *hit) for song_idx, hit in songs.items()][:IDENTIFY_DEPTH]
+    return hits
+
+
+def _vector_hits(snapshot: SearchSnapshot, I_lyric: np.ndarray) -> List[tuple]:
+    lines = {}
+    for line_idx in I_lyric.tolist():
+        if line_idx >= 0:
+            lines.setdefault(int(snapshot.line_store.song_idx[line_idx]), line_idx)
+    return list(lines.items())
+
+
+def _identify_lyric(snapshot: SearchSnapshot, vector_hits: List[tuple], lexical_hits: List[tuple], query_vector: np.ndarray):
+    """벡터 / 어휘 검색의 곡 순위를 RRF 로 합쳐 (곡, 근거 라인) 을 고릅니다. 동점이면 어휘 검색 쪽이 앞섭니다."""
+    if not vector_hits and not lexical_hits:
+        return -1, -1
+    song_idx = reciprocal_rank_fusion([[song for song, *_ in lexical_hits], [song for song, _ in vector_hits]])[0]
+    for song, line_idx, *_ in lexical_hits + vector_hits:
+        if song == song_idx and line_idx >= 0:
+            return song_idx, line_idx
+    # 제목만 맞은 곡은 쿼리와 가장 가까운 라인을 근거로 씁니다.
+    start, end = snapshot.line_store.song_range(song_idx)
+    if start == end:
+        return -1, -1
+    similarities = np.asarray(snapshot.line_embeddings[start:end], dtype='float32') @ query_vector
+    return song_idx, start + int(similarities.argmax())
+
+
+def _identify_from_text(snapshot: SearchSnapshot, D_summary: np.ndarray, I_summary: np.ndarray, D_lyric: np.ndarray, I_lyric: np.ndarray,
+                        lexical_hits: List[tuple], query_vector: np.ndarray):
+    catalog, line_store = snapshot.catalog, snapshot.line_store
+
+    summary_score = D_summary[0] if D_summary.size > 0 else 0
+    lyric_score = D_lyric[0] if D_lyric.size > 0 else 0
+
+    # "summer" 같은 분위기 쿼리도 어떤 가사 줄에는 그대로 들어 있으므로, 점수가 낮은 어휘 결과로는 임계값을 넘지 않습니다.
+    if summary_score > 0.4 or lyric_score > 0.4 or (lexical_hits and lexical_hits[0][2] >= LEXICAL_MIN_SCORE):
+        if summary_score > max(lyric_score, 0.4):
+            # 요약이 더 가까우면 가사 문서(줄 / 구간)를 거의 통째로 담은 어휘 결과만 요약 순위와 RRF 로 합칩니다 (동점이면 어휘).
+            # 가사 줄을 받아 적은 전사는 요약보다 앞서고, 가사 줄 안의 단어 하나만 맞은 분위기 쿼리는 요약으로 식별됩니다.
+            summary_songs = [int(idx) for idx in I_summary.tolist() if idx >= 0]
+            line_hits = [hit for hit in lexical_hits if hit[3] >= LEXICAL_MIN_DOC_COVERAGE]
+            identified_song_idx = reciprocal_rank_fusion([[song for song, *_ in line_hits], summary_songs])[0]
+            for song, line_idx, *_ in line_hits:
+                if song == identified_song_idx and line_idx >= 0:
+                    return song, line_store.text(line_idx)
+            return identified_song_idx, catalog[identified_song_idx].summary
+        song_idx, line_idx = _identify_lyric(snapshot, _vector_hits(snapshot, I_lyric), lexical_hits, query_vector)
+        if song_idx >= 0:
+            return song_idx, line_store.text(line_idx)
+    return -1, ""
+
+
+def _text_candidates(snapshot: SearchSnapshot, identified_song_idx: int, neighbors=None) -> List[tuple]:
+    if identified_song_idx < 0:
+        return []
+    if snapshot.recommendation_graph is not None:
+        return snapshot.recommendation_graph.ranked(identified_song_idx)
+    D_song, I_song, D_summary, I_summary = neighbors[identified_song_idx]
+    return rank_candidates(I_song, D_song, I_summary, D_summary, snapshot.tag_matrix, identified_song_idx)
+
+
+def _text_result(snapshot: SearchSnapshot, query_text: str, identified_song_idx: int, matched_lyric: str,
+                 sorted_candidates: List[tuple], matches: LineMatches, row: int):
+    catalog, line_store, tag_matrix = snapshot.catalog, snapshot.line_store, snapshot.tag_matrix
+    if identified_song_idx < 0:
+        return None, "", []
+
+    identified_song = catalog.response(identified_song_idx, userQuery=query_text)
+
+    similar_songs = []
+    seen_song_ids = {identified_song_idx}
+    seen_artist_ids = {catalog.artist_ids[identified_song_idx]}
+
+    for idx, score, reason_flags in sorted_candidates:
+        if idx in seen_song_ids or catalog.artist_ids[idx] in seen_artist_ids:
+            continue
+        if len(similar_songs) >= 3:
+            break
+        
+        reasons_text = ", ".join(reason_texts(reason_flags, tag_matrix.shared(identified_song_idx, idx)))
+        best_line_idx = matches.best_line(row, idx)
+
+        similar_songs.append(catalog.response(
+            idx,
+            matchLine=line_store.text(best_line_idx) if best_line_idx >= 0 else "",
+            recommendationReason=reasons_text))
+        seen_song_ids.add(idx)
+        seen_artist_ids.add(catalog.artist_ids[idx])
+
+    return identified_song, matched_lyric, similar_songs
+
+
+def search_pipeline_from_audio(snapshot: SearchSnapshot, query_text: str, query_vector: np.ndarray) -> (Dict[str, Any], str, List[Dict[str, Any]]):
+    return search_batch_from_audio(snapshot, [query_text], query_vector)[0]
+
+
+def search_batch_from_audio(snapshot: SearchSnapshot, query_texts: Sequence[str], query_vectors: np.ndarray) -> List[tuple]:
+    """여러 쿼리를 인덱스마다 한 번의 다중 행 검색으로 처리합니다. 결과는 쿼리 순서대로 search_pipeline_from_audio 와 같습니다."""
+    if not len(query_texts):
+        return []
+    line_store = snapshot.line_store
+
+    with span("line_search"):
+        _, I = snapshot.line_index.search(query_vectors, IDENTIFY_DEPTH)
+    lexical_hits = _lexical_hits(snapshot, query_texts)
+    matched = np.array([_identify_lyric(snapshot, _vector_hits(snapshot, I[i]), lexical_hits[i], query_vectors[i])[1]
+                        for i in range(len(query_texts))], dtype=np.int64)
+    found = np.flatnonzero(matched >= 0)
+    matched_line_idxs = matched[found]
+    song_idxs = line_store.song_idx[matched_line_idxs].astype(np.int64)
+
+    lyric_vectors = np.ascontiguousarray(snapshot.line_embeddings[matched_line_idxs], dtype='float32')
+    with span("lyric_neighbors"):
+        D_lyric, I_lyric = snapshot.line_index.search(lyric_vectors, 50)
+    with span("song_neighbors"):
+        D_song, I_song, D_summary, I_summary = song_neighbor_batch(snapshot, song_idxs)
+
+    results = [(None, "", [])] * len(query_texts)
+    with span("rank"):
+        candidate_lists = [_audio_candidates(snapshot, query_texts[i], int(song_idxs[row]), D_song[row], I_song[row],
+                                             D_summary[row], I_summary[row], D_lyric[row], I_lyric[row])
+                           for row, i in enumerate(found.tolist())]
+    # 근거 가사는 쿼리가 아니라 찾아낸 가사 라인과 비교합니다.
+    with span("line_match"):
+        matches = LineMatches(line_store, lyric_vectors, _rerank_songs(candidate_lists))
+    with span("rank"):
+        for row, i in enumerate(found.tolist()):
+            results[i] = _audio_result(snapshot, query_texts[i], int(matched_line_idxs[row]), rerank(candidate_lists[row], matches, row), matches, row)
+    return results
+
+
+def _audio_candidates(snapshot: SearchSnapshot, query_text: str, identified_song_idx: int,
+                      D_song, I_song, D_summary, I_summary, D_lyric, I_lyric) -> List[tuple]:
+    line_store, tag_matrix = snapshot.line_store, snapshot.tag_matrix
+    num_words = len(query_text.split())
+    weight_song, weight_summary, weight_lyric = (0.5, 0.1, 0.4) if num_words > 5 else (0.6, 0.2, 0.2)
+
+    lyric_song_ids = np.where(I_lyric >= 0, line_store.song_idx[I_lyric], -1)
+
+    candidates, scores, candidate_reasons = fuse_candidates(identified_song_idx, [
+        HitSource(I_song, D_song, weight_song, REASON_SONG, rank_bonus=0.005),
+        HitSource(I_summary, D_summary, weight_summary, REASON_SUMMARY, rank_bonus=0.003),
+        HitSource(lyric_song_ids, D_lyric, weight_lyric, REASON_LYRIC, rank_bonus=0.001),
+    ], tag_matrix, tag_weight=0.1)
+    return list(zip(candidates.tolist(), scores.tolist(), candidate_reasons.tolist()))
+
+
+def _audio_result(snapshot: SearchSnapshot, query_text: str, matched_line_idx: int,
+                  sorted_candidates: List[tuple], matches: LineMatches, row: int):
+    catalog, line_store, tag_matrix = snapshot.catalog, snapshot.line_store, snapshot.tag_matrix
+
+    identified_song_idx = int(line_store.song_idx[matched_line_idx])
+    matched_lyric = line_store.text(matched_line_idx)
+
+    identified_song = catalog.response(identified_song_idx, userQuery=query_text)
+
+    similar_songs = []
+    seen_song_ids = {identified_song_idx}
+    seen_artist_ids = {catalog.artist_ids[identified_song_idx]}
+
+    for idx, _, reason_flags in sorted_candidates:
+        if idx in seen_song_ids or catalog.artist_ids[idx] in seen_artist_ids:
+            continue
+        
+        if len(similar_songs) >= 3:
+            break
+        
+        recommended_lyric_snippet = "추천 근거 가사를 찾을 수 없습니다."
+        best_line_idx = matches.best_line(row, idx)
+        if best_line_idx >= 0:
+            recommended_lyric_snippet = line_store.text(best_line_idx)
+        
+        reasons_text = ", ".join(reason_texts(reason_flags, tag_matrix.shared(identified_song_idx, idx)))
+
+        similar_songs.append(catalog.response(
+            idx,
+            matchLine=recommended_lyric_snippet,
+            recommendationReason=reasons_text))
+        seen_song_ids.add(idx)
+        seen_artist_ids.add(catalog.artist_ids[idx])
+
+    return identified_song, matched_lyric, similar_songs
+
+
+PIPELINES = {"text": search_batch_from_text, "audio": search_batch_from_audio}
+
+
+def batch_search(snapshot: SearchSnapshot, encode: Callable[[List[str]], np.ndarray], query_texts: Sequence[str],
+                 mode: str = "text", chunk_size: int = BATCH_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """쿼리 목록을 chunk_size 개씩 한 번에 인코딩하고 검색해 /text-search 와 같은 모양의 결과를 순서대로 내보냅니다.
+
+    mode 가 "audio" 면 /stt 의 (전사된 텍스트) 검색 파이프라인을 사용합니다.
+    """
+    pipeline = PIPELINES[mode]
+    for start in range(0, len(query_texts), chunk_size):
+        chunk = list(query_texts[start:start + chunk_size])
+        valid = [i for i, text in enumerate(chunk) if text.strip()]
+        results = [(None, "", [])] * len(chunk)
+        if valid:
+            query_vectors = np.ascontiguousarray(encode([chunk[i] for i in valid]), dtype='float32')
+            for i, result in zip(valid, pipeline(snapshot, [chunk[i] for i in valid], query_vectors)):
+                results[i] = result
+        for i, (identified_song, matched_lyric, similar_songs) in enumerate(results):
+            yield {"index": start + i, "query": chunk[i], "song": identified_song, "lyrics": matched_lyric, "recommendations": similar_songs}
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(description="한 줄에 하나씩 적힌 쿼리들을 한꺼번에 검색해 NDJSON 으로 출력합니다.")
+    parser.add_argument("queries", help="쿼리 텍스트 파일 (한 줄에 하나)")
+    parser.add_argument("--mode", choices=sorted(PIPELINES), default="text")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    from encoder import BatchEncoder, MODEL_NAME
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = [line.rstrip('\n') for line in f]
+    encoder = BatchEncoder(SentenceTransformer(MODEL_NAME))
+    snapshot = SearchSnapshot.load(current_paths(args.store))
+    for row in batch_search(snapshot, encoder.encode_now, queries, args.mode, args.chunk_size):
+        print(json.dumps(row, ensure_ascii=False))
@@ -0,0 +1,140 @@
+import os
+import json
+from logging import getLogger
+from typing import List, Optional
+
+import numpy as np
+
+from line_store import LineStore
+from ann_index import load_or_build_index, configured_index_type
+from catalog import load_catalog
+from recommendation_graph import load_graph
+from lexical_index import load_lexical_index
+
+logger = getLogger(__name__)
+
+STORE_DIR = os.getenv("STORE_DIR", "store")
+MANIFEST_FILE = "manifest.json"
+
+
+class ArtifactPaths:
+    """한 버전의 검색 데이터 파일 경로 모음."""
+
+    def __init__(self, version: str, song_metadata: str, line_metadata: str, line_embeddings: str, line_store_dir: str,
+                 song_embeddings: str, summary_embeddings: str, catalog: str, recommendation_graph: str, index_dir: str,
+                 lexical_index_dir: str):
+        self.version = version
+        self.song_metadata = song_metadata
+        self.line_metadata = line_metadata
+        self.line_embeddings = line_embeddings
+        self.line_store_dir = line_store_dir
+        self.song_embeddings = song_embeddings
+        self.summary_embeddings = summary_embeddings
+        self.catalog = catalog
+        self.recommendation_graph = recommendation_graph
+        self.index_dir = index_dir
+        self.lexical_index_dir = lexical_index_dir
+
+    @classmethod
+    def legacy(cls) -> "ArtifactPaths":
+        """manifest 가 없을 때 쓰는 저장소 루트의 기존 파일들."""
+        return cls(
+            version="base",
+            song_metadata='song_metadata.json',
+            line_metadata='line_metadata.json',
+            line_embeddings='line_embeddings.npy',
+            line_store_dir=os.getenv("LINE_STORE_DIR", "line_store"),
+            song_embeddings='song_embeddings.npy',
+            summary_embeddings='summary_embeddings.npy',
+            catalog=os.getenv("CATALOG_PATH", "catalog.json"),
+            recommendation_graph=os.getenv("RECOMMENDATION_GRAPH_PATH", "recommendation_graph.npz"),
+            index_dir=os.getenv("INDEX_DIR", "indexes"),
+            lexical_index_dir=os.getenv("LEXICAL_INDEX_DIR", "lexical_index"))
+
+    @classmethod
+    def for_version(cls, store_dir: str, version: str) -> "ArtifactPaths":
+        root = os.path.join(store_dir, version)
+        return cls(
+            version=version,
+            song_metadata=os.path.join(root, 'song_metadata.json'),
+            line_metadata=os.path.join(root, 'line_metadata.json'),
+            line_embeddings=os.path.join(root, 'line_embeddings.npy'),
+            line_store_dir=os.path.join(root, 'line_store'),
+            song_embeddings=os.path.join(root, 'song_embeddings.npy'),
+            summary_embeddings=os.path.join(root, 'summary_embeddings.npy'),
+            catalog=os.path.join(root, 'catalog.json'),
+            recommendation_graph=os.path.join(root, 'recommendation_graph.npz'),
+            index_dir=os.path.join(root, 'indexes'),
+            lexical_index_dir=os.path.join(root, 'lexical_index'))
+
+    def watch_paths(self) -> List[str]:
+        return [self.line_store_dir, self.line_metadata, self.line_embeddings, self.song_embeddings,
+                self.summary_embeddings, self.catalog, self.song_metadata, self.recommendation_graph, self.index_dir,
+                self.lexical_index_dir]
+
+
+def read_manifest(store_dir: str = STORE_DIR) -> Optional[dict]:
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(manifest: dict, store_dir: str = STORE_DIR):
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def current_paths(store_dir: str = STORE_DIR) -> ArtifactPaths:
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        return ArtifactPaths.legacy()
+    return ArtifactPaths.for_version(store_dir, manifest['current'])
+
+
+class SearchSnapshot:
+    """검색에 필요한 카탈로그/라인/임베딩/인덱스를 한 버전으로 묶은 읽기 전용 묶음.
+
+    요청은 시작할 때 잡은 스냅샷을 끝까지 사용하므로, 새 버전으로 교체되어도 진행 중인 검색은 영향을 받지 않습니다.
+    """
+
+    def __init__(self, version: str, catalog, line_store: LineStore, song_embeddings: np.ndarray, summary_embeddings: np.ndarray,
+                 line_index, song_index, summary_index, recommendation_graph=None, lexical_index=None):
+        self.version = version
+        self.catalog = catalog
+        self.line_store = line_store
+        self.line_embeddings = line_store.embeddings
+        self.song_embeddings = song_embeddings
+        self.summary_embeddings = summary_embeddings
+        self.line_index = line_index
+        self.song_index = song_index
+        self.summary_index = summary_index
+        self.recommendation_graph = recommendation_graph
+        self.lexical_index = lexical_index
+        self.tag_matrix = catalog.tag_matrix
+
+    @classmethod
+    def load(cls, paths: ArtifactPaths) -> "SearchSnapshot":
+        if os.path.isdir(paths.line_store_dir):
+            line_store = LineStore.load(paths.line_store_dir)
+        else:
+            logger.info(f"'{paths.line_store_dir}' 가 없어 {paths.line_metadata} 에서 라인 저장소를 구성합니다. (python line_store.py 로 미리 생성 가능)")
+            with open(paths.line_metadata, 'r', encoding='utf-8') as f:
+                line_store = LineStore.from_metadata(json.load(f), np.load(paths.line_embeddings))
+        catalog = load_catalog(paths.catalog, paths.song_metadata)
+        song_embeddings = np.load(paths.song_embeddings, mmap_mode='r')
+        summary_embeddings = np.load(paths.summary_embeddings, mmap_mode='r')
+
+        snapshot = cls(
+            paths.version, catalog, line_store, song_embeddings, summary_embeddings,
+            load_or_build_index("line", line_store.embeddings, configured_index_type("line"), paths.index_dir),
+            load_or_build_index("song", song_embeddings, configured_index_type("song"), paths.index_dir),
+            load_or_build_index("summary", summary_embeddings, configured_index_type("summary"), paths.index_dir),
+            load_graph(paths.recommendation_graph, song_embeddings, summary_embeddings, catalog.tag_matrix),
+            load_lexical_index(paths.lexical_index_dir, line_store, catalog))
+        logger.info(f"DB 로드 완료 [{paths.version}]. {len(catalog)}곡, {len(line_store)}개의 라인, {len(summary_embeddings)}개의 요약문이 준비되었습니다.")
+        return snapshot
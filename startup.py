@@ -0,0 +1,121 @@
+"""서버 준비 단계(모델 로드, 스냅샷 로드, 워밍업)를 백그라운드에서 실행하고 진행 상황을 기록합니다.
+
+    python startup.py            # 서버가 memory-map 으로 바로 읽을 수 있도록 파생 데이터를 미리 생성
+
+라인 저장소, 카탈로그, FAISS 인덱스, 추천 그래프, 어휘 색인이 없으면 서버가 시작할 때마다 JSON 파싱과 인덱스 빌드를 반복하므로
+배포 전에 한 번 만들어 두는 것을 권장합니다.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from logging import getLogger, basicConfig, INFO
+from typing import Callable, List, Tuple
+
+logger = getLogger(__name__)
+
+
+class StartupState:
+    """준비 단계별 소요 시간과 완료 여부. /ready 응답과 시작 시간 벤치마크가 같은 기록을 사용합니다."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = {}
+        self.current = None
+        self.error = None
+        self.ready = False
+        self._thread = None
+
+    @contextmanager
+    def phase(self, name: str):
+        self.current = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - start) * 1000
+            self.current = None
+        logger.info(f"준비 단계 '{name}' 완료 ({self.phases[name]:.0f}ms)")
+
+    def run(self, steps: List[Tuple[str, Callable[[], None]]]) -> bool:
+        """단계들을 순서대로 실행합니다. 하나라도 실패하면 이후 단계는 건너뛰고 error 에 기록합니다."""
+        try:
+            for name, step in steps:
+                with self.phase(name):
+                    step()
+        except Exception as e:
+            self.error = f"{name}: {e}"
+            logger.error(f"준비 단계 '{name}' 실패: {e}", exc_info=True)
+            return False
+        self.ready = True
+        logger.info(f"서버 준비 완료 ({(time.perf_counter() - self.started_at) * 1000:.0f}ms)")
+        return True
+
+    def start(self, steps: List[Tuple[str, Callable[[], None]]]) -> threading.Thread:
+        """이벤트 루프를 막지 않도록 별도 스레드에서 run 을 실행합니다."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, args=(steps,), name="startup", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "phase": self.current,
+            "error": self.error,
+            "phases": {name: round(ms, 1) for name, ms in self.phases.items()},
+            "uptime_ms": round((time.perf_counter() - self.started_at) * 1000, 1),
+        }
+
+
+def prepare_artifacts(paths):
+    """paths 버전의 파생 데이터 중 없는 것을 만들어 저장합니다. 이미 있는 파일은 건드리지 않습니다."""
+    import numpy as np
+    from ann_index import load_or_build_index, configured_index_type
+    from catalog import Catalog
+    from line_store import LineStore
+    from recommendation_graph import RecommendationGraph, load_graph
+    from lexical_index import build_lexical_index, catalog_fingerprint, stored_fingerprint
+
+    if os.path.isdir(paths.line_store_dir):
+        line_store = LineStore.load(paths.line_store_dir)
+    else:
+        with open(paths.line_metadata, 'r', encoding='utf-8') as f:
+            line_store = LineStore.from_metadata(json.load(f), np.load(paths.line_embeddings, mmap_mode='r'))
+        line_store.save(paths.line_store_dir)
+        logger.info(f"라인 저장소 생성: {paths.line_store_dir}")
+
+    if os.path.exists(paths.catalog):
+        catalog = Catalog.load(paths.catalog)
+    else:
+        catalog = Catalog.from_metadata(paths.song_metadata)
+        catalog.save(paths.catalog)
+        logger.info(f"카탈로그 생성: {paths.catalog}")
+
+    song_embeddings = np.load(paths.song_embeddings, mmap_mode='r')
+    summary_embeddings = np.load(paths.summary_embeddings, mmap_mode='r')
+    for name, embeddings in (("line", line_store.embeddings), ("song", song_embeddings), ("summary", summary_embeddings)):
+        load_or_build_index(name, embeddings, configured_index_type(name), paths.index_dir)
+
+    if load_graph(paths.recommendation_graph, song_embeddings, summary_embeddings, catalog.tag_matrix) is None:
+        RecommendationGraph.build(song_embeddings, summary_embeddings, catalog.tag_matrix).save(paths.recommendation_graph)
+        logger.info(f"추천 그래프 생성: {paths.recommendation_graph}")
+
+    if stored_fingerprint(paths.lexical_index_dir) != catalog_fingerprint(line_store, catalog):
+        build_lexical_index(line_store, catalog).save(paths.lexical_index_dir)
+        logger.info(f"어휘 색인 생성: {paths.lexical_index_dir}")
+
+
+if __name__ == "__main__":
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(description="서버 시작 시 memory-map 으로 읽을 파생 데이터를 미리 생성합니다.")
+    parser.add_argument("--store", default=None, help="STORE_DIR (기본값: 환경 변수 또는 store)")
+    args = parser.parse_args()
+
+    from snapshot import STORE_DIR, current_paths
+    paths = current_paths(args.store or STORE_DIR)
+    start = time.perf_counter()
+    prepare_artifacts(paths)
+    logger.info(f"[{paths.version}] 파생 데이터 준비 완료 ({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,107 @@
+import os
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+
+from starlette.concurrency import run_in_threadpool
+
+from audio_ingest import IngestedAudio
+
+logger = getLogger(__name__)
+
+
+class STTBackend(ABC):
+    """음성 인식 백엔드 인터페이스. transcribe_async 는 이벤트 루프를 막지 않아야 합니다."""
+
+    name = "base"
+
+    @abstractmethod
+    def transcribe(self, audio: IngestedAudio) -> str:
+        ...
+
+    async def transcribe_async(self, audio: IngestedAudio) -> str:
+        return await run_in_threadpool(self.transcribe, audio)
+
+    def close(self):
+        pass
+
+
+class OpenAIWhisperBackend(STTBackend):
+    name = "openai"
+
+    def __init__(self, client, model: str = "whisper-1"):
+        self.client = client
+        self.model = model
+
+    def transcribe(self, audio: IngestedAudio) -> str:
+        if self.client is None:
+            raise RuntimeError("OpenAI API 키가 설정되지 않았습니다.")
+        # API 가 직접 디코딩하므로 (대개 더 작은) 원본 파일을 그대로 보냅니다.
+        transcript = self.client.audio.transcriptions.create(model=self.model, file=(audio.filename, audio.data, audio.content_type))
+        return transcript.text
+
+
+_local_model = None
+
+
+def _load_local_model(model_size: str, compute_type: str, cpu_threads: int):
+    global _local_model
+    from faster_whisper import WhisperModel
+    _local_model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _local_transcribe(pcm16k, language: str) -> str:
+    segments, _ = _local_model.transcribe(pcm16k, language=language or None, beam_size=1, vad_filter=True)
+    return " ".join(segment.text.strip() for segment in segments)
+
+
+class LocalWhisperBackend(STTBackend):
+    """faster-whisper (CTranslate2, int8) 모델을 프로세스 풀에서 돌리는 온디바이스 백엔드.
+
+    각 워커 프로세스가 시작할 때 모델을 한 번 로드하므로, 동시에 들어온 업로드가 병렬로 처리됩니다.
+    입력은 업로드 단계에서 한 번 만든 16kHz mono PCM 을 그대로 받습니다.
+    """
+
+    name = "local"
+
+    def __init__(self, model_size: str = "small", compute_type: str = "int8", workers: int = 2, cpu_threads: int = 2, language: str = None):
+        self.language = language
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=_load_local_model,
+                                         initargs=(model_size, compute_type, cpu_threads))
+
+    def transcribe(self, audio: IngestedAudio) -> str:
+        return self._pool.submit(_local_transcribe, audio.pcm16k(), self.language).result()
+
+    async def transcribe_async(self, audio: IngestedAudio) -> str:
+        pcm16k = await run_in_threadpool(audio.pcm16k)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, _local_transcribe, pcm16k, self.language)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class StubBackend(STTBackend):
+    """테스트용 백엔드. 오디오와 상관없이 정해진 문장을 돌려줍니다."""
+
+    name = "stub"
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def transcribe(self, audio: IngestedAudio) -> str:
+        return self.text
+
+
+def create_stt_backend(openai_client) -> STTBackend:
+    backend_name = os.getenv("STT_BACKEND", "openai")
+    if backend_name == "local":
+        return LocalWhisperBackend(
+            model_size=os.getenv("STT_LOCAL_MODEL", "small"),
+            compute_type=os.getenv("STT_LOCAL_COMPUTE_TYPE", "int8"),
+            workers=int(os.getenv("STT_LOCAL_WORKERS", "2")),
+            cpu_threads=int(os.getenv("STT_LOCAL_CPU_THREADS", "2")),
+            language=os.getenv("STT_LANGUAGE"))
+    if backend_name == "stub":
+        return StubBackend(os.getenv("STT_STUB_TEXT", "そう君といれば Everything is better"))
+    return OpenAIWhisperBackend(openai_client)
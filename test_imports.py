@@ -13,6 +13,6 @@ print("Importing sentence_transformers...")
 from sentence_transformers import SentenceTransformer
 print("Importing faiss...")
 import faiss
-print("Importing spotipy...")
-import spotipy
+print("Importing httpx...")
+import httpx
 print("Done imports!")
@@ -0,0 +1,57 @@
+import io
+import os
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ann_index import build_index
+from catalog import Catalog, Song
+from encoder import BatchEncoder, HashEmbedder
+from lexical_index import LexicalIndex
+from line_store import LineStore
+from snapshot import SearchSnapshot
+
+# (제목, 아티스트, 태그, 요약, 가사 줄)
+SONGS = [
+    ("そう君といれば", "A", ["청량", "여름"], "여름날 친구와 함께하는 밝은 노래",
+     ["そう君といれば", "Everything is better", "青い空の下で", "風が吹いている"]),
+    ("夜に駆ける", "B", ["밤", "질주"], "밤거리를 달리는 빠른 템포의 곡",
+     ["沈むように溶けてゆくように", "二人だけの空が広がる夜に", "さよならだけだった"]),
+    ("マリーゴールド", "C", ["여름", "사랑"], "마리골드 꽃처럼 따뜻한 사랑 노래",
+     ["風の強さがちょっと", "心を揺さぶりすぎて", "麦わらの帽子の君が"]),
+    ("Lemon", "D", ["이별", "슬픔"], "떠난 사람을 그리워하는 발라드",
+     ["夢ならばどれほどよかったでしょう", "未だにあなたのことを夢にみる", "忘れた物を取りに帰るように"]),
+]
+
+
+def make_snapshot(songs=SONGS, embedder=None) -> SearchSnapshot:
+    """해시 임베더로 곡 / 요약 / 가사 줄을 임베딩한 메모리 안의 작은 스냅샷."""
+    encoder = BatchEncoder(embedder or HashEmbedder())
+    catalog = Catalog([Song(f"id{i}", title, artist, None, tags, summary) for i, (title, artist, tags, summary, _) in enumerate(songs)])
+    texts = [line for *_, lines in songs for line in lines]
+    song_idx = [i for i, (*_, lines) in enumerate(songs) for _ in lines]
+    line_store = LineStore.from_lines(texts, song_idx, encoder.encode_now(texts))
+    song_embeddings = encoder.encode_now([" ".join(lines) for *_, lines in songs])
+    summary_embeddings = encoder.encode_now([summary for _, _, _, summary, _ in songs])
+    return SearchSnapshot("test", catalog, line_store, song_embeddings, summary_embeddings,
+                          build_index(line_store.embeddings), build_index(song_embeddings), build_index(summary_embeddings),
+                          None, LexicalIndex.build(line_store, [song.title for song in catalog.songs]))
+
+
+def wav_bytes(seconds: float, sample_rate: int = 16000) -> bytes:
+    samples = (np.sin(2 * np.pi * 440 * np.arange(int(seconds * sample_rate)) / sample_rate) * 8000).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def snapshot():
+    return make_snapshot()
@@ -0,0 +1,71 @@
+import struct
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from audio_ingest import UploadLimitMiddleware, probe_duration
+from conftest import wav_bytes
+
+
+def element(element_id: int, payload: bytes = b"", unknown_size: bool = False) -> bytes:
+    head = element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+    if unknown_size:
+        return head + b"\x01\xff\xff\xff\xff\xff\xff\xff" + payload
+    return head + (0x10000000 | len(payload)).to_bytes(4, 'big') + payload
+
+
+def media_recorder_webm(num_clusters: int, blocks_per_cluster: int, frame_ms: int = 20, duration: float = None) -> bytes:
+    """MediaRecorder 처럼 Segment / Cluster 크기가 unknown 이고 Info 에 Duration 이 없는 WebM."""
+    info = element(0x2AD7B1, (1_000_000).to_bytes(3, 'big'))
+    if duration is not None:
+        info += element(0x4489, struct.pack('>d', duration * 1000))
+    clusters = b""
+    for c in range(num_clusters):
+        cluster_timecode = c * blocks_per_cluster * frame_ms
+        blocks = b"".join(element(0xA3, b"\x81" + struct.pack('>h', b * frame_ms) + b"\x80" + b"\x00" * 40)
+                          for b in range(blocks_per_cluster))
+        clusters += element(0x1F43B675, element(0xE7, cluster_timecode.to_bytes(4, 'big')) + blocks, unknown_size=True)
+    return (element(0x1A45DFA3, element(0x4282, b"webm"))
+            + element(0x18538067, element(0x1549A966, info) + element(0x1654AE6B, b"\x00" * 30) + clusters, unknown_size=True))
+
+
+def test_webm_duration_without_duration_element():
+    data = media_recorder_webm(num_clusters=6, blocks_per_cluster=50)
+    # 마지막 프레임의 시작 시각 (6 * 50 - 1) * 20ms
+    assert probe_duration(data) == pytest.approx(5.98)
+
+
+def test_webm_duration_element_and_truncated_tail():
+    assert probe_duration(media_recorder_webm(1, 10, duration=7.5)) == pytest.approx(7.5)
+    data = media_recorder_webm(num_clusters=3, blocks_per_cluster=50)
+    assert probe_duration(data[:-20]) == pytest.approx(2.98)
+
+
+def test_wav_duration():
+    assert probe_duration(wav_bytes(6.0)) == pytest.approx(6.0)
+
+
+@pytest.fixture
+def limited_client():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(audio_file: UploadFile = File(...)):
+        return {"size": len(await audio_file.read())}
+
+    app.add_middleware(UploadLimitMiddleware, paths={"/upload"}, max_bytes=1000)
+    return TestClient(app)
+
+
+def test_upload_limit(limited_client):
+    assert limited_client.post("/upload", files={"audio_file": ("a.wav", b"x" * 500)}).json() == {"size": 500}
+    assert limited_client.post("/upload", files={"audio_file": ("a.wav", b"x" * 200_000)}).status_code == 413
+
+
+def test_upload_limit_without_content_length(limited_client):
+    def chunks():
+        for _ in range(10):
+            yield b"x" * 20_000
+    response = limited_client.post("/upload", content=chunks(), headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
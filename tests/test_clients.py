@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import clients
+from clients import SpotifyClient, SpotifyError
+
+
+class MockSpotify:
+    """요청을 기록하고, 경로별로 준비해 둔 응답 (또는 예외) 을 차례로 돌려주는 mock 서버."""
+
+    def __init__(self, responses):
+        self.responses = {path: list(items) for path, items in responses.items()}
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        item = self.responses[request.url.path].pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(clients.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def run(server: MockSpotify, call):
+    async def main():
+        client = SpotifyClient("id", "secret", "http://localhost/callback", api_base_url="https://api.test/v1",
+                               accounts_base_url="https://accounts.test", max_retries=2, transport=httpx.MockTransport(server))
+        try:
+            return await call(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_retries_idempotent_request_and_honors_retry_after(sleeps):
+    server = MockSpotify({"/v1/me": [httpx.Response(503), httpx.Response(429, headers={"Retry-After": "3"}),
+                                     httpx.Response(200, json={"id": "user"})]})
+    assert run(server, lambda client: client.me("token")) == {"id": "user"}
+    assert len(server.requests) == 3
+    assert server.requests[0].headers["Authorization"] == "Bearer token"
+    assert sleeps == [0.2, 3.0]
+
+
+def test_retry_after_is_capped(sleeps):
+    server = MockSpotify({"/v1/me": [httpx.Response(429, headers={"Retry-After": "120"}), httpx.Response(200, json={})]})
+    run(server, lambda client: client.me("token"))
+    assert sleeps == [clients.MAX_RETRY_AFTER_SECONDS]
+
+
+def test_gives_up_after_max_retries(sleeps):
+    server = MockSpotify({"/v1/me": [httpx.Response(502)] * 3})
+    with pytest.raises(SpotifyError) as error:
+        run(server, lambda client: client.me("token"))
+    assert error.value.status_code == 502
+    assert len(server.requests) == 3
+
+
+def test_create_playlist_is_not_retried_after_server_error(sleeps):
+    server = MockSpotify({"/v1/users/user/playlists": [httpx.Response(500), httpx.Response(201, json={"id": "p"})]})
+    with pytest.raises(SpotifyError):
+        run(server, lambda client: client.create_playlist("token", "user", "name", "description"))
+    assert len(server.requests) == 1
+
+
+def test_create_playlist_is_not_retried_after_read_timeout(sleeps):
+    server = MockSpotify({"/v1/users/user/playlists": [httpx.ReadTimeout("timeout"), httpx.Response(201, json={"id": "p"})]})
+    with pytest.raises(httpx.ReadTimeout):
+        run(server, lambda client: client.create_playlist("token", "user", "name", "description"))
+    assert len(server.requests) == 1
+
+
+def test_create_playlist_is_retried_when_not_processed(sleeps):
+    server = MockSpotify({"/v1/users/user/playlists": [httpx.ConnectError("refused"), httpx.Response(429),
+                                                       httpx.Response(201, json={"id": "p"})]})
+    assert run(server, lambda client: client.create_playlist("token", "user", "name", "description")) == {"id": "p"}
+    assert len(server.requests) == 3
+
+
+def test_add_items_chunks_by_100(sleeps):
+    server = MockSpotify({"/v1/playlists/p/tracks": [httpx.Response(201, json={"snapshot_id": str(i)}) for i in range(3)]})
+    track_ids = [f"t{i}" for i in range(250)]
+    run(server, lambda client: client.add_items("token", "p", track_ids))
+    chunks = [json.loads(request.content)["uris"] for request in server.requests]
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    assert chunks[0][0] == "spotify:track:t0" and chunks[2][-1] == "spotify:track:t249"
+
+
+def test_refresh_keeps_refresh_token(sleeps):
+    server = MockSpotify({"/api/token": [httpx.Response(200, json={"access_token": "new", "expires_in": 3600})]})
+    token_info = run(server, lambda client: client.refresh({"access_token": "old", "refresh_token": "r"}))
+    assert token_info["access_token"] == "new" and token_info["refresh_token"] == "r"
+    assert server.requests[0].headers["Authorization"].startswith("Basic ")
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from encoder import BatchEncoder, HashEmbedder
+
+
+class FakeModel:
+    """입력 텍스트의 길이를 값으로 하는 벡터를 돌려주고, 호출마다 (스레드 이름, 텍스트) 를 기록합니다."""
+
+    def __init__(self, error: Exception = None):
+        self.calls = []
+        self.error = error
+
+    def encode(self, texts):
+        self.calls.append((threading.current_thread().name, list(texts)))
+        if self.error:
+            raise self.error
+        return np.array([[len(text), 1.0] for text in texts], dtype='float32')
+
+
+def test_bulk_encoding_runs_in_bounded_chunks_on_encoder_thread():
+    model = FakeModel()
+    encoder = BatchEncoder(model, max_batch_size=4)
+    texts = [f"query {i}" for i in range(10)]
+    vectors = encoder.encode_bulk(texts)
+    np.testing.assert_allclose(vectors, encoder.encode_now(texts))
+    assert [len(batch) for _, batch in model.calls[:3]] == [4, 4, 2]
+    assert all(name.startswith("encoder") for name, _ in model.calls[:3])
+    encoder.close()
+
+
+@pytest.mark.parametrize("token", [None, "wrong"])
+def test_batch_search_requires_admin(monkeypatch, snapshot, token):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(app_module, "search_snapshot", snapshot)
+    monkeypatch.setattr(app_module.startup, "ready", True)
+    headers = {"X-Admin-Token": token} if token else {}
+    response = TestClient(app_module.app).post("/batch-search", json={"queries": ["夜に駆ける"]}, headers=headers)
+    assert response.status_code == 403
+
+
+def test_batch_search_with_admin_token(monkeypatch, snapshot):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(app_module, "search_snapshot", snapshot)
+    monkeypatch.setattr(app_module.startup, "ready", True)
+    monkeypatch.setattr(app_module.query_encoder, "model", HashEmbedder())
+    response = TestClient(app_module.app).post("/batch-search", json={"queries": ["沈むように溶けてゆくように", ""]},
+                                               headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    rows = [line for line in response.text.splitlines() if line]
+    assert len(rows) == 2 and '"夜に駆ける"' in rows[0]
+
+
+def encode_concurrently(encoder, texts):
+    async def run():
+        results = await asyncio.gather(*(encoder.encode(text) for text in texts), return_exceptions=True)
+        encoder.close()
+        return results
+    return asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+
+def test_concurrent_queries_are_coalesced_into_one_batch():
+    model = FakeModel()
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    results = encode_concurrently(BatchEncoder(model, max_batch_size=32, max_wait_ms=50), texts)
+    assert [batch for _, batch in model.calls] == [texts]
+    # 각 호출자는 자기 쿼리의 (정규화된) 벡터를 받습니다.
+    for text, vector in zip(texts, results):
+        assert vector.shape == (1, 2)
+        np.testing.assert_allclose(vector[0], np.array([len(text), 1.0]) / np.hypot(len(text), 1.0), rtol=1e-6)
+
+
+def test_batches_are_capped_at_max_batch_size():
+    model = FakeModel()
+    texts = [f"q{i}" for i in range(5)]
+    results = encode_concurrently(BatchEncoder(model, max_batch_size=2, max_wait_ms=50), texts)
+    assert [batch for _, batch in model.calls] == [texts[0:2], texts[2:4], texts[4:5]]
+    assert all(isinstance(vector, np.ndarray) for vector in results)
+
+
+def test_model_error_reaches_every_waiting_caller():
+    model = FakeModel(error=RuntimeError("CUDA out of memory"))
+    encoder = BatchEncoder(model, max_wait_ms=50)
+
+    async def run():
+        failed = await asyncio.gather(*(encoder.encode(text) for text in ["a", "b", "c"]), return_exceptions=True)
+        # 실패한 배치 뒤에도 워커는 계속 다음 배치를 처리합니다.
+        model.error = None
+        recovered = await encoder.encode("dd")
+        encoder.close()
+        return failed, recovered
+
+    failed, recovered = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert len(failed) == 3 and all(isinstance(result, RuntimeError) for result in failed)
+    assert recovered.shape == (1, 2)
@@ -0,0 +1,129 @@
+import json
+
+import numpy as np
+import pytest
+
+import ingest
+from conftest import SONGS, make_snapshot
+from encoder import BatchEncoder, HashEmbedder
+from ingest import ingest_songs
+from snapshot import SearchSnapshot, STORE_DIR, current_paths, read_manifest
+
+
+def records():
+    return [{"spotify_id": f"id{i}", "title": title, "artist": artist, "album_cover_url": None, "tags_normalized": str(tags),
+             "summary": summary, "lyrics_cleaned": "\n".join(lines)} for i, (title, artist, tags, summary, lines) in enumerate(SONGS)]
+
+
+class RecordingEncoder:
+    def __init__(self):
+        self.encoded = []
+        self.encoder = BatchEncoder(HashEmbedder())
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return self.encoder.encode_now(texts)
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    """SONGS 로 만든 서비스 중인 스냅샷. 저장소는 tmp_path/STORE_DIR 이고 아직 버전이 없습니다."""
+    monkeypatch.chdir(tmp_path)
+    with open("song_metadata.json", 'w', encoding='utf-8') as f:
+        json.dump(records(), f, ensure_ascii=False)
+    snapshot = make_snapshot()
+    snapshot.catalog.source_path = str(tmp_path / "song_metadata.json")
+    snapshot.version = current_paths(STORE_DIR).version
+    return snapshot
+
+
+@pytest.fixture
+def rebuilt(monkeypatch):
+    """load_or_build_index 로 (복제 없이) 다시 만든 인덱스 이름들."""
+    names = []
+    load_or_build_index = ingest.load_or_build_index
+
+    def recording(name, *args, **kwargs):
+        names.append(name)
+        return load_or_build_index(name, *args, **kwargs)
+
+    monkeypatch.setattr(ingest, "load_or_build_index", recording)
+    return names
+
+
+def test_metadata_only_change_creates_version_without_reembedding(base):
+    encode = RecordingEncoder()
+    changed = records()[1:2]
+    changed[0].update(title="夜に駆ける (Remaster)", tags_normalized="['밤', '리마스터']")
+    result = ingest_songs(changed, encode, STORE_DIR, base)
+    assert result == {"version": "v0001", "added": 0, "changed": 0, "updated": 1}
+    assert encode.encoded == []
+
+    snapshot = SearchSnapshot.load(current_paths(STORE_DIR))
+    assert snapshot.catalog[1].title == "夜に駆ける (Remaster)"
+    assert snapshot.catalog[1].tags == ("밤", "리마스터")
+    assert snapshot.recommendation_graph is not None
+    np.testing.assert_array_equal(snapshot.song_embeddings, base.song_embeddings)
+    assert read_manifest(STORE_DIR)["versions"][-1]["updated"] == 1
+
+    assert ingest_songs(changed, encode, STORE_DIR)["version"] is None
+
+
+def test_spotify_id_change_updates_existing_song(base):
+    record = records()[2]
+    record["spotify_id"] = "new-id"
+    result = ingest_songs([record], RecordingEncoder(), STORE_DIR, base)
+    assert result == {"version": "v0001", "added": 0, "changed": 0, "updated": 1}
+
+    snapshot = SearchSnapshot.load(current_paths(STORE_DIR))
+    assert len(snapshot.catalog) == len(SONGS)
+    assert snapshot.catalog[2].spotify_id == "new-id"
+
+
+def test_unchanged_records_create_no_version(base):
+    assert ingest_songs(records(), RecordingEncoder(), STORE_DIR, base) == {"version": None, "added": 0, "changed": 0, "updated": 0}
+    assert read_manifest(STORE_DIR) is None
+
+
+def test_added_song_extends_indexes_without_rebuild(base, rebuilt):
+    encode = RecordingEncoder()
+    record = {"spotify_id": "id9", "title": "アイドル", "artist": "E", "album_cover_url": None, "tags_normalized": "['아이돌']",
+              "summary": "무대 위 아이돌의 두 얼굴", "lyrics_cleaned": "無敵の笑顔で荒らすメディア\n知りたいその秘密ミステリアス"}
+    assert ingest_songs([record], encode, STORE_DIR, base) == {"version": "v0001", "added": 1, "changed": 0, "updated": 0}
+    assert rebuilt == []
+    assert sorted(encode.encoded) == sorted([record["lyrics_cleaned"], record["summary"], "無敵の笑顔で荒らすメディア", "知りたいその秘密ミステリアス"])
+
+    snapshot = SearchSnapshot.load(current_paths(STORE_DIR))
+    assert snapshot.line_index.ntotal == len(base.line_store) + 2
+    assert snapshot.song_index.ntotal == snapshot.summary_index.ntotal == len(SONGS) + 1
+    vector = encode.encoder.encode_now(["無敵の笑顔で荒らすメディア"])
+    _, I = snapshot.line_index.search(vector, 1)
+    assert snapshot.line_store.text(int(I[0, 0])) == "無敵の笑顔で荒らすメディア"
+
+
+def test_changed_lyrics_rebuild_indexes(base, rebuilt):
+    encode = RecordingEncoder()
+    record = records()[3]
+    record["lyrics_cleaned"] = "夢ならばどれほどよかったでしょう\n今でもあなたはわたしの光"
+    assert ingest_songs([record], encode, STORE_DIR, base) == {"version": "v0001", "added": 0, "changed": 1, "updated": 0}
+    assert sorted(rebuilt) == ["line", "song", "summary"]
+    assert "今でもあなたはわたしの光" in encode.encoded and "風の強さがちょっと" not in encode.encoded
+
+    snapshot = SearchSnapshot.load(current_paths(STORE_DIR))
+    start, end = snapshot.line_store.song_range(3)
+    assert [snapshot.line_store.text(i) for i in range(start, end)] == record["lyrics_cleaned"].split("\n")
+    assert snapshot.line_index.ntotal == len(snapshot.line_store)
+
+
+def test_server_swaps_to_ingested_version(base, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "search_snapshot", base)
+    assert app_module.reload_snapshot() is False
+
+    record = records()[0]
+    record["title"] = "そう君といれば (2024)"
+    ingest_songs([record], RecordingEncoder(), STORE_DIR, base)
+    assert app_module.reload_snapshot() is True
+    assert app_module.search_snapshot.version == "v0001"
+    assert app_module.search_snapshot.catalog[0].title == "そう君といれば (2024)"
+    assert app_module.reload_snapshot() is False
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+from conftest import SONGS, make_snapshot
+
+from encoder import BatchEncoder, HashEmbedder
+from lexical_index import LexicalIndex
+from search import search_pipeline_from_text
+
+# 곡 3 (Lemon) 첫 두 줄의 한글 발음 줄
+READINGS = [[], [], [], [("夢ならばどれほどよかったでしょう", "유메나라바 도레호도 요캇타데쇼"),
+                         ("未だにあなたのことを夢にみる", "이마다니 아나타노 코토오 유메니 미루")]]
+
+
+def search_text(snapshot, text):
+    return search_pipeline_from_text(snapshot, text, BatchEncoder(HashEmbedder()).encode_now([text]))
+
+
+def test_reading_points_to_original_line(snapshot):
+    index = LexicalIndex.build(snapshot.line_store, [song.title for song in snapshot.catalog.songs], READINGS)
+    doc, _, coverage, doc_coverage = index.search(["이마다니 아나타노 코토오 유메니 미루"], 1)[0][0]
+    assert int(index.doc_song[doc]) == 3 and coverage == pytest.approx(1.0) and doc_coverage == pytest.approx(1.0)
+    assert snapshot.line_store.text(int(index.doc_line[doc])) == "未だにあなたのことを夢にみる"
+
+
+def test_translit_query_identifies_song(snapshot):
+    snapshot.lexical_index = LexicalIndex.build(snapshot.line_store, [song.title for song in snapshot.catalog.songs], READINGS)
+    identified, matched, _ = search_text(snapshot, "유메나라바도레호도요카타데쇼")
+    assert identified["songTitle"] == "Lemon"
+    assert matched == "夢ならばどれほどよかったでしょう"
+
+
+def test_multiline_transcript_matches_window(snapshot):
+    # 두 줄을 이어 부른 전사는 어느 한 줄 문서에도 쿼리 n-gram 의 절반 이상이 들어 있지 않습니다.
+    query = "風の強さがちょっと心を揺さぶりすぎて"
+    index = snapshot.lexical_index
+    doc, _, coverage, _ = index.search([query], 1)[0][0]
+    assert int(index.doc_song[doc]) == 2 and int(index.doc_line[doc]) == 7 and coverage == pytest.approx(1.0)
+    identified, matched, _ = search_text(snapshot, query)
+    assert identified["songTitle"] == "マリーゴールド"
+    assert matched == "風の強さがちょっと"
+
+
+def test_mood_word_in_lyric_does_not_override_summary():
+    songs = list(SONGS)
+    songs[1] = songs[1][:3] + ("summer dance music",) + songs[1][4:]
+    songs[3] = songs[3][:4] + (songs[3][4] + ["summer dance music was playing all night long"],)
+    snapshot = make_snapshot(songs)
+    hits = snapshot.lexical_index.search(["summer dance music"], 1)[0]
+    assert int(snapshot.lexical_index.doc_song[hits[0][0]]) == 3 and hits[0][2] == pytest.approx(1.0)
+
+    identified, matched, _ = search_text(snapshot, "summer dance music")
+    assert identified["songTitle"] == "夜に駆ける"
+    assert matched == "summer dance music"
+
+
+def test_prebuilt_index_is_validated_without_parsing_lyrics(snapshot, tmp_path, monkeypatch):
+    import lexical_index
+    source = tmp_path / "song_metadata.json"
+    lyrics = "夢ならばどれほどよかったでしょう\n유메나라바 도레호도 요캇타데쇼\n꿈이라면 얼마나 좋았을까요"
+    source.write_text(json.dumps([{"lyrics": ""}] * 3 + [{"lyrics": lyrics}], ensure_ascii=False), encoding='utf-8')
+    snapshot.catalog.source_path = str(source)
+    directory = str(tmp_path / "lexical_index")
+    lexical_index.build_lexical_index(snapshot.line_store, snapshot.catalog).save(directory)
+
+    def fail(catalog):
+        raise AssertionError("원본 가사를 파싱했습니다.")
+
+    monkeypatch.setattr(lexical_index, "song_readings", fail)
+    index = lexical_index.load_lexical_index(directory, snapshot.line_store, snapshot.catalog)
+    assert isinstance(index.doc_line, np.memmap)
+    doc = index.search(["유메나라바 도레호도 요캇타데쇼"], 1)[0][0][0]
+    assert int(index.doc_song[doc]) == 3
+
+    # 원본 가사가 바뀌면 다시 만듭니다.
+    monkeypatch.undo()
+    source.write_text(json.dumps([{"lyrics": ""}] * 4), encoding='utf-8')
+    index = lexical_index.load_lexical_index(directory, snapshot.line_store, snapshot.catalog)
+    assert not isinstance(index.doc_line, np.memmap)
+    assert not index.search(["유메나라바 도레호도 요캇타데쇼"], 1)[0]
@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from conftest import SONGS, make_snapshot
+from encoder import HashEmbedder
+from query_cache import MemoryBackend, QueryCache
+
+
+@pytest.fixture
+def cache(monkeypatch, snapshot):
+    cache = QueryCache(MemoryBackend(100, 3600))
+    monkeypatch.setattr(app_module, "search_snapshot", snapshot)
+    monkeypatch.setattr(app_module, "query_cache", cache)
+    monkeypatch.setattr(app_module.query_encoder, "model", HashEmbedder())
+    monkeypatch.setattr(app_module.startup, "ready", True)
+    return cache
+
+
+def test_payload_is_keyed_by_snapshot_version(cache, monkeypatch):
+    client = TestClient(app_module.app)
+    first = client.post("/text-search", data={"query_text": "夢ならばどれほどよかったでしょう"}).json()
+    assert first["song"]["songTitle"] == "Lemon"
+    assert cache.hits["payload"] == 0
+
+    # 캐시 generation 은 그대로인데 스냅샷만 바뀐 경우 (또는 그 반대) 이전 스냅샷의 결과를 돌려주지 않습니다.
+    renamed = [("Lemon (Live)",) + song[1:] if song[0] == "Lemon" else song for song in SONGS]
+    new_snapshot = make_snapshot(renamed)
+    new_snapshot.version = "v0002"
+    monkeypatch.setattr(app_module, "search_snapshot", new_snapshot)
+    second = client.post("/text-search", data={"query_text": "夢ならばどれほどよかったでしょう"}).json()
+    assert second["song"]["songTitle"] == "Lemon (Live)"
+    assert cache.hits["payload"] == 0
+
+    third = client.post("/text-search", data={"query_text": "夢ならばどれほどよかったでしょう"}).json()
+    assert third == second
+    assert cache.hits["payload"] == 1
+
+
+def test_search_settings_are_part_of_generation(monkeypatch):
+    import search
+    from query_cache import artifact_generation
+    assert any(setting.startswith("LINE_MATCH_WEIGHT=") for setting in app_module.query_cache.settings)
+    before = artifact_generation([], search.search_settings())
+    monkeypatch.setattr(search, "LEXICAL_MIN_SCORE", search.LEXICAL_MIN_SCORE + 1)
+    assert artifact_generation([], search.search_settings()) != before
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_artifact_change_keeps_embeddings(tmp_path, backend):
+    from query_cache import SQLiteBackend
+    artifact = tmp_path / "catalog.json"
+    artifact.write_text("v1")
+    store = MemoryBackend(100, 3600) if backend == "memory" else SQLiteBackend(str(tmp_path / "cache.sqlite3"), 100, 3600)
+    cache = QueryCache(store, [str(artifact)], check_interval=0, embedding_settings=["MODEL_NAME=a"])
+    cache.set_embedding("夜に駆ける", [1.0, 2.0])
+    cache.set("text", "夜に駆ける", {"song": None})
+
+    artifact.write_text("v2 (새 버전)")
+    assert cache.get("text", "夜に駆ける") is None
+    assert cache.get_embedding("夜に駆ける") == [1.0, 2.0]
+    assert len(store) == 1
+
+    other_model = QueryCache(store, [str(artifact)], embedding_settings=["MODEL_NAME=b"])
+    assert other_model.get_embedding("夜に駆ける") is None
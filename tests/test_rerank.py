@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from line_store import LineStore
+from rerank import LineMatches, rerank
+from search import search_batch_from_text, search_batch_from_audio, search_pipeline_from_text, search_pipeline_from_audio
+from encoder import BatchEncoder, HashEmbedder
+
+
+def unit_vectors(rng, n, dim=16, bias=0.0):
+    vectors = rng.standard_normal((n, dim)).astype('float32') + bias
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def random_store(rng, num_songs=40, dim=16, bias=0.0):
+    lengths = rng.integers(0, 30, size=num_songs)
+    lengths[:3] = (1, 0, 2)
+    song_idx = np.repeat(np.arange(num_songs), lengths)
+    return LineStore.from_lines([f"line {i}" for i in range(len(song_idx))], song_idx, unit_vectors(rng, len(song_idx), dim, bias))
+
+
+def brute_force(line_store, query, song_idx, window):
+    """(점수, 근거 라인). 라인이 없으면 (0, -1)."""
+    start, end = line_store.song_range(song_idx)
+    if start == end:
+        return 0.0, -1
+    similarities = line_store.embeddings[start:end].astype(np.float64) @ query.astype(np.float64)
+    if len(similarities) < window:
+        return similarities.mean(), start + int(similarities.argmax())
+    means = [similarities[p:p + window].mean() for p in range(len(similarities) - window + 1)]
+    p = int(np.argmax(means))
+    return means[p], start + p + int(similarities[p:p + window].argmax())
+
+
+@pytest.mark.parametrize("window", [1, 2, 3])
+def test_line_matches_against_brute_force(window):
+    rng = np.random.default_rng(window)
+    line_store = random_store(rng)
+    queries = unit_vectors(rng, 8)
+    candidates = [rng.choice(40, size=12, replace=False).tolist() for _ in queries]
+    matches = LineMatches(line_store, queries, candidates, window)
+    for row, songs in enumerate(candidates):
+        expected = [brute_force(line_store, queries[row], song, window) for song in songs]
+        np.testing.assert_allclose(matches.scores(row, songs), [score for score, _ in expected], rtol=1e-5, atol=1e-6)
+        assert [matches.best_line(row, song) for song in songs] == [line for _, line in expected]
+        # 후보 밖의 곡은 따로 계산하고 점수는 0 입니다.
+        outside = next(song for song in range(40) if song not in songs)
+        assert matches.best_line(row, outside) == brute_force(line_store, queries[row], outside, window)[1]
+        assert matches.scores(row, [outside])[0] == 0
+
+
+def test_line_matches_do_not_depend_on_batch():
+    """/batch-search 와 /text-search 가 같은 결과를 내려면 점수가 배치 구성에 따라 달라지지 않아야 합니다.
+    (행렬곱 자체의 float32 반올림 차이는 FAISS 의 배치 / 단건 검색과 같은 수준이라 허용합니다.)"""
+    rng = np.random.default_rng(0)
+    # 실제 데이터처럼 유사도가 대부분 양수라 배치 전체 누적합이 수천까지 커지는 경우
+    line_store = random_store(rng, num_songs=200, bias=1.0)
+    queries = unit_vectors(rng, 256, bias=1.0)
+    candidates = [rng.choice(200, size=20, replace=False).tolist() for _ in queries]
+    batch = LineMatches(line_store, queries, candidates)
+    for row in (0, 17, 255):
+        single = LineMatches(line_store, queries[row:row + 1], candidates[row:row + 1])
+        np.testing.assert_allclose(batch.scores(row, candidates[row]), single.scores(0, candidates[row]), rtol=0, atol=1e-6)
+        assert [batch.best_line(row, song) for song in candidates[row]] == [single.best_line(0, song) for song in candidates[row]]
+
+
+def test_rerank_keeps_order_on_ties():
+    rng = np.random.default_rng(1)
+    line_store = random_store(rng)
+    matches = LineMatches(line_store, unit_vectors(rng, 1), [[]])
+    candidates = [(5, 0.5, 1), (6, 0.5, 1), (7, 0.4, 2)]
+    assert rerank(candidates, matches, 0) == candidates
+
+
+@pytest.mark.parametrize("single, batch", [(search_pipeline_from_text, search_batch_from_text),
+                                           (search_pipeline_from_audio, search_batch_from_audio)])
+def test_batch_search_matches_single_queries(snapshot, single, batch):
+    queries = ["そう君といれば", "夜に駆ける", "風が吹いている", "夢ならばどれほどよかったでしょう", "麦わらの帽子"]
+    vectors = BatchEncoder(HashEmbedder()).encode_now(queries)
+    assert batch(snapshot, queries, vectors) == [single(snapshot, query, vectors[i:i + 1]) for i, query in enumerate(queries)]
@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from encoder import HashEmbedder
+from conftest import wav_bytes
+
+
+@pytest.fixture
+def client(monkeypatch, snapshot):
+    monkeypatch.setenv("STT_BACKEND", "stub")
+    monkeypatch.setenv("STT_STUB_TEXT", "そう君といれば Everything is better")
+    app_module.get_stt_backend.cache_clear()
+    monkeypatch.setattr(app_module, "search_snapshot", snapshot)
+    monkeypatch.setattr(app_module, "query_cache", None)
+    monkeypatch.setattr(app_module.query_encoder, "model", HashEmbedder())
+    monkeypatch.setattr(app_module.startup, "ready", True)
+    # with 문 없이 만들어 startup 이벤트 (모델 로드 스레드) 를 실행하지 않습니다.
+    yield TestClient(app_module.app)
+    app_module.get_stt_backend.cache_clear()
+
+
+def test_stt_with_stub_backend(client):
+    response = client.post("/stt", files={"audio_file": ("clip.wav", wav_bytes(6.0), "audio/wav")})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["song"]["songTitle"] == "そう君といれば"
+    assert body["song"]["userQuery"] == "そう君といれば Everything is better"
+    assert body["lyrics"] in ("そう君といれば", "Everything is better")
+    assert all(song["songId"] != body["song"]["songId"] for song in body["recommendations"])
+
+
+def test_stt_rejects_short_audio(client):
+    response = client.post("/stt", files={"audio_file": ("clip.wav", wav_bytes(2.0), "audio/wav")})
+    assert response.status_code == 400
+
+
+def test_backend_must_implement_transcribe():
+    from stt import STTBackend
+    with pytest.raises(TypeError):
+        STTBackend()